@@ -0,0 +1,122 @@
+"""
+Motor de reglas de alerta por tipología.
+
+Cada regla es declarativa (métrica, operador, umbral) y se lee de alert_rules.json; si el
+archivo no existe se usa la regla histórica (tipología con 20% o más vendido). Las métricas
+de todas las tipologías se calculan juntas con NumPy y cada regla se evalúa sobre el arreglo
+completo. Una tipología está en alerta si dispara al menos una regla, y sus unidades
+disponibles se muestran como "alerta-subir".
+"""
+import json
+from collections import namedtuple
+
+import numpy as np
+
+# Métricas por tipología sobre las que se pueden escribir reglas
+ALERT_METRICS = (
+    'porcentaje_vendido',        # unidades vendidas / total * 100
+    'velocidad_vs_mercado',      # velocidad de venta / velocidad del mercado (mismos dormitorios)
+    'proformas_por_disponible',  # proformas de las unidades disponibles / unidades disponibles
+    'precio_vs_mercado',         # precio de lista por m² en soles / precio por m² del mercado
+)
+ALERT_OPERATORS = {
+    '>=': np.greater_equal,
+    '>': np.greater,
+    '<=': np.less_equal,
+    '<': np.less,
+}
+
+AlertRule = namedtuple('AlertRule', ['id', 'metrica', 'operador', 'umbral', 'etiqueta'])
+
+DEFAULT_ALERT_RULES = (
+    AlertRule('vendido_20', 'porcentaje_vendido', '>=', 20.0, '≥ 20% vendido'),
+)
+
+
+def parse_alert_rules(raw_rules):
+    """
+    Valida una lista de reglas en formato JSON ({"id", "metrica", "operador", "umbral",
+    "etiqueta", "activa"}) y retorna las activas como AlertRule.
+    """
+    rules = []
+    for raw in raw_rules:
+        if not raw.get('activa', True):
+            continue
+        if raw.get('metrica') not in ALERT_METRICS:
+            raise ValueError(f"Métrica de alerta desconocida: {raw.get('metrica')}")
+        if raw.get('operador') not in ALERT_OPERATORS:
+            raise ValueError(f"Operador de alerta desconocido: {raw.get('operador')}")
+        rules.append(AlertRule(
+            raw['id'], raw['metrica'], raw['operador'], float(raw['umbral']), raw.get('etiqueta') or raw['id']
+        ))
+    return tuple(rules)
+
+
+def load_alert_rules(path):
+    """Lee las reglas de `path`; si el archivo no existe retorna DEFAULT_ALERT_RULES."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw_rules = json.load(f)
+    except FileNotFoundError:
+        return DEFAULT_ALERT_RULES
+    return parse_alert_rules(raw_rules.get('reglas', []) if isinstance(raw_rules, dict) else raw_rules)
+
+
+def _ratio(numerador, denominador):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominador > 0, numerador / np.where(denominador > 0, denominador, 1), np.nan)
+
+
+def compute_tipologia_metrics(tipologia_idx, n_tipologias, vendido, disponible, proformas, precio_m2,
+                              velocidad, velocidad_mercado, precio_mercado, tipo_cambio):
+    """
+    Calcula las métricas de ALERT_METRICS para n_tipologias en una sola pasada.
+
+    Los arreglos por unidad (tipologia_idx, vendido, disponible, proformas, precio_m2) se agregan
+    con np.bincount; velocidad, velocidad_mercado y precio_mercado ya vienen por tipología
+    (NaN si no hay dato de mercado). Retorna {metrica: arreglo de largo n_tipologias}.
+    """
+    tipologia_idx = np.asarray(tipologia_idx, dtype=np.intp)
+    vendido = np.asarray(vendido, dtype=float)
+    disponible = np.asarray(disponible, dtype=float)
+    proformas = np.asarray(proformas, dtype=float)
+    precio_m2 = np.asarray(precio_m2, dtype=float)
+
+    def por_tipologia(weights=None):
+        return np.bincount(tipologia_idx, weights=weights, minlength=n_tipologias)
+
+    total = por_tipologia()
+    disponibles = por_tipologia(disponible)
+    con_precio = disponible * (precio_m2 > 0)
+
+    return {
+        'porcentaje_vendido': _ratio(por_tipologia(vendido), total) * 100,
+        'velocidad_vs_mercado': _ratio(np.asarray(velocidad, dtype=float), np.asarray(velocidad_mercado, dtype=float)),
+        'proformas_por_disponible': _ratio(por_tipologia(proformas * disponible), disponibles),
+        'precio_vs_mercado': _ratio(
+            _ratio(por_tipologia(precio_m2 * con_precio), por_tipologia(con_precio)) * tipo_cambio,
+            np.asarray(precio_mercado, dtype=float)
+        ),
+    }
+
+
+def evaluate_rules(rules, metrics):
+    """
+    Evalúa todas las reglas sobre las métricas por tipología. Retorna una matriz booleana
+    (reglas x tipologías); una métrica sin dato (NaN) nunca dispara la regla.
+    """
+    n_tipologias = len(next(iter(metrics.values()))) if metrics else 0
+    fired = np.zeros((len(rules), n_tipologias), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for i, rule in enumerate(rules):
+            fired[i] = ALERT_OPERATORS[rule.operador](metrics[rule.metrica], rule.umbral)
+    return fired
+
+
+def triggers_by_tipologia(rules, tipologias, metrics):
+    """Etiquetas de las reglas disparadas por cada tipología: {tipologia: (etiqueta, ...)}."""
+    fired = evaluate_rules(rules, metrics)
+    return {
+        tipologia: tuple(rule.etiqueta for rule, hit in zip(rules, fired[:, j]) if hit)
+        for j, tipologia in enumerate(tipologias)
+    }
@@ -0,0 +1,187 @@
+"""
+Backend analítico opcional (DuckDB) para las agregaciones del dashboard.
+
+Con ANALYTICS_BACKEND=duckdb los resúmenes que alimentan el evolutivo mensual, las barras por
+dormitorio y el resumen por tipología, más las métricas de competencia de Tb_utf8.csv, se
+calculan como SQL columnar en DuckDB: la base SQLite del inquilino se adjunta en solo lectura
+(extensión sqlite de DuckDB) y el CSV de mercado se lee con read_csv, sin pasar fila por fila
+por Python ni por pandas. Cada función retorna exactamente la misma estructura que el cálculo
+en Python de app.py, que sigue siendo el backend por defecto.
+
+DuckDB es opcional (pip install duckdb): si no está instalado la app usa el backend Python.
+La paridad entre ambos backends se verifica con analytics_parity.py (y tests/test_analytics_parity.py).
+"""
+import importlib.util
+from pathlib import Path
+
+# Precio por m² de una unidad vendida: el registrado o, si no hay, precio de venta / área
+_PRECIO_M2_VENDIDA = """
+    CASE WHEN precio_m2 > 0 THEN precio_m2
+         WHEN coalesce(area_techada, 0) > 0 AND coalesce(precio_venta, 0) > 0 THEN precio_venta / area_techada
+    END
+"""
+
+
+def duckdb_available():
+    """DuckDB es opcional: solo se importa al consultar."""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def connect(db_path):
+    """Conexión DuckDB en memoria con la base SQLite adjunta en solo lectura como 'db'."""
+    import duckdb
+
+    con = duckdb.connect()
+    ruta = str(Path(db_path).resolve()).replace("'", "''")
+    con.execute(f"ATTACH '{ruta}' AS db (TYPE SQLITE, READ_ONLY)")
+    return con
+
+
+def tipologia_summary(con, project_name):
+    """
+    Resumen por tipología: {tipologia: {'total', 'sold_count', 'precio_m2_sum', 'precio_m2_count'}},
+    con el precio por m² sumado solo sobre las unidades vendidas.
+    """
+    rows = con.execute(f"""
+        SELECT tipologia, count(*), count(*) FILTER (WHERE vendido),
+               sum(precio_m2) FILTER (WHERE vendido), count(precio_m2) FILTER (WHERE vendido)
+        FROM (
+            SELECT coalesce(nombre_tipologia, '') AS tipologia,
+                   lower(coalesce(estado_comercial, '')) = 'vendido' AS vendido,
+                   {_PRECIO_M2_VENDIDA} AS precio_m2
+            FROM db.unidades WHERE nombre_proyecto = $proyecto
+        )
+        GROUP BY tipologia
+    """, {'proyecto': project_name}).fetchall()
+    return {
+        tipologia: {'total': total, 'sold_count': vendidas, 'precio_m2_sum': suma or 0, 'precio_m2_count': n}
+        for tipologia, total, vendidas, suma, n in rows
+    }
+
+
+def dorm_summary(con, project_name, alert_codes):
+    """
+    Resumen por cantidad de dormitorios (> 0): {dormitorios: {'sold_sum', 'sold_count',
+    'available_sum', 'available_count', 'alert_sum', 'alert_count'}}. Las vendidas suman precio
+    de venta; las de `alert_codes` y las demás (separadas incluidas), precio de lista.
+    """
+    rows = con.execute("""
+        SELECT dormitorios,
+               sum(coalesce(precio_venta, 0)) FILTER (WHERE clase = 'sold'), count(*) FILTER (WHERE clase = 'sold'),
+               sum(coalesce(precio_lista, 0)) FILTER (WHERE clase = 'available'),
+               count(*) FILTER (WHERE clase = 'available'),
+               sum(coalesce(precio_lista, 0)) FILTER (WHERE clase = 'alert'), count(*) FILTER (WHERE clase = 'alert')
+        FROM (
+            SELECT trunc(TRY_CAST(dormitorios AS DOUBLE))::BIGINT AS dormitorios, precio_venta, precio_lista,
+                   CASE WHEN lower(coalesce(estado_comercial, '')) = 'vendido' THEN 'sold'
+                        WHEN list_contains($alertas::VARCHAR[], codigo) THEN 'alert'
+                        ELSE 'available' END AS clase
+            FROM db.unidades WHERE nombre_proyecto = $proyecto
+        )
+        WHERE dormitorios > 0
+        GROUP BY dormitorios
+    """, {'proyecto': project_name, 'alertas': list(alert_codes)}).fetchall()
+    return {
+        int(dormitorios): {
+            'sold_sum': sold_sum or 0, 'sold_count': sold_count,
+            'available_sum': available_sum or 0, 'available_count': available_count,
+            'alert_sum': alert_sum or 0, 'alert_count': alert_count,
+        }
+        for dormitorios, sold_sum, sold_count, available_sum, available_count, alert_sum, alert_count in rows
+    }
+
+
+def monthly_summary(con, project_name, default_rate):
+    """
+    Resumen mensual (YYYY-MM) de las ventas con fecha válida: {mes: {'units', 'ticket_sum',
+    'ticket_pen_sum', 'ticket_count', 'price_m2_sum', 'price_m2_pen_sum', 'price_m2_count'}}.
+    El tipo de cambio de cada venta es el último publicado en o antes de su fecha (ASOF JOIN);
+    antes de la primera tasa se usa la primera y sin tasas, `default_rate` (como fx.py). Las
+    fechas se leen como texto: la extensión sqlite tipa como DATE las columnas declaradas así.
+    """
+    rows = con.execute("""
+        WITH tasas AS (
+            SELECT TRY_CAST(substr(fecha::VARCHAR, 1, 10) AS DATE) AS fecha, tasa
+            FROM db.tipo_cambio
+            WHERE TRY_CAST(substr(fecha::VARCHAR, 1, 10) AS DATE) IS NOT NULL AND tasa > 0
+        ),
+        vendidas AS (
+            SELECT TRY_STRPTIME(fecha_venta::VARCHAR, '%Y-%m-%d')::DATE AS fecha,
+                   coalesce(precio_venta, 0) AS precio_venta,
+                   CASE WHEN precio_m2 > 0 THEN precio_m2
+                        WHEN coalesce(area_techada, 0) <> 0 THEN coalesce(precio_venta, 0) / area_techada
+                   END AS precio_m2
+            FROM db.unidades
+            WHERE nombre_proyecto = $proyecto AND lower(coalesce(estado_comercial, '')) = 'vendido'
+        ),
+        con_tasa AS (
+            SELECT v.fecha, v.precio_venta, v.precio_m2,
+                   coalesce(t.tasa, (SELECT tasa FROM tasas ORDER BY fecha LIMIT 1), $default_rate) AS tasa
+            FROM vendidas v ASOF LEFT JOIN tasas t ON v.fecha >= t.fecha
+            WHERE v.fecha IS NOT NULL
+        )
+        SELECT strftime(fecha, '%Y-%m') AS mes, count(*),
+               sum(precio_venta) FILTER (WHERE precio_venta > 0),
+               sum(precio_venta * tasa) FILTER (WHERE precio_venta > 0),
+               count(*) FILTER (WHERE precio_venta > 0),
+               sum(precio_m2), sum(precio_m2 * tasa), count(precio_m2)
+        FROM con_tasa
+        GROUP BY mes
+    """, {'proyecto': project_name, 'default_rate': default_rate}).fetchall()
+    return {
+        mes: {
+            'units': units, 'ticket_sum': ticket_sum or 0, 'ticket_pen_sum': ticket_pen_sum or 0,
+            'ticket_count': ticket_count, 'price_m2_sum': price_m2_sum or 0,
+            'price_m2_pen_sum': price_m2_pen_sum or 0, 'price_m2_count': price_m2_count,
+        }
+        for mes, units, ticket_sum, ticket_pen_sum, ticket_count, price_m2_sum, price_m2_pen_sum, price_m2_count
+        in rows
+    }
+
+
+def competencia_metrics(csv_path):
+    """
+    Métricas de mercado por dormitorios sobre Tb_utf8.csv, con los mismos filtros y limpieza
+    que el cálculo con pandas (ventas de Lima Top 2024-2025 con precio, fechas y dormitorios
+    válidos): {dormitorios: {'precio_promedio', 'velocidad_promedio', 'muestras'}}.
+    """
+    import duckdb
+
+    con = duckdb.connect()
+    try:
+        origen = "read_csv('" + str(csv_path).replace("'", "''") + "', header = true, all_varchar = true)"
+        descripcion = con.execute(f"SELECT * FROM {origen} LIMIT 0").description
+        columnas = {d[0].strip(): '"' + d[0].replace('"', '""') + '"' for d in descripcion}
+        requeridas = ('Precio por m2 - Venta Solarizado', 'Estado de Inmueble', 'Sector', 'Fecha de Venta',
+                      'Fecha de Inicio de Venta', 'Cantidad de Dormitorios')
+        if not all(c in columnas for c in requeridas):
+            return {}
+        precio, estado, sector, venta, inicio, dormitorios = (columnas[c] for c in requeridas)
+        rows = con.execute(f"""
+            WITH ventas AS (
+                SELECT TRY_CAST(replace(regexp_replace({precio}, '[^\\d\\.,-]', '', 'g'), ',', '') AS DOUBLE) AS precio_m2,
+                       round_even(TRY_CAST({dormitorios} AS DOUBLE), 0) AS dormitorios,
+                       TRY_CAST({venta} AS TIMESTAMP) AS venta,
+                       TRY_CAST({inicio} AS TIMESTAMP) AS inicio
+                FROM {origen}
+                WHERE lower(trim({estado})) = 'vendido' AND lower(trim({sector})) = 'lima top'
+            )
+            SELECT dormitorios::BIGINT, avg(precio_m2), avg(1.0 / meses), count(*)
+            FROM (
+                SELECT *, greatest(
+                    (year(venta) - year(inicio)) * 12 + (month(venta) - month(inicio))
+                    - CASE WHEN day(venta) < day(inicio) THEN 1 ELSE 0 END, 1
+                ) AS meses
+                FROM ventas
+                WHERE year(venta) IN (2024, 2025) AND precio_m2 IS NOT NULL AND dormitorios IS NOT NULL
+                  AND inicio IS NOT NULL AND dormitorios > 0
+            )
+            GROUP BY dormitorios
+            ORDER BY dormitorios
+        """).fetchall()
+    finally:
+        con.close()
+    return {
+        int(dorm): {'precio_promedio': float(p), 'velocidad_promedio': float(v), 'muestras': int(n)}
+        for dorm, p, v, n in rows
+    }
@@ -0,0 +1,94 @@
+"""
+Verificación de paridad entre los backends analíticos del dashboard (ver analytics.py).
+
+Construye el contexto del dashboard de cada proyecto con ANALYTICS_BACKEND=python y con
+ANALYTICS_BACKEND=duckdb sobre la misma base, además de las métricas de competencia, y
+compara ambos resultados valor por valor. Los enteros y textos deben ser idénticos; los
+flotantes, iguales salvo el último bit (las sumas en DuckDB pueden acumular en otro orden).
+Termina con código 1 si hay diferencias y con código 2 si duckdb no está instalado o falló
+(la app pasa entonces al backend Python y la comparación no tendría sentido).
+
+Uso:
+    python analytics_parity.py [--tenant llosa] [--proyecto STILL --proyecto COSMOS]
+"""
+import argparse
+import math
+import sys
+
+REL_TOL = 1e-9
+
+
+def compare(python_value, duckdb_value, path=''):
+    """Lista de diferencias [(ruta, valor python, valor duckdb)] entre dos estructuras."""
+    if isinstance(python_value, dict) and isinstance(duckdb_value, dict):
+        diffs = []
+        for key in sorted(set(python_value) | set(duckdb_value), key=str):
+            diffs += compare(python_value.get(key), duckdb_value.get(key), f"{path}.{key}")
+        return diffs
+    if isinstance(python_value, (list, tuple)) and isinstance(duckdb_value, (list, tuple)):
+        if len(python_value) != len(duckdb_value):
+            return [(f"{path} (largo)", len(python_value), len(duckdb_value))]
+        diffs = []
+        for i, (a, b) in enumerate(zip(python_value, duckdb_value)):
+            diffs += compare(a, b, f"{path}[{i}]")
+        return diffs
+    if isinstance(python_value, float) or isinstance(duckdb_value, float):
+        if isinstance(python_value, (int, float)) and isinstance(duckdb_value, (int, float)) and \
+                math.isclose(python_value, duckdb_value, rel_tol=REL_TOL, abs_tol=REL_TOL):
+            return []
+        return [(path, python_value, duckdb_value)]
+    return [] if python_value == duckdb_value else [(path, python_value, duckdb_value)]
+
+
+def competencia_metrics(webapp, backend):
+    webapp.ANALYTICS_BACKEND = backend
+    return webapp.load_competencia_metrics()
+
+
+def dashboard_context(webapp, project_name, backend):
+    webapp.ANALYTICS_BACKEND = backend
+    context = webapp.build_dashboard_context(project_name)
+    # Las filas de proyectos (sqlite3.Row) y el pronóstico no dependen del backend
+    return {k: v for k, v in context.items() if k not in ('all_projects', 'forecast')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el dashboard calculado con Python y con DuckDB.")
+    parser.add_argument("--tenant", help="Inquilino de tenants.json (por defecto, el inquilino por defecto).")
+    parser.add_argument("--proyecto", action="append", help="Proyecto a comparar (por defecto, todos).")
+    args = parser.parse_args()
+
+    import app as webapp
+    from analytics import duckdb_available
+
+    if not duckdb_available():
+        print("duckdb no está instalado (pip install duckdb): no hay backend que comparar.")
+        sys.exit(2)
+
+    failures = 0
+    with webapp.app.test_request_context():
+        webapp.set_current_tenant(args.tenant)
+        conn = webapp.get_db_connection()
+        projects = args.proyecto or [
+            row[0] for row in conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto")
+        ]
+        conn.close()
+
+        checks = [('competencia', lambda backend: competencia_metrics(webapp, backend))]
+        checks += [(project, lambda backend, p=project: dashboard_context(webapp, p, backend)) for project in projects]
+        for name, build in checks:
+            diffs = compare(build('python'), build('duckdb'))
+            failures += bool(diffs)
+            print(f"{'OK     ' if not diffs else 'DIFIERE'} {name}")
+            for path, python_value, duckdb_value in diffs[:20]:
+                print(f"    {path}: python={python_value!r} duckdb={duckdb_value!r}")
+            if webapp._duckdb_error is not None:
+                print(f"DuckDB falló y la app usó el backend Python: {webapp._duckdb_error}")
+                sys.exit(2)
+
+    print(f"{len(checks) - failures}/{len(checks)} resultados idénticos.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,100 @@
-import csv
+import contextvars
+import gzip
+import hashlib
+import hmac
+import json
+import math
+import mimetypes
+import os
+import re
 import sqlite3
+import tempfile
+import threading
 import random
-from collections import defaultdict, Counter
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from collections import defaultdict
 from datetime import datetime, date
-from functools import lru_cache
+from functools import lru_cache, wraps
 from pathlib import Path
 
-import pandas as pd
-from flask import Flask, render_template, request, redirect, url_for
+from flask import (
+    Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, send_from_directory, g
+)
+
+from exports import (
+    EXPORT_TABLES, EXPORT_FORMATS, iter_table_rows, iter_csv, iter_xlsx, write_export_file, xlsx_available
+)
+from db_lock import DBLockTimeout, db_write_lock
+from novedades import NOVEDADES_CARGAS_MAX, UNIDADES_COLUMNAS, summarize_changes, unit_hash
+from singleflight import SingleFlight
+from sized_cache import SizedLRUCache
+from tenants import DEFAULT_CACHE_MB, TENANTS_FILE, Tenant, load_tenants, tenant_for_host, tenant_path
+
+# pandas y NumPy (usados por comparables, forecast y fx) se importan dentro de las funciones
+# que los necesitan, para que los workers arranquen sin pagar esa importación.
 
 # --- 1. INICIALIZACIÓN DE LA APLICACIÓN ---
 app = Flask(__name__)
 
-# Cache para max_columns por proyecto
+# Cache para max_columns por (inquilino, proyecto)
 project_max_columns = {}
+# Nombre de la base dentro del directorio de datos de cada inquilino (ver tenants.json)
 DB_NAME = "database.db"
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_EXCHANGE_RATE_PEN = 3.8
+EXPORT_DIR = BASE_DIR / 'exports'
+# Filas que la exportación de la parrilla lee del cursor por vez
+EXPORT_FETCH_ROWS = 1000
+# Procesos dedicados a las exportaciones masivas, separados de los workers interactivos
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '2'))
+_export_executor = None
+# Los estáticos con hash de contenido en la URL (?v=...) se cachean por un año
+STATIC_CACHE_MAX_AGE = 31536000
+# Tamaño mínimo de una respuesta HTML/JSON para comprimirla al vuelo
+COMPRESS_MIN_BYTES = 2048
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/csv'}
+# Server-sent events: cada conexión revisa la versión de datos cada SSE_POLL_SECONDS y se cierra
+# tras SSE_STREAM_SECONDS (el navegador reconecta solo) para no retener un worker indefinidamente
+SSE_POLL_SECONDS = float(os.getenv('SSE_POLL_SECONDS', '2'))
+SSE_STREAM_SECONDS = float(os.getenv('SSE_STREAM_SECONDS', '55'))
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+# Cálculos en curso compartidos entre peticiones idénticas simultáneas (ver get_pricing_context)
+_inflight = SingleFlight()
+# Reglas declarativas de alerta (ver alerts.py); si el archivo no existe se usa la regla del 20% vendido
+ALERT_RULES_FILE = BASE_DIR / os.getenv('ALERT_RULES_FILE', 'alert_rules.json')
+ESTADOS_NO_DISPONIBLES = ('vendido', 'separado', 'proceso de separacion')
+# Pisos por página de la parrilla; el resto se carga al hacer scroll (0 = todos en una respuesta)
+GRID_PAGE_FLOORS = int(os.getenv('GRID_PAGE_FLOORS', '20'))
+# Los fragmentos de pisos con la versión de datos en la URL (?v=...) se cachean en el navegador
+GRID_FRAGMENT_MAX_AGE = 3600
+# Escritura de precios aprobados (POST /update-price/<nivel>): campos clave y precio por nivel
+PRICE_UPDATE_FIELDS = {'unidad': ('codigo', 'precio_lista'), 'tipologia': ('tipologia', 'precio_promedio')}
+PRICE_UPDATE_MAX_CHANGES = 500
+# Espera máxima por el bloqueo de escritura de la base (init_db.py lo toma mientras reemplaza la base)
+PRICE_UPDATE_LOCK_SECONDS = float(os.getenv('PRICE_UPDATE_LOCK_SECONDS', '30'))
+# Cachés que dependen de los precios de lista de un proyecto: se descartan al actualizarlos
+PRICE_DEPENDENT_CACHES = {
+    '_alert_evaluation_cached', '_sales_forecast_cached', '_grid_fragments_cached', '_unit_filter_index_cached'
+}
+# Paquetes portables por proyecto (ver bundles.py): BUNDLE_FILE monta uno en modo sin conexión
+BUNDLE_FILE = os.getenv('BUNDLE_FILE', '')
+BUNDLE_CACHE_DIR = BASE_DIR / 'bundles'
+BUNDLE_MMAP_BYTES = 256 * 1024 * 1024
+GRID_VIEWS = ('precio', 'codigo', 'precio_m2', 'proformas', 'area_total')
+# Backend de las agregaciones del dashboard y de mercado: 'python' (por defecto) o 'duckdb' (opcional,
+# ver analytics.py); sin duckdb instalado se usa siempre 'python'
+ANALYTICS_BACKEND = os.getenv('ANALYTICS_BACKEND', 'python').strip().lower()
+# Perfilado bajo demanda de la parrilla y el dashboard (ver profiling.py): se activa con la cabecera
+# X-Profile-Token igual a PROFILE_TOKEN o para una fracción PROFILE_SAMPLE_RATE de las peticiones
+PROFILE_DIR = BASE_DIR / 'logs' / 'profiles'
+PROFILE_ENDPOINTS = {'pricing', 'dashboard'}
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
 
 def safe_get(row, key, default=None):
     """Función auxiliar para obtener valores de sqlite3.Row de manera segura"""
@@ -26,9 +104,208 @@ def safe_get(row, key, default=None):
     except (KeyError, IndexError):
         return default
 
+# --- INQUILINOS ---
+# Cada petición se atiende con los datos y la caché del inquilino que corresponde a su host
+_current_tenant_id = contextvars.ContextVar('tenant_id', default=None)
+_tenant_caches = {}
+_tenant_caches_lock = threading.Lock()
+_MISSING = object()
+
+
+def tenants_file_version():
+    """Versión de tenants.json (mtime); 0 si no existe."""
+    try:
+        return TENANTS_FILE.stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+@lru_cache(maxsize=1)
+def _tenants_cached(file_version):
+    return load_tenants(TENANTS_FILE)
+
+
+@lru_cache(maxsize=1)
+def _mounted_bundle(bundle_file):
+    from bundles import extract_bundle, load_cache_entries
+
+    directorio, manifest = extract_bundle(bundle_file, BUNDLE_CACHE_DIR)
+    tenant = Tenant(
+        id='bundle', nombre=f"{manifest['proyecto']} (sin conexión)", schema='', directorio=str(directorio),
+        proyectos_validos=(), fechas_inicio={}, hosts=(), cache_bytes=DEFAULT_CACHE_MB * 1024 * 1024,
+        solo_lectura=True,
+    )
+    cache = get_tenant_cache(tenant)
+    try:
+        entries = load_cache_entries(directorio)
+    except (ValueError, OSError) as e:
+        # Sin entradas precalculadas la instancia calcula los agregados a pedido
+        app.logger.warning("Paquete '%s' montado sin caché precalculada: %s", bundle_file, e)
+        entries = []
+    for key, value in entries:
+        cache.put(key, value)
+    return {tenant.id: tenant}, tenant.id
+
+
+def get_tenants():
+    """
+    ({id: Tenant}, id por defecto) según tenants.json, releído cuando cambia el archivo. Con
+    BUNDLE_FILE, el único inquilino es el paquete montado (solo lectura, ver bundles.py).
+    """
+    if BUNDLE_FILE:
+        return _mounted_bundle(BUNDLE_FILE)
+    return _tenants_cached(tenants_file_version())
+
+
+def get_current_tenant():
+    """Inquilino de la petición en curso (o el fijado con set_current_tenant); si no, el por defecto."""
+    tenants, default_id = get_tenants()
+    return tenants.get(_current_tenant_id.get() or default_id, tenants[default_id])
+
+
+def set_current_tenant(tenant_id):
+    _current_tenant_id.set(tenant_id)
+
+
+def get_db_path():
+    """Ruta de database.db del inquilino actual."""
+    return tenant_path(get_current_tenant(), DB_NAME)
+
+
+def get_tenant_cache(tenant=None):
+    """Caché del inquilino, con el presupuesto de memoria de su cache_mb."""
+    tenant = tenant or get_current_tenant()
+    with _tenant_caches_lock:
+        cache = _tenant_caches.get(tenant.id)
+        if cache is None or cache.budget_bytes != tenant.cache_bytes:
+            cache = _tenant_caches[tenant.id] = SizedLRUCache(tenant.cache_bytes)
+        return cache
+
+
+def tenant_cached(fn):
+    """
+    Equivalente a lru_cache, pero los resultados se guardan en la caché del inquilino actual,
+    que desaloja por tamaño estimado: un inquilino grande no desaloja los datos de los demás.
+    """
+    @wraps(fn)
+    def wrapper(*args):
+        cache = get_tenant_cache()
+        key = (fn.__name__,) + args
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = fn(*args)
+            cache.put(key, value)
+        return value
+    return wrapper
+
+
+def get_data_version():
+    """
+    Versión de los datos cargados: cambia cada vez que init_db.py reescribe la base. En una
+    consulta histórica incluye la fecha as_of y el proyecto reconstruido, para que las cachés
+    no mezclen estados.
+    """
+    try:
+        version = os.stat(get_db_path()).st_mtime_ns
+    except OSError:
+        version = 0
+    as_of = get_as_of()
+    return f"{version}@{as_of.isoformat()}/{_as_of_project.get() or ''}" if as_of else version
+
+
+# --- CONSULTAS HISTÓRICAS (as_of) ---
+# Fecha de la petición en curso para ver la parrilla y el dashboard como estaban ese día
+_as_of_date = contextvars.ContextVar('as_of', default=None)
+# Proyecto de la consulta histórica: solo sus unidades se reconstruyen a esa fecha
+_as_of_project = contextvars.ContextVar('as_of_project', default=None)
+AS_OF_ENDPOINTS = {'pricing', 'pricing_floors', 'dashboard'}
+
+
+def parse_as_of(value):
+    """Fecha as_of (YYYY-MM-DD) como date; None si falta, es inválida o no es anterior a hoy."""
+    try:
+        as_of = date.fromisoformat((value or '').strip())
+    except ValueError:
+        return None
+    return as_of if as_of < date.today() else None
+
+
+def get_as_of():
+    return _as_of_date.get()
+
+
+def set_as_of(as_of, project_name=None):
+    _as_of_date.set(as_of)
+    _as_of_project.set(project_name if as_of else None)
+
+
+def get_reference_date():
+    """Fecha de referencia de los cálculos ("hoy"): la fecha as_of en una consulta histórica."""
+    return get_as_of() or date.today()
+
+@tenant_cached
+def _exchange_rates_cached(data_version):
+    from fx import ExchangeRateTable
+
+    conn = get_db_connection()
+    rows = conn.execute("SELECT fecha, tasa FROM tipo_cambio").fetchall()
+    conn.close()
+    return ExchangeRateTable([r['fecha'] for r in rows], [r['tasa'] for r in rows], DEFAULT_EXCHANGE_RATE_PEN)
+
+
+def get_exchange_rates():
+    """Tabla de tipo de cambio por fecha cargada por init_db.py, cacheada por versión de datos."""
+    return _exchange_rates_cached(get_data_version())
+
+
+def get_exchange_rate_by_unit(units):
+    """
+    Tipo de cambio aplicable a cada unidad según su fecha de venta ({codigo: tasa}),
+    resuelto en una sola búsqueda vectorizada para todo el conjunto de unidades.
+    """
+    rates = get_exchange_rates().rates_for([safe_get(u, 'fecha_venta') for u in units])
+    return dict(zip((safe_get(u, 'codigo', '') for u in units), rates.tolist()))
+
+PROJECT_VERSION_COLUMNS = (
+    'nombre_proyecto, codigo, estado_comercial, precio_lista, precio_venta, fecha_venta, proformas_count'
+)
+
+
+@tenant_cached
+def _project_versions_cached(data_version):
+    conn = get_db_connection()
+    rows = conn.execute(f"SELECT {PROJECT_VERSION_COLUMNS} FROM unidades ORDER BY nombre_proyecto, codigo").fetchall()
+    conn.close()
+
+    digests = {}
+    for row in rows:
+        digest = digests.setdefault(row['nombre_proyecto'], hashlib.sha1())
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return {project: digest.hexdigest()[:16] for project, digest in digests.items()}
+
+
+def read_project_version(conn, project_name):
+    """Versión de un proyecto leída directamente de la conexión (mismo hash que get_project_version)."""
+    digest = hashlib.sha1()
+    rows = conn.execute(
+        f"SELECT {PROJECT_VERSION_COLUMNS} FROM unidades WHERE nombre_proyecto = ? ORDER BY codigo", (project_name,)
+    )
+    for row in rows:
+        digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def get_project_version(project_name):
+    """
+    Versión de los datos de un proyecto: hash de sus unidades, recalculado solo cuando cambia
+    la base. Permite avisar a los clientes únicamente cuando su proyecto cambió.
+    """
+    return _project_versions_cached(get_data_version()).get(project_name, '')
+
 def get_max_columns_for_project(project_name, units_from_db):
     """Obtiene el max_columns para un proyecto, usando cache si está disponible"""
-    if project_name not in project_max_columns:
+    cache_key = (get_current_tenant().id, project_name)
+    if cache_key not in project_max_columns:
         # Calcular max_columns basado en TODAS las unidades del proyecto
         grid_data_for_max_calc = {}
         for unit in units_from_db:
@@ -36,8 +313,8 @@ def get_max_columns_for_project(project_name, units_from_db):
             if piso not in grid_data_for_max_calc:
                 grid_data_for_max_calc[piso] = []
             grid_data_for_max_calc[piso].append(unit)
-        project_max_columns[project_name] = max(len(units) for units in grid_data_for_max_calc.values()) if grid_data_for_max_calc else 0
-    return project_max_columns[project_name]
+        project_max_columns[cache_key] = max(len(units) for units in grid_data_for_max_calc.values()) if grid_data_for_max_calc else 0
+    return project_max_columns[cache_key]
 
 def calculate_velocity(units_in_tipologia, project_name, conn):
     """Calcula la velocidad de venta para una tipología específica"""
@@ -84,10 +361,10 @@ def calculate_velocity(units_in_tipologia, project_name, conn):
             fecha_fin = max(fechas_venta)
         else:
             # Si no hay fechas de venta válidas, usar fecha actual
-            fecha_fin = date.today()
+            fecha_fin = get_reference_date()
     else:
         # Si no todas están vendidas, usar fecha actual
-        fecha_fin = date.today()
+        fecha_fin = get_reference_date()
     
     # Calcular meses transcurridos
     meses_transcurridos = (fecha_fin.year - fecha_inicio.year) * 12 + (fecha_fin.month - fecha_inicio.month)
@@ -115,41 +392,9 @@ def parse_int(value, default=0):
 def get_total_habitaciones_from_unit(unit, project_name=""):
     """
     Obtiene el número de dormitorios de una unidad.
-    Primero intenta usar el campo total_habitaciones. Si no existe o es 0,
-    recurre a un mapeo precargado desde el CSV original.
-    """
-    total_habitaciones = safe_get(unit, 'total_habitaciones')
-    if total_habitaciones not in (None, '', 'null'):
-        value = parse_int(total_habitaciones, default=0)
-        if 0 < value <= 6:
-            return value
-
-    # Intentar obtenerlo del CSV original usando el código de la unidad
-    codigo = (safe_get(unit, 'codigo', '') or '').strip()
-    project_key = (project_name or safe_get(unit, 'nombre_proyecto', '') or '').strip()
-    if codigo and project_key:
-        csv_map = load_total_habitaciones_map()
-        project_map = csv_map.get(project_key, {})
-        value = project_map.get(codigo)
-        if value and 0 < value <= 6:
-            return value
-
-    # Heurística basada en área techada
-    area_techada = safe_get(unit, 'area_techada', 0) or 0
-    if area_techada and area_techada > 0:
-        if area_techada <= 55:
-            return 1
-        if area_techada <= 95:
-            return 2
-        if area_techada <= 135:
-            return 3
-        if area_techada <= 170:
-            return 4
-        if area_techada <= 220:
-            return 5
-        return 6
-
-    return 0
+    init_db.py lo resuelve una sola vez en la carga (columna dormitorios); 0 si no se pudo inferir.
+    """
+    return parse_int(safe_get(unit, 'dormitorios'), default=0)
 
 
 def generate_month_sequence(start_date, end_date):
@@ -171,40 +416,10 @@ def generate_month_sequence(start_date, end_date):
     return sequence
 
 
-@lru_cache(maxsize=1)
-def load_total_habitaciones_map():
-    """
-    Carga un mapeo por proyecto {nombre_proyecto: {codigo_unidad: total_habitaciones}} desde unidades.csv.
-    Se cachea para evitar lecturas repetidas en disco.
-    """
-    mapping = defaultdict(dict)
-    csv_path = BASE_DIR / 'unidades.csv'
-    if not csv_path.exists():
-        return mapping
-
-    try:
-        with csv_path.open('r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                codigo = (row.get('codigo') or '').strip()
-                hab = row.get('total_habitaciones')
-                proyecto = (row.get('nombre_proyecto') or '').strip()
-                if not codigo or not hab or not proyecto:
-                    continue
-                try:
-                    value = int(float(hab))
-                except ValueError:
-                    continue
-                if 0 < value <= 6:
-                    mapping[proyecto][codigo] = value
-    except FileNotFoundError:
-        return defaultdict(dict)
-
-    return {project: dict(values) for project, values in mapping.items()}
-
-
 def _clean_numeric_series(series):
     """Convierte una serie de strings en números flotantes, limpiando símbolos y separadores."""
+    import pandas as pd
+
     if series is None:
         return pd.Series(dtype=float)
     cleaned = (
@@ -215,15 +430,37 @@ def _clean_numeric_series(series):
     return pd.to_numeric(cleaned, errors='coerce')
 
 
-@lru_cache(maxsize=1)
-def load_competencia_metrics():
+COMPETENCIA_CSV_NAME = 'Tb_utf8.csv'
+# Posibles nombres de la columna de área en el archivo de mercado
+COMPETENCIA_AREA_COLUMNS = ('Área Techada', 'Area Techada', 'Área Total', 'Area Total', 'Área', 'Area')
+
+
+def competencia_csv_path():
+    """Archivo de mercado del inquilino si tiene uno propio; si no, el compartido del proyecto."""
+    tenant_csv = Path(tenant_path(get_current_tenant(), COMPETENCIA_CSV_NAME))
+    return tenant_csv if tenant_csv.exists() else BASE_DIR / COMPETENCIA_CSV_NAME
+
+
+def competencia_file_version():
+    """Versión del archivo de competencia (mtime); 0 si no existe."""
+    try:
+        return competencia_csv_path().stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+@tenant_cached
+def _load_competencia_dataframe(file_version):
     """
-    Calcula métricas de competencia por cantidad de dormitorios basadas en Tb_utf8.csv.
-    Retorna un diccionario {dormitorios: {"precio_promedio": float, "velocidad_promedio": float, "muestras": int}}.
+    Lee Tb_utf8.csv y deja solo las ventas válidas de Lima Top 2024-2025, con precio por m²,
+    dormitorios normalizados, área (si existe) y velocidad por unidad.
+    Retorna None si el archivo no existe o no tiene las columnas requeridas.
     """
-    csv_path = BASE_DIR / 'Tb_utf8.csv'
-    if not csv_path.exists():
-        return {}
+    csv_path = competencia_csv_path()
+    if not file_version or not csv_path.exists():
+        return None
+
+    import pandas as pd
 
     try:
         df = pd.read_csv(
@@ -232,7 +469,7 @@ def load_competencia_metrics():
             parse_dates=['Fecha de Venta', 'Fecha de Inicio de Venta']
         )
     except Exception:
-        return {}
+        return None
 
     df.columns = [col.strip() for col in df.columns]
     required_cols = {
@@ -244,7 +481,7 @@ def load_competencia_metrics():
         'Cantidad de Dormitorios'
     }
     if not required_cols.issubset(df.columns):
-        return {}
+        return None
 
     df = df[
         (df['Estado de Inmueble'].astype(str).str.strip().str.lower() == 'vendido') &
@@ -253,21 +490,21 @@ def load_competencia_metrics():
     ].copy()
 
     if df.empty:
-        return {}
+        return None
 
     df['Precio por m2 - Venta Solarizado'] = _clean_numeric_series(df['Precio por m2 - Venta Solarizado'])
     df['Cantidad de Dormitorios'] = pd.to_numeric(df['Cantidad de Dormitorios'], errors='coerce')
     df = df.dropna(subset=['Precio por m2 - Venta Solarizado', 'Cantidad de Dormitorios', 'Fecha de Venta', 'Fecha de Inicio de Venta'])
 
     if df.empty:
-        return {}
+        return None
 
     # Normalizar dormitorios al entero más cercano positivo
     df['Cantidad de Dormitorios'] = df['Cantidad de Dormitorios'].round().astype(int)
     df = df[df['Cantidad de Dormitorios'] > 0]
 
     if df.empty:
-        return {}
+        return None
 
     # Calcular velocidad unidad
     meses = (df['Fecha de Venta'].dt.year - df['Fecha de Inicio de Venta'].dt.year) * 12 + (
@@ -280,6 +517,18 @@ def load_competencia_metrics():
     df['velocidad_unidad'] = 1 / meses
 
     if df.empty:
+        return None
+
+    area_col = next((col for col in COMPETENCIA_AREA_COLUMNS if col in df.columns), None)
+    df['area_comparable'] = _clean_numeric_series(df[area_col]) if area_col else float('nan')
+
+    return df.reset_index(drop=True)
+
+
+@tenant_cached
+def _competencia_metrics_cached(file_version):
+    df = _load_competencia_dataframe(file_version)
+    if df is None:
         return {}
 
     grouped = df.groupby('Cantidad de Dormitorios').agg(
@@ -298,278 +547,871 @@ def load_competencia_metrics():
     }
 
 
-def build_tipologia_dorm_map(tipologias_data_grouped, project_name):
-    """Determina el número de dormitorios predominante por tipología."""
-    dorm_map = {}
-    for tipologia, tip_units in tipologias_data_grouped.items():
-        dorm_counts = [
-            get_total_habitaciones_from_unit(u, project_name)
-            for u in tip_units
-        ]
-        dorm_counts = [d for d in dorm_counts if d and d > 0]
-        if dorm_counts:
-            dorm_map[tipologia] = Counter(dorm_counts).most_common(1)[0][0]
-            continue
+@tenant_cached
+def _competencia_metrics_duckdb_cached(file_version):
+    csv_path = competencia_csv_path()
+    if not file_version or not csv_path.exists():
+        return {}
 
-        # Fallback heurístico basado en área cuando no hay datos explícitos
-        areas = [
-            (safe_get(u, 'area_techada', 0) or 0)
-            for u in tip_units
-        ]
-        areas = [a for a in areas if a and a > 0]
-        if not areas:
-            dorm_map[tipologia] = None
-            continue
+    from analytics import competencia_metrics
 
-        avg_area = sum(areas) / len(areas)
-        if avg_area <= 55:
-            dorm_est = 1
-        elif avg_area <= 95:
-            dorm_est = 2
-        elif avg_area <= 135:
-            dorm_est = 3
-        elif avg_area <= 170:
-            dorm_est = 4
-        else:
-            dorm_est = 5
+    return competencia_metrics(csv_path)
 
-        dorm_map[tipologia] = dorm_est
-    return dorm_map
 
-# --- INICIO DE LA SOLUCIÓN ---
-@app.route('/')
-def index():
-    # Redirige al dashboard de un proyecto por defecto (ej. "STILL")
-    # Puedes cambiar "STILL" por cualquier otro de tus proyectos válidos.
-    return redirect(url_for('dashboard', project_name='STILL'))
-# --- FIN DE LA SOLUCIÓN ---
+def load_competencia_metrics():
+    """
+    Calcula métricas de competencia por cantidad de dormitorios basadas en Tb_utf8.csv.
+    Retorna un diccionario {dormitorios: {"precio_promedio": float, "velocidad_promedio": float, "muestras": int}}.
+    """
+    if get_analytics_backend() == 'duckdb':
+        import duckdb
 
-# --- 2. FILTRO DE MONEDA PERSONALIZADO ---
-@app.template_filter('currency')
-def format_currency(value):
-    if value is None: return "$0"
-    return f"${value:,.0f}"
+        try:
+            return _competencia_metrics_duckdb_cached(competencia_file_version())
+        except duckdb.Error as e:
+            disable_duckdb(e)
+    return _competencia_metrics_cached(competencia_file_version())
+
+
+@tenant_cached
+def _comparables_index_cached(file_version):
+    df = _load_competencia_dataframe(file_version)
+    if df is None:
+        return None, None
+
+    import pandas as pd
+    from comparables import ComparablesIndex
+
+    index = ComparablesIndex(
+        dormitorios=df['Cantidad de Dormitorios'].to_numpy(),
+        area=df['area_comparable'].to_numpy(dtype=float),
+        precio_m2=df['Precio por m2 - Venta Solarizado'].to_numpy(dtype=float),
+        fecha=df['Fecha de Venta'].map(pd.Timestamp.toordinal).to_numpy(dtype=float),
+        velocidad=df['velocidad_unidad'].to_numpy(dtype=float),
+    )
+    return index, df
 
 
-@app.template_filter('currency_pen')
-def format_currency_pen(value):
-    if value is None:
-        return ""
-    try:
-        if isinstance(value, float) and pd.isna(value):
-            return ""
-        return f"S/ {float(value):,.0f}"
-    except (ValueError, TypeError):
-        return ""
+def load_comparables_index():
+    """Índice de comparables de mercado, construido una vez por versión de Tb_utf8.csv."""
+    return _comparables_index_cached(competencia_file_version())
 
 
-@app.template_filter('velocity_fmt')
-def format_velocity(value):
-    if value is None:
-        return ""
-    try:
-        if isinstance(value, float) and pd.isna(value):
-            return ""
-        return f"{float(value):.2f} u/mes"
-    except (ValueError, TypeError):
-        return ""
+def find_comparables(project_name, k=10, nivel='tipologia'):
+    """
+    Retorna los k comparables de mercado más cercanos para cada unidad (nivel='unidad')
+    o tipología (nivel='tipologia') del proyecto, con su precio por m² y velocidad ponderados.
+    Todas las consultas del proyecto se resuelven en una sola llamada al índice.
+    """
+    index, df = load_comparables_index()
+    if index is None or not len(index):
+        return []
 
-# --- SE ELIMINA EL DICCIONARIO layout_overview_data ---
+    conn = get_db_connection()
+    units = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+    conn.close()
+    if not units:
+        return []
 
-# --- 4. FUNCIÓN AUXILIAR PARA LA BASE DE DATOS ---
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    today_ordinal = date.today().toordinal()
+    points = []
+    if nivel == 'unidad':
+        for unit in units:
+            fecha = today_ordinal
+            try:
+                fecha = datetime.strptime(safe_get(unit, 'fecha_venta', ''), '%Y-%m-%d').toordinal()
+            except (ValueError, TypeError):
+                pass
+            points.append({
+                'codigo': safe_get(unit, 'codigo', ''),
+                'tipologia': safe_get(unit, 'nombre_tipologia', ''),
+                'dormitorios': get_total_habitaciones_from_unit(unit, project_name),
+                'area': safe_get(unit, 'area_techada', 0) or float('nan'),
+                'precio_m2': safe_get(unit, 'precio_m2', 0) or float('nan'),
+                'fecha': fecha,
+            })
+    else:
+        grouped = defaultdict(list)
+        for unit in units:
+            grouped[safe_get(unit, 'nombre_tipologia', '')].append(unit)
+        dorm_map = get_tipologia_dorm_map(project_name)
+        for tipologia, tip_units in sorted(grouped.items()):
+            areas = [a for a in (safe_get(u, 'area_techada', 0) or 0 for u in tip_units) if a > 0]
+            precios = [p for p in (safe_get(u, 'precio_m2', 0) or 0 for u in tip_units) if p > 0]
+            points.append({
+                'tipologia': tipologia,
+                'dormitorios': dorm_map.get(tipologia) or 0,
+                'area': sum(areas) / len(areas) if areas else float('nan'),
+                'precio_m2': sum(precios) / len(precios) if precios else float('nan'),
+                'fecha': today_ordinal,
+            })
 
-# --- FUNCIÓN AUXILIAR PARA ACCESO SEGURO A ROWS ---
+    # El precio de mercado está en soles; el de nuestras unidades en dólares
+    indices, distances = index.query(
+        [p['dormitorios'] for p in points],
+        [p['area'] for p in points],
+        [p['precio_m2'] * get_exchange_rates().latest_rate for p in points],
+        [p['fecha'] for p in points],
+        k=k,
+    )
+    precios, velocidades, muestras = index.weighted_metrics(indices, distances)
+
+    results = []
+    for i, point in enumerate(points):
+        valid = indices[i][indices[i] >= 0]
+        comparables = [
+            {
+                'dormitorios': int(index.dormitorios[j]),
+                'area': None if math.isnan(index.area[j]) else round(float(index.area[j]), 2),
+                'precio_m2': round(float(index.precio_m2[j]), 2),
+                'fecha_venta': df.at[j, 'Fecha de Venta'].strftime('%Y-%m-%d'),
+                'velocidad': round(float(index.velocidad[j]), 3),
+                'distancia': round(float(distances[i][n]), 4),
+            }
+            for n, j in enumerate(valid)
+        ]
+        results.append({
+            **{key: point[key] for key in ('codigo', 'tipologia', 'dormitorios') if key in point},
+            'muestras': int(muestras[i]),
+            'precio_m2_ponderado': None if math.isnan(precios[i]) else round(float(precios[i]), 2),
+            'velocidad_ponderada': None if math.isnan(velocidades[i]) else round(float(velocidades[i]), 3),
+            'comparables': comparables,
+        })
+    return results
 
-# --- SE ELIMINAN LAS RUTAS ANTIGUAS DEL DASHBOARD ---
 
-# --- 6. RUTA DE REDIRECCIÓN PARA LA PARRILLA ---
-@app.route('/pricing')
-def pricing_redirect():
+@tenant_cached
+def _tipologia_dorm_map_cached(project_name, data_version):
     conn = get_db_connection()
-    projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
+    rows = conn.execute(
+        "SELECT nombre_tipologia, dormitorios FROM tipologia_dormitorios WHERE nombre_proyecto = ?",
+        (project_name,)
+    ).fetchall()
     conn.close()
-    if projects:
-        first_project = 'STILL' if 'STILL' in [p['nombre_proyecto'] for p in projects] else projects[0]['nombre_proyecto']
-        return redirect(url_for('pricing', project_name=first_project))
-    return "No hay proyectos cargados en la base de datos."
+    return {row['nombre_tipologia']: row['dormitorios'] for row in rows}
 
 
-@app.route('/dashboard')
-def dashboard_redirect():
-    conn = get_db_connection()
-    projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
-    conn.close()
-    if projects:
-        first_project = 'STILL' if 'STILL' in [p['nombre_proyecto'] for p in projects] else projects[0]['nombre_proyecto']
-        return redirect(url_for('dashboard', project_name=first_project))
-    return "No hay proyectos cargados en la base de datos."
+def get_tipologia_dorm_map(project_name):
+    """Número de dormitorios predominante por tipología, precalculado por init_db.py."""
+    return _tipologia_dorm_map_cached(project_name, get_data_version())
 
 
-@app.route('/dashboard/<project_name>')
-def dashboard(project_name):
-    conn = get_db_connection()
-    all_projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
-    units = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+def alert_rules_path():
+    """Reglas de alerta propias del inquilino si las tiene; si no, las compartidas."""
+    tenant_rules = Path(tenant_path(get_current_tenant(), ALERT_RULES_FILE.name))
+    return tenant_rules if tenant_rules.exists() else ALERT_RULES_FILE
 
-    # Datos base
-    fecha_inicio_row = conn.execute(
-        "SELECT fecha_inicio_venta FROM proyecto_fechas_inicio WHERE nombre_proyecto = ?", 
-        (project_name,)
-    ).fetchone()
-    conn.close()
 
-    if not units:
-        summary_cards = {
-            'unidades_vendidas': 0,
-            'progreso_temporal': 0,
-            'precio_m2': 0,
-            'ventas': 0,
-            'area_vendida': 0
-        }
-        return render_template(
-            'dashboard.html',
-            all_projects=all_projects,
-            current_project=project_name,
-            summary_cards=summary_cards,
-            evolutivo={'labels': [], 'units': [], 'ticket': [], 'price_m2': []},
-            dorm_bars=[],
-            layout_overview=[],
-            gauge={'vendido_pct': 0, 'por_vender_pct': 0, 'incremento_pct': 0},
-            meta_provisional=0,
-            color_palette={
-                'text_primary': '#454769',
-                'text_secondary': '#626481',
-                'bar_primary': '#727ab5',
-                'bar_secondary': '#a9b9da',
-                'bar_gray': '#cbcbd0',
-                'line_blue': '#4f81bd',
-                'line_red': '#c0504d',
-                'line_green': '#9bbb59'
-            }
-        )
+def alert_rules_version():
+    """Versión del archivo de reglas de alerta (mtime); 0 si no existe."""
+    try:
+        return alert_rules_path().stat().st_mtime_ns
+    except OSError:
+        return 0
 
-    today = date.today()
-    start_date = None
-    if fecha_inicio_row and fecha_inicio_row[0]:
-        try:
-            start_date = datetime.strptime(fecha_inicio_row[0], '%Y-%m-%d').date()
-        except ValueError:
-            start_date = None
 
-    # Calcular progreso temporal
-    meses_transcurridos = 0
-    if start_date:
-        meses_transcurridos = (today.year - start_date.year) * 12 + (today.month - start_date.month)
-        if today.day < start_date.day:
-            meses_transcurridos -= 1
-        if meses_transcurridos < 0:
-            meses_transcurridos = 0
-    progreso_temporal = min(round((meses_transcurridos / 24) * 100, 1), 100) if meses_transcurridos else 0
+@lru_cache(maxsize=8)
+def _alert_rules_cached(rules_path, rules_version):
+    from alerts import load_alert_rules
 
-    # Determinar unidades en alerta (rojas) replicando la lógica existente
-    tipologias_data = defaultdict(list)
-    for unit in units:
-        tipologias_data[safe_get(unit, 'nombre_tipologia', '')].append(unit)
+    return load_alert_rules(rules_path)
 
-    tipologia_dorm_map = build_tipologia_dorm_map(tipologias_data, project_name)
 
-    competencia_metrics = load_competencia_metrics()
+def _tipologia_fingerprint(units):
+    digest = hashlib.sha1()
+    for unit in units:
+        digest.update(repr(tuple(unit)).encode('utf-8'))
+    return digest.hexdigest()
 
-    layout_overview = []
-    meses_en_venta = max(meses_transcurridos, 1)
-    for tipologia, tip_units in tipologias_data.items():
-        total_tip = len(tip_units)
-        sold_tip_units = [u for u in tip_units if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido']
-        sold_count = len(sold_tip_units)
-        sold_pct = (sold_count / total_tip * 100) if total_tip > 0 else 0
 
-        precio_m2_values = []
-        for u in sold_tip_units:
-            precio_m2_val = safe_get(u, 'precio_m2', 0)
-            if precio_m2_val and precio_m2_val > 0:
-                precio_m2_values.append(precio_m2_val)
-            else:
-                area = safe_get(u, 'area_techada', 0) or 0
-                precio_venta = safe_get(u, 'precio_venta', 0) or 0
-                if area > 0 and precio_venta > 0:
-                    precio_m2_values.append(precio_venta / area)
+def _evaluate_tipologia_alerts(project_name, tipologias, units_by_tipologia, rules):
+    """Calcula las métricas de las tipologías indicadas y evalúa todas las reglas sobre ellas."""
+    from alerts import compute_tipologia_metrics, triggers_by_tipologia
 
-        avg_precio_m2 = round(sum(precio_m2_values) / len(precio_m2_values), 2) if precio_m2_values else 0
-        velocidad_venta = round(sold_count / meses_en_venta, 2) if meses_en_venta > 0 else 0
-        absorcion = round(sold_count / total_tip, 2) if total_tip > 0 else 0
+    tipologia_dorm_map = get_tipologia_dorm_map(project_name)
+    competencia_metrics = load_competencia_metrics()
+    tipologia_idx, vendido, disponible, proformas, precio_m2 = [], [], [], [], []
+    velocidad, velocidad_mercado, precio_mercado = [], [], []
+
+    conn = get_db_connection()
+    for j, tipologia in enumerate(tipologias):
+        tip_units = units_by_tipologia[tipologia]
+        for u in tip_units:
+            estado_lower = (safe_get(u, 'estado_comercial', '') or '').lower()
+            tipologia_idx.append(j)
+            vendido.append(estado_lower == 'vendido')
+            disponible.append(estado_lower not in ESTADOS_NO_DISPONIBLES)
+            proformas.append(safe_get(u, 'proformas_count', 0) or 0)
+            precio_m2.append(safe_get(u, 'precio_m2', 0) or 0)
+        velocidad.append(calculate_velocity(tip_units, project_name, conn))
         dorm_key = tipologia_dorm_map.get(tipologia)
         competencia = competencia_metrics.get(dorm_key) if dorm_key else None
-        precio_mercado = round(competencia['precio_promedio'], 0) if competencia else None
-        velocidad_mercado = round(competencia['velocidad_promedio'], 3) if competencia else None
-        layout_overview.append({
-            'tipologia': tipologia,
-            'total_unidades': total_tip,
-            'porcentaje_vendido': round(sold_pct, 1),
-            'precio_m2_vendido': avg_precio_m2,
-            'velocidad_venta': velocidad_venta,
-            'absorcion': absorcion,
-            'precio_promedio_mercado': precio_mercado,
-            'velocidad_venta_mercado': velocidad_mercado,
-            'dormitorios': dorm_key
+        velocidad_mercado.append(competencia['velocidad_promedio'] if competencia else math.nan)
+        precio_mercado.append(competencia['precio_promedio'] if competencia else math.nan)
+    conn.close()
+
+    metrics = compute_tipologia_metrics(
+        tipologia_idx, len(tipologias), vendido, disponible, proformas, precio_m2,
+        velocidad, velocidad_mercado, precio_mercado, get_exchange_rates().latest_rate
+    )
+    return triggers_by_tipologia(rules, tipologias, metrics)
+
+
+# Última evaluación de alertas por (inquilino, proyecto), para reevaluar solo las tipologías que cambiaron
+_alert_state = {}
+_alert_state_lock = threading.Lock()
+
+
+@tenant_cached
+def _alert_evaluation_cached(project_name, data_version, rules_version, market_version, today):
+    conn = get_db_connection()
+    units = conn.execute(
+        "SELECT * FROM unidades WHERE nombre_proyecto = ? ORDER BY codigo", (project_name,)
+    ).fetchall()
+    fecha_inicio_row = conn.execute(
+        "SELECT fecha_inicio_venta FROM proyecto_fechas_inicio WHERE nombre_proyecto = ?", (project_name,)
+    ).fetchone()
+    conn.close()
+
+    units_by_tipologia = defaultdict(list)
+    for unit in units:
+        tipologia = safe_get(unit, 'nombre_tipologia', '')
+        if tipologia:
+            units_by_tipologia[tipologia].append(unit)
+    fingerprints = {t: _tipologia_fingerprint(tip_units) for t, tip_units in units_by_tipologia.items()}
+
+    # Lo que afecta a todas las tipologías por igual invalida la evaluación completa
+    context_key = (
+        rules_version, market_version, today,
+        fecha_inicio_row[0] if fecha_inicio_row else None, get_exchange_rates().latest_rate
+    )
+    with _alert_state_lock:
+        previous = _alert_state.get((get_current_tenant().id, project_name))
+    triggers = {}
+    if previous and previous['context'] == context_key:
+        triggers = {
+            t: previous['triggers'][t] for t, fingerprint in fingerprints.items()
+            if previous['fingerprints'].get(t) == fingerprint
+        }
+    changed = sorted(t for t in fingerprints if t not in triggers)
+    if changed:
+        triggers.update(_evaluate_tipologia_alerts(
+            project_name, changed, units_by_tipologia, _alert_rules_cached(alert_rules_path(), rules_version)
+        ))
+    with _alert_state_lock:
+        _alert_state[(get_current_tenant().id, project_name)] = {'context': context_key, 'fingerprints': fingerprints, 'triggers': triggers}
+
+    unidades = frozenset(
+        safe_get(u, 'codigo', '')
+        for t, tip_units in units_by_tipologia.items() if triggers[t]
+        for u in tip_units
+        if (safe_get(u, 'estado_comercial', '') or '').lower() not in ESTADOS_NO_DISPONIBLES
+    )
+    return {'triggers': triggers, 'unidades': unidades}
+
+
+def get_alert_evaluation(project_name):
+    """
+    Alertas del proyecto según alert_rules.json: {'triggers': {tipologia: (etiqueta, ...)},
+    'unidades': códigos de las unidades disponibles en alerta}. Se cachea por versión de datos,
+    de reglas y de competencia; tras una recarga solo se reevalúan las tipologías cuyas
+    unidades cambiaron.
+    """
+    return _alert_evaluation_cached(
+        project_name, get_data_version(), alert_rules_version(), competencia_file_version(), get_reference_date()
+    )
+
+
+def build_monthly_sales_history(units, start_date, today):
+    """
+    Construye el historial de ventas mensuales por tipología desde el inicio de venta
+    hasta el último mes cerrado. Retorna (mes_base, {tipologia: [ventas por mes]}).
+    """
+    sales_months = {}
+    for unit in units:
+        if (safe_get(unit, 'estado_comercial', '') or '').lower() != 'vendido':
+            continue
+        fecha_venta_str = safe_get(unit, 'fecha_venta', '')
+        try:
+            fecha_venta = datetime.strptime(fecha_venta_str, '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            continue
+        sales_months.setdefault(safe_get(unit, 'nombre_tipologia', ''), []).append(fecha_venta.strftime('%Y-%m'))
+
+    if not start_date:
+        all_months = [m for months in sales_months.values() for m in months]
+        if not all_months:
+            return (today.year, today.month), {}
+        first_year, first_month = map(int, min(all_months).split('-'))
+        start_date = date(first_year, first_month, 1)
+
+    month_sequence = generate_month_sequence(date(start_date.year, start_date.month, 1), today)
+    # El mes en curso está incompleto: solo se usa si es el único mes observado
+    if len(month_sequence) > 1:
+        month_sequence = month_sequence[:-1]
+    month_index = {month: i for i, month in enumerate(month_sequence)}
+
+    historial = {}
+    for tipologia, months in sales_months.items():
+        counts = [0] * len(month_sequence)
+        for month in months:
+            if month in month_index:
+                counts[month_index[month]] += 1
+        historial[tipologia] = counts
+
+    base_year, base_month = map(int, month_sequence[-1].split('-')) if month_sequence else (today.year, today.month)
+    return (base_year, base_month), historial
+
+
+@tenant_cached
+def _sales_forecast_cached(project_name, data_version):
+    from forecast import simulate_sell_out, seed_for
+
+    conn = get_db_connection()
+    units = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+    fecha_inicio_row = conn.execute(
+        "SELECT fecha_inicio_venta FROM proyecto_fechas_inicio WHERE nombre_proyecto = ?",
+        (project_name,)
+    ).fetchone()
+    conn.close()
+
+    start_date = None
+    if fecha_inicio_row and fecha_inicio_row[0]:
+        try:
+            start_date = datetime.strptime(fecha_inicio_row[0], '%Y-%m-%d').date()
+        except ValueError:
+            start_date = None
+
+    base_month, historial = build_monthly_sales_history(units, start_date, get_reference_date())
+
+    stock = {}
+    precios_por_vender = defaultdict(list)
+    for unit in units:
+        tipologia = safe_get(unit, 'nombre_tipologia', '')
+        stock.setdefault(tipologia, 0)
+        if (safe_get(unit, 'estado_comercial', '') or '').lower() == 'vendido':
+            continue
+        stock[tipologia] += 1
+        precio_lista = safe_get(unit, 'precio_lista', 0) or 0
+        if precio_lista > 0:
+            precios_por_vender[tipologia].append(precio_lista)
+    precios = {t: sum(values) / len(values) for t, values in precios_por_vender.items()}
+
+    return simulate_sell_out(historial, stock, precios, base_month, seed=seed_for(project_name, data_version))
+
+
+def get_sales_forecast(project_name):
+    """Pronóstico Monte Carlo de sell-out del proyecto, cacheado por versión de datos."""
+    return _sales_forecast_cached(project_name, get_data_version())
+
+def _funnel_ratio(numerador, denominador):
+    return round(numerador / denominador, 4) if denominador else None
+
+
+@tenant_cached
+def _conversion_funnel_cached(project_name, data_version):
+    conn = get_db_connection()
+    etapas = {
+        'proformas': conn.execute("""
+            SELECT u.nombre_tipologia AS tipologia, p.mes AS mes, COUNT(*) AS total
+            FROM unidades u JOIN proformas p ON p.codigo_unidad = u.codigo
+            WHERE u.nombre_proyecto = ? AND p.mes IS NOT NULL
+            GROUP BY u.nombre_tipologia, p.mes
+        """, (project_name,)).fetchall(),
+        'separaciones': conn.execute("""
+            SELECT nombre_tipologia AS tipologia, substr(fecha_separacion, 1, 7) AS mes, COUNT(*) AS total
+            FROM unidades
+            WHERE nombre_proyecto = ? AND fecha_separacion IS NOT NULL
+            GROUP BY nombre_tipologia, substr(fecha_separacion, 1, 7)
+        """, (project_name,)).fetchall(),
+        'ventas': conn.execute("""
+            SELECT nombre_tipologia AS tipologia, substr(fecha_venta, 1, 7) AS mes, COUNT(*) AS total
+            FROM unidades
+            WHERE nombre_proyecto = ? AND fecha_venta IS NOT NULL AND LOWER(estado_comercial) = 'vendido'
+            GROUP BY nombre_tipologia, substr(fecha_venta, 1, 7)
+        """, (project_name,)).fetchall(),
+    }
+    conn.close()
+
+    meses = sorted({row['mes'] for rows in etapas.values() for row in rows})
+    month_index = {mes: i for i, mes in enumerate(meses)}
+    series = defaultdict(lambda: {etapa: [0] * len(meses) for etapa in etapas})
+    for etapa, rows in etapas.items():
+        for row in rows:
+            series[row['tipologia']][etapa][month_index[row['mes']]] += row['total']
+
+    tipologias = []
+    totales = {etapa: [0] * len(meses) for etapa in etapas}
+    for tipologia in sorted(series):
+        data = series[tipologia]
+        suma = {etapa: sum(valores) for etapa, valores in data.items()}
+        for etapa, valores in data.items():
+            totales[etapa] = [a + b for a, b in zip(totales[etapa], valores)]
+        tipologias.append({
+            'tipologia': tipologia,
+            **data,
+            'totales': suma,
+            'conversion_proforma_separacion': _funnel_ratio(suma['separaciones'], suma['proformas']),
+            'conversion_separacion_venta': _funnel_ratio(suma['ventas'], suma['separaciones']),
         })
 
-    layout_overview.sort(key=lambda item: item['tipologia'])
+    suma_total = {etapa: sum(valores) for etapa, valores in totales.items()}
+    return {
+        'meses': meses,
+        'tipologias': tipologias,
+        'proyecto': {
+            **totales,
+            'totales': suma_total,
+            'conversion_proforma_separacion': _funnel_ratio(suma_total['separaciones'], suma_total['proformas']),
+            'conversion_separacion_venta': _funnel_ratio(suma_total['ventas'], suma_total['separaciones']),
+        },
+    }
+
+
+def get_conversion_funnel(project_name):
+    """
+    Embudo proformas → separaciones → ventas por tipología y mes, agregado con SQL sobre la
+    tabla de hechos de proformas y cacheado por versión de datos.
+    """
+    return _conversion_funnel_cached(project_name, get_data_version())
+
+
+@tenant_cached
+def _novedades_cached(project_name, data_version, cargas):
+    conn = get_db_connection()
+    try:
+        ultimas = conn.execute("SELECT * FROM cargas ORDER BY id DESC LIMIT ?", (cargas,)).fetchall()
+        rows = conn.execute("""
+            SELECT carga_id, codigo, nombre_tipologia, campo, valor_anterior, valor_nuevo
+            FROM novedades
+            WHERE nombre_proyecto = ? AND carga_id >= ?
+            ORDER BY carga_id DESC, nombre_tipologia, codigo
+        """, (project_name, ultimas[-1]['id'] if ultimas else 0)).fetchall()
+    except sqlite3.OperationalError:
+        # Base construida antes de registrar novedades
+        ultimas, rows = [], []
+    finally:
+        conn.close()
+
+    por_carga = defaultdict(list)
+    for row in rows:
+        por_carga[row['carga_id']].append({
+            'codigo': row['codigo'],
+            'tipologia': row['nombre_tipologia'],
+            'campo': row['campo'],
+            'valor_anterior': row['valor_anterior'],
+            'valor_nuevo': row['valor_nuevo'],
+        })
+    return {
+        'proyecto': project_name,
+        'cargas': [
+            {
+                'id': carga['id'],
+                'fecha': carga['fecha'],
+                'resumen': summarize_changes(por_carga[carga['id']]),
+                'cambios': por_carga[carga['id']],
+            }
+            for carga in ultimas
+        ],
+    }
+
+
+def get_novedades(project_name, cargas=1):
+    """
+    Novedades del proyecto en las últimas `cargas` recargas de datos (cambios de estado y de
+    precio, altas y bajas), leídas de la tabla que calcula init_db.py y cacheadas por versión.
+    """
+    return _novedades_cached(project_name, get_data_version(), cargas)
+
+
+@tenant_cached
+def _absorption_cached(data_version, por_dormitorios, today):
+    import numpy as np
+    from absorption import absorption_curves, months_since
+
+    conn = get_db_connection()
+    units = conn.execute("""
+        SELECT u.nombre_proyecto, u.estado_comercial, u.fecha_venta, u.precio_venta, u.dormitorios,
+               f.fecha_inicio_venta
+        FROM unidades u LEFT JOIN proyecto_fechas_inicio f ON f.nombre_proyecto = u.nombre_proyecto
+    """).fetchall()
+    conn.close()
+    if por_dormitorios:
+        units = [u for u in units if (u['dormitorios'] or 0) > 0]
+    if not units:
+        return {'meses': 0, 'grupos': []}
+
+    # Sin fecha de inicio registrada, el proyecto se alinea desde su primera venta
+    inicios = {}
+    for u in units:
+        inicio = u['fecha_inicio_venta'] or u['fecha_venta']
+        if inicio and (u['nombre_proyecto'] not in inicios or inicio < inicios[u['nombre_proyecto']]):
+            inicios[u['nombre_proyecto']] = inicio
+    claves, grupo = {}, []
+    for u in units:
+        clave = (u['nombre_proyecto'], u['dormitorios']) if por_dormitorios else (u['nombre_proyecto'],)
+        grupo.append(claves.setdefault(clave, len(claves)))
+    claves = sorted(claves, key=claves.get)
+
+    fechas_venta = [u['fecha_venta'] for u in units]
+    vendido = np.array([(u['estado_comercial'] or '').lower() == 'vendido' for u in units])
+    precio_venta = np.array([u['precio_venta'] or 0 for u in units], dtype=float)
+    ingresos = np.where(vendido & (precio_venta > 0), precio_venta, 0.0)
+    inicio_por_grupo = [inicios.get(clave[0]) for clave in claves]
+    horizonte = months_since([today.isoformat()] * len(claves), inicio_por_grupo)
+    curves = absorption_curves(
+        grupo, len(claves), vendido,
+        months_since(fechas_venta, [inicios.get(u['nombre_proyecto']) for u in units]),
+        ingresos, ingresos * get_exchange_rates().rates_for(fechas_venta),
+        horizonte,
+    )
 
-    unidades_con_alerta = set()
-    for tipologia_units in tipologias_data.values():
-        total_units = len(tipologia_units)
-        sold_units_tipologia = sum(
-            1 for u in tipologia_units if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido'
+    grupos = []
+    for i, clave in enumerate(claves):
+        if inicio_por_grupo[i] is None:
+            continue
+        largo = max(int(horizonte[i]), int(curves['ultimo_mes'][i])) + 1
+        grupos.append({
+            'proyecto': clave[0],
+            **({'dormitorios': clave[1]} if por_dormitorios else {}),
+            'fecha_inicio_venta': inicio_por_grupo[i][:10],
+            'total_unidades': int(curves['total'][i]),
+            'vendidas_sin_fecha': int(curves['sin_fecha'][i]),
+            'vendidas': curves['vendidas'][i, :largo].tolist(),
+            'porcentaje_vendido': np.round(curves['porcentaje'][i, :largo], 2).tolist(),
+            'ingresos': np.round(curves['ingresos'][i, :largo], 2).tolist(),
+            'ingresos_pen': np.round(curves['ingresos_pen'][i, :largo], 2).tolist(),
+        })
+    grupos.sort(key=lambda g: (g['proyecto'], g.get('dormitorios', 0)))
+    return {'meses': max((len(g['vendidas']) for g in grupos), default=0), 'grupos': grupos}
+
+
+def get_absorption_curves(por_dormitorios=False):
+    """
+    Absorción acumulada (unidades, % vendido e ingresos) de todos los proyectos alineada por
+    meses desde el inicio de venta, opcionalmente por dormitorios; cacheada por versión de datos.
+    """
+    return _absorption_cached(get_data_version(), por_dormitorios, get_reference_date())
+
+# --- INICIO DE LA SOLUCIÓN ---
+@app.route('/')
+def index():
+    # Redirige al dashboard de un proyecto por defecto (ej. "STILL")
+    # Puedes cambiar "STILL" por cualquier otro de tus proyectos válidos.
+    return redirect(url_for('dashboard', project_name='STILL'))
+# --- FIN DE LA SOLUCIÓN ---
+
+# --- 2. FILTRO DE MONEDA PERSONALIZADO ---
+@app.template_filter('currency')
+def format_currency(value):
+    if value is None: return "$0"
+    return f"${value:,.0f}"
+
+
+@app.template_filter('currency_pen')
+def format_currency_pen(value):
+    if value is None:
+        return ""
+    try:
+        if isinstance(value, float) and math.isnan(value):
+            return ""
+        return f"S/ {float(value):,.0f}"
+    except (ValueError, TypeError):
+        return ""
+
+
+@app.template_filter('velocity_fmt')
+def format_velocity(value):
+    if value is None:
+        return ""
+    try:
+        if isinstance(value, float) and math.isnan(value):
+            return ""
+        return f"{float(value):.2f} u/mes"
+    except (ValueError, TypeError):
+        return ""
+
+# --- 3. ESTÁTICOS Y COMPRESIÓN ---
+@lru_cache(maxsize=256)
+def _static_file_hash(filename, mtime_ns):
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+@app.url_defaults
+def add_static_content_hash(endpoint, values):
+    """Agrega el hash de contenido a las URLs de estáticos para poder cachearlas indefinidamente."""
+    if endpoint != 'static' or 'v' in values:
+        return
+    filename = values.get('filename')
+    try:
+        mtime_ns = os.stat(os.path.join(app.static_folder, filename)).st_mtime_ns
+    except (OSError, TypeError):
+        return
+    values['v'] = _static_file_hash(filename, mtime_ns)
+
+
+@app.template_global()
+def vendor_or_cdn(filename, cdn_url):
+    """URL local de una librería en static/vendor/ si fue descargada en el build, si no la del CDN."""
+    if os.path.exists(os.path.join(app.static_folder, 'vendor', filename)):
+        return url_for('static', filename=f'vendor/{filename}')
+    return cdn_url
+
+
+def send_static_precompressed(filename):
+    """
+    Sirve un estático usando su variante precomprimida (.br o .gz, generadas por
+    compress_static.py) cuando el navegador la acepta.
+    """
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    if request.args.get('v'):
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_CACHE_MAX_AGE}, immutable'
+    return response
+
+
+app.view_functions['static'] = send_static_precompressed
+
+
+@app.after_request
+def compress_response(response):
+    """Comprime con gzip las respuestas HTML/JSON grandes (p. ej. fragmentos HTMX de la parrilla)."""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200 or response.status_code >= 300
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or not request.accept_encodings['gzip']
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+# --- SE ELIMINA EL DICCIONARIO layout_overview_data ---
+
+# --- 4. FUNCIÓN AUXILIAR PARA LA BASE DE DATOS ---
+@app.before_request
+def select_tenant():
+    """Fija el inquilino de la petición según el host (el por defecto si ninguno lo declara)."""
+    tenants, default_id = get_tenants()
+    set_current_tenant(tenant_for_host(tenants, default_id, request.host).id)
+
+
+@app.before_request
+def select_as_of():
+    """Fija la fecha as_of de la petición (solo parrilla y dashboard); None para el estado actual."""
+    as_of = parse_as_of(request.args.get('as_of')) if request.endpoint in AS_OF_ENDPOINTS else None
+    set_as_of(as_of, (request.view_args or {}).get('project_name'))
+
+
+def materialize_as_of(conn, as_of, project_name=None):
+    """
+    Reconstruye en la base adjunta 'historico' la tabla 'unidades' de un proyecto (o de todos,
+    sin proyecto) al final del día as_of: la snapshot base más reciente hasta esa fecha más los
+    últimos deltas de cada unidad. Sin snapshots anteriores a la fecha (o en bases sin
+    historial) queda vacía.
+    """
+    conn.execute("CREATE TABLE historico.unidades AS SELECT * FROM main.unidades WHERE 0")
+    try:
+        base, hasta = conn.execute("""
+            SELECT MAX(CASE WHEN tipo = 'base' THEN carga_id END), MAX(carga_id)
+            FROM snapshots WHERE fecha <= ?
+        """, (as_of.isoformat(),)).fetchone()
+    except sqlite3.OperationalError:
+        return
+    if base is None:
+        return
+    nombres = [column[0] for column in conn.execute("SELECT * FROM main.unidades LIMIT 0").description]
+    columnas = ', '.join(nombres)
+    conn.execute(f"""
+        INSERT INTO historico.unidades ({columnas})
+        WITH ultimos AS (
+            SELECT codigo, MAX(carga_id) AS carga_id FROM snapshot_deltas
+            WHERE carga_id > :base AND carga_id <= :hasta
+            GROUP BY codigo
         )
-        if total_units > 0 and (sold_units_tipologia / total_units) * 100 >= 20.0:
-            for u in tipologia_units:
-                estado_lower = (safe_get(u, 'estado_comercial', '') or '').lower()
-                if estado_lower not in ['vendido', 'separado', 'proceso de separacion']:
-                    unidades_con_alerta.add(safe_get(u, 'codigo', ''))
+        SELECT {columnas} FROM snapshot_bases
+        WHERE carga_id = :base AND (:proyecto IS NULL OR nombre_proyecto = :proyecto)
+          AND codigo NOT IN (SELECT codigo FROM ultimos)
+        UNION ALL
+        SELECT {', '.join('d.' + nombre for nombre in nombres)}
+        FROM snapshot_deltas d JOIN ultimos u ON d.codigo = u.codigo AND d.carga_id = u.carga_id
+        WHERE d.baja = 0 AND (:proyecto IS NULL OR d.nombre_proyecto = :proyecto)
+    """, {'base': base, 'hasta': hasta, 'proyecto': project_name})
+    conn.execute("CREATE INDEX historico.idx_unidades_proyecto ON unidades (nombre_proyecto)")
+
+
+@tenant_cached
+def _as_of_units_cached(project_name, data_version):
+    """
+    Unidades de un proyecto a la fecha as_of, reconstruidas una sola vez por versión de datos
+    (que incluye la fecha y el proyecto) y guardadas como base SQLite serializada.
+    """
+    conn = _open_db_connection()
+    try:
+        conn.execute("ATTACH DATABASE ':memory:' AS historico")
+        materialize_as_of(conn, get_as_of(), project_name)
+        conn.commit()
+        return conn.serialize(name='historico')
+    finally:
+        conn.close()
+
+
+def _open_db_connection():
+    if get_current_tenant().solo_lectura:
+        # Paquete montado: la base no cambia, se abre inmutable y se lee con memory-mapping
+        conn = sqlite3.connect(Path(get_db_path()).resolve().as_uri() + '?immutable=1', uri=True)
+        conn.execute(f"PRAGMA mmap_size = {BUNDLE_MMAP_BYTES}")
+    else:
+        conn = sqlite3.connect(get_db_path())
+    conn.row_factory = sqlite3.Row
+    return conn
 
-    sold_units = []
-    available_units = []
-    alert_units = []
-    separated_units = []
+
+def get_db_connection():
+    """
+    Conexión a la base del inquilino. En una consulta histórica (as_of) la tabla 'unidades' es
+    una vista TEMP sobre las unidades reconstruidas a esa fecha, que ocultan a las actuales en
+    esta conexión: el resto de las consultas no cambia.
+    """
+    conn = _open_db_connection()
+    if get_as_of():
+        conn.execute("ATTACH DATABASE ':memory:' AS historico")
+        conn.deserialize(_as_of_units_cached(_as_of_project.get(), get_data_version()), name='historico')
+        conn.execute("CREATE TEMP VIEW unidades AS SELECT * FROM historico.unidades")
+    return conn
+
+# --- FUNCIÓN AUXILIAR PARA ACCESO SEGURO A ROWS ---
+
+# --- SE ELIMINAN LAS RUTAS ANTIGUAS DEL DASHBOARD ---
+
+# --- 6. RUTA DE REDIRECCIÓN PARA LA PARRILLA ---
+@app.route('/pricing')
+def pricing_redirect():
+    conn = get_db_connection()
+    projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
+    conn.close()
+    if projects:
+        first_project = 'STILL' if 'STILL' in [p['nombre_proyecto'] for p in projects] else projects[0]['nombre_proyecto']
+        return redirect(url_for('pricing', project_name=first_project))
+    return "No hay proyectos cargados en la base de datos."
+
+
+@app.route('/dashboard')
+def dashboard_redirect():
+    conn = get_db_connection()
+    projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
+    conn.close()
+    if projects:
+        first_project = 'STILL' if 'STILL' in [p['nombre_proyecto'] for p in projects] else projects[0]['nombre_proyecto']
+        return redirect(url_for('dashboard', project_name=first_project))
+    return "No hay proyectos cargados en la base de datos."
+
+
+@lru_cache(maxsize=None)
+def _duckdb_available():
+    from analytics import duckdb_available
+    return duckdb_available()
+
+
+# Primer error de DuckDB de este proceso: desde entonces se usa el backend Python (hasta reiniciar)
+_duckdb_error = None
+
+
+def disable_duckdb(error):
+    """Registra el error de DuckDB y deja el backend Python para el resto de las peticiones del proceso."""
+    global _duckdb_error
+    if _duckdb_error is None:
+        app.logger.error("Backend analítico DuckDB desactivado en este proceso, se usa Python: %s", error)
+    _duckdb_error = error
+
+
+def get_analytics_backend():
+    """
+    Backend de las agregaciones del dashboard y de mercado según ANALYTICS_BACKEND. DuckDB lee
+    la base del inquilino directamente, así que las consultas históricas (as_of), las
+    instalaciones sin duckdb y los procesos en que DuckDB ya falló usan el backend Python.
+    """
+    if ANALYTICS_BACKEND == 'duckdb' and get_as_of() is None and _duckdb_error is None and _duckdb_available():
+        return 'duckdb'
+    return 'python'
+
+
+def _dashboard_summaries_python(project_name, units, unidades_con_alerta):
+    """Resúmenes por tipología, por dormitorios y mensual del dashboard, recorriendo las unidades."""
+    tipologia_summary = defaultdict(lambda: {'total': 0, 'sold_count': 0, 'precio_m2_sum': 0, 'precio_m2_count': 0})
+    for unit in units:
+        resumen = tipologia_summary[safe_get(unit, 'nombre_tipologia', '')]
+        resumen['total'] += 1
+        if (safe_get(unit, 'estado_comercial', '') or '').lower() != 'vendido':
+            continue
+        resumen['sold_count'] += 1
+        precio_m2_val = safe_get(unit, 'precio_m2', 0)
+        if precio_m2_val and precio_m2_val > 0:
+            resumen['precio_m2_sum'] += precio_m2_val
+            resumen['precio_m2_count'] += 1
+        else:
+            area = safe_get(unit, 'area_techada', 0) or 0
+            precio_venta = safe_get(unit, 'precio_venta', 0) or 0
+            if area > 0 and precio_venta > 0:
+                resumen['precio_m2_sum'] += precio_venta / area
+                resumen['precio_m2_count'] += 1
+
+    # Barras por dormitorio
+    dorm_summary = defaultdict(lambda: {
+        'sold_sum': 0, 'sold_count': 0,
+        'available_sum': 0, 'available_count': 0,
+        'alert_sum': 0, 'alert_count': 0
+    })
 
     for unit in units:
+        dorms = get_total_habitaciones_from_unit(unit, project_name)
+        if dorms <= 0:
+            continue
         estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
         codigo = safe_get(unit, 'codigo', '')
+
         if estado_lower == 'vendido':
-            sold_units.append(unit)
+            dorm_summary[dorms]['sold_sum'] += safe_get(unit, 'precio_venta', 0) or 0
+            dorm_summary[dorms]['sold_count'] += 1
         elif codigo in unidades_con_alerta:
-            alert_units.append(unit)
+            dorm_summary[dorms]['alert_sum'] += safe_get(unit, 'precio_lista', 0) or 0
+            dorm_summary[dorms]['alert_count'] += 1
         elif estado_lower in ['separado', 'proceso de separacion']:
-            separated_units.append(unit)
+            # Se incluyen en disponible para efectos de "por vender"
+            dorm_summary[dorms]['available_sum'] += safe_get(unit, 'precio_lista', 0) or 0
+            dorm_summary[dorms]['available_count'] += 1
         else:
-            available_units.append(unit)
-
-    total_units = len(units)
-    total_vendidas = len(sold_units)
-    total_por_vender = total_units - total_vendidas
-    total_ventas = sum(safe_get(u, 'precio_venta', 0) or 0 for u in sold_units)
-    area_vendida = sum(safe_get(u, 'area_techada', 0) or 0 for u in sold_units)
-    meta_provisional = sum(safe_get(u, 'precio_lista', 0) or 0 for u in units)
-
-    precio_m2_disponible_valores = [
-        safe_get(u, 'precio_m2', 0) for u in available_units if safe_get(u, 'precio_m2', 0)
-    ]
-    precio_m2_promedio = round(
-        sum(precio_m2_disponible_valores) / len(precio_m2_disponible_valores), 2
-    ) if precio_m2_disponible_valores else 0
+            dorm_summary[dorms]['available_sum'] += safe_get(unit, 'precio_lista', 0) or 0
+            dorm_summary[dorms]['available_count'] += 1
 
     # Evolutivo mensual
     monthly_summary = defaultdict(lambda: {
         'units': 0,
         'ticket_sum': 0,
+        'ticket_pen_sum': 0,
         'ticket_count': 0,
         'price_m2_sum': 0,
+        'price_m2_pen_sum': 0,
         'price_m2_count': 0
     })
+    sold_units = [u for u in units if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido']
+    tipo_cambio_por_unidad = get_exchange_rate_by_unit(sold_units)
     for unit in sold_units:
         fecha_venta_str = safe_get(unit, 'fecha_venta', '')
         if not fecha_venta_str:
@@ -580,22 +1422,185 @@ def dashboard(project_name):
             continue
         month_key = fecha_venta.strftime('%Y-%m')
         monthly_summary[month_key]['units'] += 1
+        tipo_cambio = tipo_cambio_por_unidad[safe_get(unit, 'codigo', '')]
 
         precio_venta = safe_get(unit, 'precio_venta', 0) or 0
         if precio_venta and precio_venta > 0:
             monthly_summary[month_key]['ticket_sum'] += precio_venta
+            monthly_summary[month_key]['ticket_pen_sum'] += precio_venta * tipo_cambio
             monthly_summary[month_key]['ticket_count'] += 1
 
         precio_m2 = safe_get(unit, 'precio_m2', 0)
         if precio_m2 and precio_m2 > 0:
             monthly_summary[month_key]['price_m2_sum'] += precio_m2
+            monthly_summary[month_key]['price_m2_pen_sum'] += precio_m2 * tipo_cambio
             monthly_summary[month_key]['price_m2_count'] += 1
         else:
             area = safe_get(unit, 'area_techada', 0) or 0
             if area:
                 monthly_summary[month_key]['price_m2_sum'] += precio_venta / area
+                monthly_summary[month_key]['price_m2_pen_sum'] += precio_venta / area * tipo_cambio
                 monthly_summary[month_key]['price_m2_count'] += 1
 
+    return dict(tipologia_summary), dict(dorm_summary), dict(monthly_summary)
+
+
+def get_dashboard_summaries(project_name, units, unidades_con_alerta):
+    """
+    (resumen por tipología, resumen por dormitorios, resumen mensual) del dashboard con el
+    backend configurado; ambos backends retornan las mismas estructuras (ver analytics.py).
+    """
+    if get_analytics_backend() == 'duckdb':
+        import duckdb
+        from analytics import connect, dorm_summary, monthly_summary, tipologia_summary
+
+        try:
+            with connect(get_db_path()) as con:
+                return (
+                    tipologia_summary(con, project_name),
+                    dorm_summary(con, project_name, sorted(unidades_con_alerta)),
+                    monthly_summary(con, project_name, DEFAULT_EXCHANGE_RATE_PEN),
+                )
+        except duckdb.Error as e:
+            # Por ejemplo, sin la extensión sqlite de DuckDB (se descarga la primera vez): no se
+            # reintenta en cada petición
+            disable_duckdb(e)
+    return _dashboard_summaries_python(project_name, units, unidades_con_alerta)
+
+
+def build_dashboard_context(project_name):
+    """Calcula todas las variables que usa dashboard.html para un proyecto."""
+    data_version = get_project_version(project_name)
+    conn = get_db_connection()
+    # Selector de proyectos: siempre los actuales (una consulta histórica solo reconstruye este proyecto)
+    all_projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM main.unidades ORDER BY nombre_proyecto").fetchall()
+    units = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+
+    # Datos base
+    fecha_inicio_row = conn.execute(
+        "SELECT fecha_inicio_venta FROM proyecto_fechas_inicio WHERE nombre_proyecto = ?", 
+        (project_name,)
+    ).fetchone()
+    conn.close()
+
+    if not units:
+        summary_cards = {
+            'unidades_vendidas': 0,
+            'progreso_temporal': 0,
+            'precio_m2': 0,
+            'ventas': 0,
+            'area_vendida': 0
+        }
+        return dict(
+            data_version=data_version,
+            as_of=get_as_of(),
+            all_projects=all_projects,
+            current_project=project_name,
+            summary_cards=summary_cards,
+            evolutivo={'labels': [], 'units': [], 'ticket': [], 'ticket_pen': [], 'price_m2': [], 'price_m2_pen': []},
+            dorm_bars=[],
+            layout_overview=[],
+            gauge={'vendido_pct': 0, 'por_vender_pct': 0, 'incremento_pct': 0},
+            meta_provisional=0,
+            forecast=None,
+            color_palette={
+                'text_primary': '#454769',
+                'text_secondary': '#626481',
+                'bar_primary': '#727ab5',
+                'bar_secondary': '#a9b9da',
+                'bar_gray': '#cbcbd0',
+                'line_blue': '#4f81bd',
+                'line_red': '#c0504d',
+                'line_green': '#9bbb59'
+            }
+        )
+
+    today = get_reference_date()
+    start_date = None
+    if fecha_inicio_row and fecha_inicio_row[0]:
+        try:
+            start_date = datetime.strptime(fecha_inicio_row[0], '%Y-%m-%d').date()
+        except ValueError:
+            start_date = None
+
+    # Calcular progreso temporal
+    meses_transcurridos = 0
+    if start_date:
+        meses_transcurridos = (today.year - start_date.year) * 12 + (today.month - start_date.month)
+        if today.day < start_date.day:
+            meses_transcurridos -= 1
+        if meses_transcurridos < 0:
+            meses_transcurridos = 0
+    progreso_temporal = min(round((meses_transcurridos / 24) * 100, 1), 100) if meses_transcurridos else 0
+
+    tipologia_dorm_map = get_tipologia_dorm_map(project_name)
+
+    competencia_metrics = load_competencia_metrics()
+
+    unidades_con_alerta = get_alert_evaluation(project_name)['unidades']
+    tipologia_summary, dorm_summary, monthly_summary = get_dashboard_summaries(project_name, units, unidades_con_alerta)
+
+    layout_overview = []
+    meses_en_venta = max(meses_transcurridos, 1)
+    for tipologia, resumen in tipologia_summary.items():
+        total_tip = resumen['total']
+        sold_count = resumen['sold_count']
+        sold_pct = (sold_count / total_tip * 100) if total_tip > 0 else 0
+
+        avg_precio_m2 = (
+            round(resumen['precio_m2_sum'] / resumen['precio_m2_count'], 2) if resumen['precio_m2_count'] else 0
+        )
+        velocidad_venta = round(sold_count / meses_en_venta, 2) if meses_en_venta > 0 else 0
+        absorcion = round(sold_count / total_tip, 2) if total_tip > 0 else 0
+        dorm_key = tipologia_dorm_map.get(tipologia)
+        competencia = competencia_metrics.get(dorm_key) if dorm_key else None
+        precio_mercado = round(competencia['precio_promedio'], 0) if competencia else None
+        velocidad_mercado = round(competencia['velocidad_promedio'], 3) if competencia else None
+        layout_overview.append({
+            'tipologia': tipologia,
+            'total_unidades': total_tip,
+            'porcentaje_vendido': round(sold_pct, 1),
+            'precio_m2_vendido': avg_precio_m2,
+            'velocidad_venta': velocidad_venta,
+            'absorcion': absorcion,
+            'precio_promedio_mercado': precio_mercado,
+            'velocidad_venta_mercado': velocidad_mercado,
+            'dormitorios': dorm_key
+        })
+
+    layout_overview.sort(key=lambda item: item['tipologia'])
+
+    sold_units = []
+    available_units = []
+    alert_units = []
+    separated_units = []
+
+    for unit in units:
+        estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
+        codigo = safe_get(unit, 'codigo', '')
+        if estado_lower == 'vendido':
+            sold_units.append(unit)
+        elif codigo in unidades_con_alerta:
+            alert_units.append(unit)
+        elif estado_lower in ['separado', 'proceso de separacion']:
+            separated_units.append(unit)
+        else:
+            available_units.append(unit)
+
+    total_units = len(units)
+    total_vendidas = len(sold_units)
+    total_por_vender = total_units - total_vendidas
+    total_ventas = sum(safe_get(u, 'precio_venta', 0) or 0 for u in sold_units)
+    area_vendida = sum(safe_get(u, 'area_techada', 0) or 0 for u in sold_units)
+    meta_provisional = sum(safe_get(u, 'precio_lista', 0) or 0 for u in units)
+
+    precio_m2_disponible_valores = [
+        safe_get(u, 'precio_m2', 0) for u in available_units if safe_get(u, 'precio_m2', 0)
+    ]
+    precio_m2_promedio = round(
+        sum(precio_m2_disponible_valores) / len(precio_m2_disponible_valores), 2
+    ) if precio_m2_disponible_valores else 0
+
     if start_date:
         month_sequence = generate_month_sequence(date(start_date.year, start_date.month, 1), today)
     else:
@@ -604,14 +1609,18 @@ def dashboard(project_name):
     evolutivo_labels = []
     evolutivo_units = []
     evolutivo_ticket = []
+    evolutivo_ticket_pen = []
     evolutivo_precio_m2 = []
+    evolutivo_precio_m2_pen = []
 
     for month_key in month_sequence:
         data_point = monthly_summary.get(month_key, {
             'units': 0,
             'ticket_sum': 0,
+            'ticket_pen_sum': 0,
             'ticket_count': 0,
             'price_m2_sum': 0,
+            'price_m2_pen_sum': 0,
             'price_m2_count': 0
         })
         evolutivo_labels.append(month_key)
@@ -621,43 +1630,26 @@ def dashboard(project_name):
             if data_point['ticket_count'] > 0 else 0
         )
         evolutivo_ticket.append(round(avg_ticket, 2))
+        avg_ticket_pen = (
+            data_point['ticket_pen_sum'] / data_point['ticket_count']
+            if data_point['ticket_count'] > 0 else 0
+        )
+        evolutivo_ticket_pen.append(round(avg_ticket_pen, 2))
         avg_price_m2 = (
             data_point['price_m2_sum'] / data_point['price_m2_count']
             if data_point['price_m2_count'] > 0 else 0
         )
         evolutivo_precio_m2.append(round(avg_price_m2, 2))
+        avg_price_m2_pen = (
+            data_point['price_m2_pen_sum'] / data_point['price_m2_count']
+            if data_point['price_m2_count'] > 0 else 0
+        )
+        evolutivo_precio_m2_pen.append(round(avg_price_m2_pen, 2))
 
-    # Barras por dormitorio
-    dorm_summary = defaultdict(lambda: {
-        'sold_sum': 0, 'sold_count': 0,
-        'available_sum': 0, 'available_count': 0,
-        'alert_sum': 0, 'alert_count': 0
-    })
-
-    for unit in units:
-        dorms = get_total_habitaciones_from_unit(unit, project_name)
-        if dorms <= 0:
-            continue
-        label = f"{dorms} dor"
-        estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
-        codigo = safe_get(unit, 'codigo', '')
-
-        if estado_lower == 'vendido':
-            dorm_summary[label]['sold_sum'] += safe_get(unit, 'precio_venta', 0) or 0
-            dorm_summary[label]['sold_count'] += 1
-        elif codigo in unidades_con_alerta:
-            dorm_summary[label]['alert_sum'] += safe_get(unit, 'precio_lista', 0) or 0
-            dorm_summary[label]['alert_count'] += 1
-        elif estado_lower in ['separado', 'proceso de separacion']:
-            # Se incluyen en disponible para efectos de "por vender"
-            dorm_summary[label]['available_sum'] += safe_get(unit, 'precio_lista', 0) or 0
-            dorm_summary[label]['available_count'] += 1
-        else:
-            dorm_summary[label]['available_sum'] += safe_get(unit, 'precio_lista', 0) or 0
-            dorm_summary[label]['available_count'] += 1
-
+    # Barras por dormitorio
     dorm_bars = []
-    for label, stats in dorm_summary.items():
+    for dorms, stats in dorm_summary.items():
+        label = f"{dorms} dor"
         total = stats['sold_count'] + stats['available_count'] + stats['alert_count']
         sold_pct = round((stats['sold_count'] / total) * 100, 1) if total else 0
         sold_avg = stats['sold_sum'] / stats['sold_count'] if stats['sold_count'] else 0
@@ -703,7 +1695,9 @@ def dashboard(project_name):
         'labels': evolutivo_labels,
         'units': evolutivo_units,
         'ticket': evolutivo_ticket,
-        'price_m2': evolutivo_precio_m2
+        'ticket_pen': evolutivo_ticket_pen,
+        'price_m2': evolutivo_precio_m2,
+        'price_m2_pen': evolutivo_precio_m2_pen
     }
 
     gauge_data = {
@@ -715,8 +1709,9 @@ def dashboard(project_name):
         'meta_provisional': meta_provisional
     }
 
-    return render_template(
-        'dashboard.html',
+    return dict(
+        data_version=data_version,
+        as_of=get_as_of(),
         all_projects=all_projects,
         current_project=project_name,
         summary_cards=summary_cards,
@@ -725,155 +1720,358 @@ def dashboard(project_name):
         layout_overview=layout_overview,
         gauge=gauge_data,
         meta_provisional=meta_provisional,
+        forecast=get_sales_forecast(project_name),
         color_palette=color_palette
     )
 
-# --- 7. RUTA PRINCIPAL PARA LA PARRILLA DE PRECIOS ---
-@app.route('/pricing/<project_name>')
-def pricing(project_name):
-    tipologia_filtro = request.args.getlist('tipologia')
-    # Limpiar la lista de tipologías (remover valores vacíos)
-    tipologia_filtro = [t for t in tipologia_filtro if t.strip()]
-    vista_actual = request.args.get('vista', 'precio')
-    
+
+@app.route('/dashboard/<project_name>')
+def dashboard(project_name):
+    # Peticiones idénticas simultáneas (mismo proyecto y misma versión de datos) comparten un solo cálculo
+    context = _inflight.do(
+        ('dashboard', get_current_tenant().id, project_name, get_data_version()), build_dashboard_context, project_name
+    )
+    g.data_version = context['data_version']
+    return render_template('dashboard.html', **context)
+
+
+@app.route('/api/forecast/<project_name>')
+def sales_forecast(project_name):
+    return jsonify(get_sales_forecast(project_name))
+
+
+@app.route('/api/funnel/<project_name>')
+def conversion_funnel(project_name):
+    return jsonify(get_conversion_funnel(project_name))
+
+
+@app.route('/api/absorcion')
+def absorption():
+    por_dormitorios = request.args.get('dormitorios') in ('1', 'true', 'si')
+    data = get_absorption_curves(por_dormitorios)
+    proyectos = [p for p in request.args.getlist('proyecto') if p.strip()]
+    if proyectos:
+        data = {**data, 'grupos': [g for g in data['grupos'] if g['proyecto'] in proyectos]}
+    return jsonify(data)
+
+
+@app.route('/api/novedades/<project_name>')
+def load_changes(project_name):
+    cargas = min(max(request.args.get('cargas', 1, type=int), 1), NOVEDADES_CARGAS_MAX)
+    return jsonify(get_novedades(project_name, cargas=cargas))
+
+
+@app.route('/api/comparables/<project_name>')
+def market_comparables(project_name):
+    k = min(max(request.args.get('k', 10, type=int), 1), 50)
+    nivel = 'unidad' if request.args.get('nivel') == 'unidad' else 'tipologia'
+    return jsonify(find_comparables(project_name, k=k, nivel=nivel))
+
+def get_display_status(unit, unidades_con_alerta):
+    """Estado de una unidad en la parrilla y la leyenda: vendido, separado, alerta-subir o disponible."""
+    estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
+    # 1. Primero, los estados comerciales fijos tienen la máxima prioridad.
+    if estado_lower == 'vendido':
+        return 'vendido'
+    if estado_lower in ['separado', 'proceso de separacion']:
+        return 'separado'
+    # 2. Solo si no es vendido ni separado, comprobamos si tiene alerta.
+    if safe_get(unit, 'codigo', '') in unidades_con_alerta:
+        return 'alerta-subir'
+    # 3. Si no cumple ninguna de las anteriores, está disponible.
+    return 'disponible'
+
+
+def get_unit_filters(args):
+    """
+    Filtros por atributo de la petición (estado, dormitorios, piso, area, precio; la tipología
+    va aparte) como tupla ((atributo, valores), ...) ordenada, utilizable como clave de caché.
+    """
+    from unit_filters import UNIT_FILTER_ATTRIBUTES
+
+    filtros = []
+    for attribute in UNIT_FILTER_ATTRIBUTES[1:]:
+        valores = tuple(sorted({v for v in args.getlist(attribute) if v.strip()}))
+        if valores:
+            filtros.append((attribute, valores))
+    return tuple(filtros)
+
+
+@tenant_cached
+def _unit_filter_index_cached(project_name, data_version, rules_version, market_version, today):
+    from unit_filters import UNIT_FILTER_BANDS, UnitFilterIndex, band_keys
+
+    conn = get_db_connection()
+    units = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+    conn.close()
+    unidades_con_alerta = get_alert_evaluation(project_name)['unidades']
+
+    # El precio de la leyenda es el de venta para las vendidas y el de lista para las demás
+    precio = [
+        (safe_get(u, 'precio_venta', 0) or 0) if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido'
+        else (safe_get(u, 'precio_lista', 0) or 0)
+        for u in units
+    ]
+    area = [safe_get(u, 'area_techada', 0) or 0 for u in units]
+    dormitorios = [get_total_habitaciones_from_unit(u, project_name) for u in units]
+    pisos = [parse_int(''.join(filter(str.isdigit, str(safe_get(u, 'piso', '') or '')))) for u in units]
+    return UnitFilterIndex(
+        codigos=[safe_get(u, 'codigo', '') for u in units],
+        atributos={
+            'tipologia': [safe_get(u, 'nombre_tipologia', '') or '' for u in units],
+            'estado': [get_display_status(u, unidades_con_alerta) for u in units],
+            'dormitorios': [str(d) if d > 0 else '' for d in dormitorios],
+            'piso': band_keys(pisos, UNIT_FILTER_BANDS['piso']),
+            'area': band_keys(area, UNIT_FILTER_BANDS['area']),
+            'precio': band_keys(precio, UNIT_FILTER_BANDS['precio']),
+        },
+        precio=precio,
+        area=area,
+        proformas=[safe_get(u, 'proformas_count', 0) or 0 for u in units],
+    )
+
+
+def get_unit_filter_index(project_name):
+    """Índice de bitmaps de los filtros de la parrilla (ver unit_filters.py), uno por versión de datos."""
+    return _unit_filter_index_cached(
+        project_name, get_data_version(), alert_rules_version(), competencia_file_version(), get_reference_date()
+    )
+
+
+def build_grid_unit(unit, display_status, tipo_cambio_por_unidad, css_class=''):
+    """Celda de la parrilla (y fila de la exportación) de una unidad."""
+    return {
+        'codigo': safe_get(unit, 'codigo', ''), 
+        'estado_comercial': safe_get(unit, 'estado_comercial', ''),
+        'precio_venta': safe_get(unit, 'precio_venta', 0) or 0, 
+        'precio_venta_pen': round((safe_get(unit, 'precio_venta', 0) or 0) * tipo_cambio_por_unidad[safe_get(unit, 'codigo', '')], 2),
+        'precio_lista': safe_get(unit, 'precio_lista', 0) or 0,
+        'precio_m2': safe_get(unit, 'precio_m2', 0) or 0, 
+        'nombre_tipologia': safe_get(unit, 'nombre_tipologia', ''), 
+        'display_status': display_status, # CAMBIADO: de 'alerta_status' a 'display_status'
+        'proformas_count': safe_get(unit, 'proformas_count', 0) or 0, 
+        'css_class': css_class,
+        'area_techada': safe_get(unit, 'area_techada', 0) or 0
+    }
+
+
+def build_approval_row(tipologia_name, units_in_tipo, project_name, conn, tipologia_dorm_map, competencia_metrics,
+                       alertas, tipo_cambio_por_unidad):
+    """Fila de la tabla de aprobación de una tipología a partir de sus unidades."""
+    unidades_con_alerta = alertas['unidades']
+    total_proformas = sum(safe_get(u, 'proformas_count', 0) or 0 for u in units_in_tipo)
+    precios_m2 = [safe_get(u, 'precio_m2', 0) or 0 for u in units_in_tipo if safe_get(u, 'precio_m2', 0) and safe_get(u, 'precio_m2', 0) > 0]
+    avg_precio_m2 = sum(precios_m2) / len(precios_m2) if precios_m2 else 0
+    suggested_price = avg_precio_m2 * 1.04 if avg_precio_m2 else 0
+    sold_units_tipo = [
+        u for u in units_in_tipo
+        if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido'
+    ]
+    precio_venta_m2_values = []
+    for u in sold_units_tipo:
+        area_unit = safe_get(u, 'area_techada', 0) or 0
+        precio_venta_unit = safe_get(u, 'precio_venta', 0) or 0
+        if area_unit and area_unit > 0 and precio_venta_unit and precio_venta_unit > 0:
+            precio_venta_m2_values.append(
+                precio_venta_unit / area_unit * tipo_cambio_por_unidad[safe_get(u, 'codigo', '')]
+            )
+    avg_precio_venta_m2_pen = (
+        round(sum(precio_venta_m2_values) / len(precio_venta_m2_values), 2)
+        if precio_venta_m2_values else 0
+    )
+    total_count = len(units_in_tipo)
+    available_count = sum(1 for u in units_in_tipo if safe_get(u, 'estado_comercial', '').lower() != 'vendido')
+    has_alert = any(safe_get(u, 'codigo', '') in unidades_con_alerta for u in units_in_tipo)
+    # Precio de lista promedio de las unidades que escala una aprobación por tipología (ver _price_updates_for)
+    precios_lista = [
+        safe_get(u, 'precio_lista', 0) for u in units_in_tipo
+        if (safe_get(u, 'estado_comercial', '') or '').lower() not in ESTADOS_NO_DISPONIBLES
+        and (safe_get(u, 'precio_lista', 0) or 0) > 0
+    ]
+    precio_lista_promedio = round(sum(precios_lista) / len(precios_lista), 2) if precios_lista else None
+
+    # Calcular velocidad de venta
+    velocidad_promedio = calculate_velocity(units_in_tipo, project_name, conn)
+    dorm_key = tipologia_dorm_map.get(tipologia_name)
+    competencia = competencia_metrics.get(dorm_key) if dorm_key else None
+    precio_mercado = round(competencia['precio_promedio'], 0) if competencia else None
+    velocidad_mercado = round(competencia['velocidad_promedio'], 3) if competencia else None
+
+    return {
+        'tipologia': tipologia_name,
+        'unidades_disponibles_str': f"{available_count}/{total_count}",
+        'total_proformas': total_proformas,
+        'avg_precio_m2': avg_precio_m2,
+        'velocidad_promedio': velocidad_promedio,
+        'precio_venta_promedio_m2_pen': avg_precio_venta_m2_pen,
+        'precio_promedio_mercado': precio_mercado,
+        'velocidad_venta_mercado': velocidad_mercado,
+        'dormitorios': dorm_key,
+        'precio_sugerido': suggested_price,
+        'precio_lista_promedio': precio_lista_promedio,
+        'has_alert': has_alert,
+        'triggers': alertas['triggers'].get(tipologia_name, ()),
+    }
+
+
+def iter_approval_rows(project_name):
+    """
+    Filas de la tabla de aprobación generadas tipología por tipología, cada una con sus propias
+    unidades: las exportaciones no cargan el proyecto completo en memoria.
+    """
+    tipologia_dorm_map = get_tipologia_dorm_map(project_name)
+    competencia_metrics = load_competencia_metrics()
+    alertas = get_alert_evaluation(project_name)
+    conn = get_db_connection()
+    try:
+        tipologias = [row[0] for row in conn.execute("""
+            SELECT DISTINCT nombre_tipologia FROM unidades
+            WHERE nombre_proyecto = ? AND nombre_tipologia IS NOT NULL AND nombre_tipologia <> ''
+            ORDER BY nombre_tipologia
+        """, (project_name,))]
+        for tipologia_name in tipologias:
+            units_in_tipo = conn.execute(
+                "SELECT * FROM unidades WHERE nombre_proyecto = ? AND nombre_tipologia = ? ORDER BY rowid",
+                (project_name, tipologia_name)
+            ).fetchall()
+            yield build_approval_row(
+                tipologia_name, units_in_tipo, project_name, conn, tipologia_dorm_map, competencia_metrics, alertas,
+                get_exchange_rate_by_unit(units_in_tipo)
+            )
+    finally:
+        conn.close()
+
+
+def floor_sort_key(piso):
+    """Orden de los pisos en la parrilla (de arriba hacia abajo): los dígitos del piso como número."""
+    try:
+        return int(''.join(filter(str.isdigit, piso or '0')))
+    except ValueError:
+        return 0
+
+
+def iter_grid_rows(project_name, codigos=None):
+    """
+    Unidades de la parrilla como (piso, celda), en el orden de la parrilla y leídas por bloques
+    del cursor: el orden por piso lo resuelve SQLite, así que la exportación no arma la parrilla
+    completa en memoria. Con `codigos` solo se generan esas unidades (las que pasan los filtros).
+    """
+    unidades_con_alerta = get_alert_evaluation(project_name)['unidades']
+    conn = get_db_connection()
+    conn.create_function('orden_piso', 1, floor_sort_key, deterministic=True)
+    try:
+        cursor = conn.execute("""
+            SELECT * FROM (
+                SELECT *, MIN(rowid) OVER (PARTITION BY piso) AS _primera_fila, rowid AS _fila
+                FROM unidades WHERE nombre_proyecto = ?
+            )
+            ORDER BY orden_piso(piso) DESC, _primera_fila, _fila
+        """, (project_name,))
+        while True:
+            units = cursor.fetchmany(EXPORT_FETCH_ROWS)
+            if not units:
+                break
+            tipo_cambio_por_unidad = get_exchange_rate_by_unit(units)
+            for unit in units:
+                if codigos is not None and safe_get(unit, 'codigo', '') not in codigos:
+                    continue
+                display_status = get_display_status(unit, unidades_con_alerta)
+                yield safe_get(unit, 'piso', ''), build_grid_unit(unit, display_status, tipo_cambio_por_unidad)
+    finally:
+        conn.close()
+
+
+def build_export_context(project_name, tipologia_filtro=None, filtros=()):
+    """
+    Contexto de las exportaciones: la parrilla y la tabla de aprobación como generadores que
+    leen de la base al consumirse, y la leyenda y el sidebar (del índice de bitmaps, sin recorrer
+    las unidades). La parrilla, la leyenda y el sidebar llevan los mismos filtros aplicados.
+    """
+    filter_index = get_unit_filter_index(project_name)
+    seleccion = (('tipologia', tuple(tipologia_filtro or ())),) + tuple(filtros or ())
+    mask = filter_index.mask(seleccion)
+    sidebar_stats, _, legend_stats = filter_index.stats(mask)
+    codigos = None
+    if any(valores for _, valores in seleccion):
+        codigos = {codigo for codigo, posicion in filter_index.posicion.items() if mask[posicion]}
+    return {
+        'grid_units': iter_grid_rows(project_name, codigos),
+        'approval_table_data': iter_approval_rows(project_name),
+        'legend_stats': legend_stats,
+        'sidebar_stats': sidebar_stats,
+    }
+
+
+def build_pricing_context(project_name, tipologia_filtro=None, vista_actual='precio', max_columns_param=None,
+                          filtros=()):
+    """
+    Calcula todo el contexto de la parrilla de precios de un proyecto: grid por piso,
+    estadísticas del sidebar y la leyenda, y la tabla de aprobación por tipología.
+    `filtros` son los filtros por atributo de get_unit_filters, que se suman al de tipologías.
+    Lo usan tanto la vista HTML como las exportaciones.
+    """
+    tipologia_filtro = tipologia_filtro or []
+    filtros = tuple(filtros or ())
+    data_version = get_project_version(project_name)
     conn = get_db_connection()
-    all_projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto").fetchall()
+    # Selector de proyectos: siempre los actuales (una consulta histórica solo reconstruye este proyecto)
+    all_projects = conn.execute("SELECT DISTINCT nombre_proyecto FROM main.unidades ORDER BY nombre_proyecto").fetchall()
     units_from_db = conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
     conn.close()
 
     if not units_from_db:
-        return render_template('pricing_grid.html', grid={}, all_tipologias=[], all_projects=all_projects, current_project=project_name, approval_table_data=[], legend_data={'red': 0, 'green': 0, 'gray': 0})
+        # Proyecto sin unidades (o de otro inquilino): parrilla vacía con estadísticas en cero
+        empty_stats = {'unidades': 0, 'precio': 0, 'area': 0, 'proformas': 0}
+        return {
+            'data_version': data_version,
+            'as_of': get_as_of(),
+            'grid': {}, 'all_tipologias': [], 'all_projects': all_projects, 'current_project': project_name,
+            'tipologia_filtro': tipologia_filtro, 'vista_actual': vista_actual, 'max_columns': 0,
+            'filtros_activos': dict(filtros), 'filter_facets': {}, 'filter_titles': {},
+            'approval_table_data': [], 'legend_data': {'red': 0, 'green': 0, 'gray': 0, 'yellow': 0},
+            'sidebar_stats': {'total_unidades': 0, 'suma_precio': 0, 'suma_area_total': 0, 'suma_proformas': 0},
+            'legend_stats': {color: dict(empty_stats) for color in ('red', 'green', 'yellow', 'gray')}
+        }
 
     all_tipologias = sorted(list(set(safe_get(u, 'nombre_tipologia', '') for u in units_from_db if safe_get(u, 'nombre_tipologia'))))
     
     tipologias_data_grouped = {t: [u for u in units_from_db if safe_get(u, 'nombre_tipologia', '') == t] for t in all_tipologias}
-    tipologia_dorm_map = build_tipologia_dorm_map(tipologias_data_grouped, project_name)
+    tipologia_dorm_map = get_tipologia_dorm_map(project_name)
     competencia_metrics = load_competencia_metrics()
-    unidades_con_alerta = set()
-    for tipologia, units_in_tipo in tipologias_data_grouped.items():
-        total_units = len(units_in_tipo)
-        sold_units = sum(1 for u in units_in_tipo if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido')
-        sold_percentage = (sold_units / total_units * 100) if total_units > 0 else 0
-        if sold_percentage >= 20.0:
-            for u in units_in_tipo:
-                # --- LÓGICA DE ALERTA CORREGIDA ---
-                # La alerta solo debe aplicar a unidades DISPONIBLES, no a las separadas.
-                estado_lower = (safe_get(u, 'estado_comercial', '') or '').lower()
-                if estado_lower not in ['vendido', 'separado', 'proceso de separacion']:
-                    unidades_con_alerta.add(safe_get(u, 'codigo', ''))
+    # Reglas de alerta (alert_rules.json); la alerta solo aplica a unidades DISPONIBLES
+    alertas = get_alert_evaluation(project_name)
+    unidades_con_alerta = alertas['unidades']
 
     approval_table_data = []
-    
-    # Calcular estadísticas dinámicas basadas en filtros de tipologías
-    filtered_units = units_from_db
-    if tipologia_filtro:
-        # Si hay filtros específicos, filtrar las unidades
-        filtered_units = [u for u in units_from_db if safe_get(u, 'nombre_tipologia', '') in tipologia_filtro]
-    
-    # Calcular estadísticas para el sidebar basadas en unidades filtradas
-    sidebar_stats = {
-        'total_unidades': len(filtered_units),
-        'suma_precio': sum(
-            (safe_get(u, 'precio_venta', 0) or 0) if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido' 
-            else (safe_get(u, 'precio_lista', 0) or 0) 
-            for u in filtered_units
-        ),
-        'suma_area_total': sum(safe_get(u, 'area_techada', 0) or 0 for u in filtered_units),
-        'suma_proformas': sum(safe_get(u, 'proformas_count', 0) or 0 for u in filtered_units)
-    }
-    
-    # Calcular legend_data basado en unidades filtradas
-    legend_data = {'red': 0, 'green': 0, 'gray': 0, 'yellow': 0}
-    legend_stats = {
-        'red': {'unidades': 0, 'precio': 0, 'area': 0, 'proformas': 0},
-        'green': {'unidades': 0, 'precio': 0, 'area': 0, 'proformas': 0},
-        'yellow': {'unidades': 0, 'precio': 0, 'area': 0, 'proformas': 0},
-        'gray': {'unidades': 0, 'precio': 0, 'area': 0, 'proformas': 0}
+
+    # Filtros combinados (tipologías y atributos): OR dentro de cada atributo y AND entre atributos
+    # sobre los bitmaps del índice; sidebar y leyenda se reducen sobre la máscara resultante
+    from unit_filters import UNIT_FILTER_TITLES
+
+    filter_index = get_unit_filter_index(project_name)
+    seleccion = (('tipologia', tuple(tipologia_filtro)),) + filtros
+    filtrando = any(valores for _, valores in seleccion)
+    mask = filter_index.mask(seleccion)
+    sidebar_stats, legend_data, legend_stats = filter_index.stats(mask)
+    filter_facets = {
+        attribute: opciones for attribute, opciones in filter_index.facets(seleccion).items() if attribute != 'tipologia'
     }
-    
-    # Procesar cada unidad filtrada para calcular estadísticas por estado
-    for unit in filtered_units:
-        estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
-        precio = (safe_get(unit, 'precio_venta', 0) or 0) if estado_lower == 'vendido' else (safe_get(unit, 'precio_lista', 0) or 0)
-        area = safe_get(unit, 'area_techada', 0) or 0
-        proformas = safe_get(unit, 'proformas_count', 0) or 0
-        
-        if estado_lower == 'vendido':
-            legend_data['gray'] += 1
-            legend_stats['gray']['unidades'] += 1
-            legend_stats['gray']['precio'] += precio
-            legend_stats['gray']['area'] += area
-            legend_stats['gray']['proformas'] += proformas
-        elif estado_lower in ['separado', 'proceso de separacion']:
-            legend_data['yellow'] += 1
-            legend_stats['yellow']['unidades'] += 1
-            legend_stats['yellow']['precio'] += precio
-            legend_stats['yellow']['area'] += area
-            legend_stats['yellow']['proformas'] += proformas
-        elif safe_get(unit, 'codigo', '') in unidades_con_alerta:
-            legend_data['red'] += 1
-            legend_stats['red']['unidades'] += 1
-            legend_stats['red']['precio'] += precio
-            legend_stats['red']['area'] += area
-            legend_stats['red']['proformas'] += proformas
-        else:
-            legend_data['green'] += 1
-            legend_stats['green']['unidades'] += 1
-            legend_stats['green']['precio'] += precio
-            legend_stats['green']['area'] += area
-            legend_stats['green']['proformas'] += proformas
-    
+
+    # Tipo de cambio de la fecha de venta de cada unidad, en una sola búsqueda vectorizada
+    tipo_cambio_por_unidad = get_exchange_rate_by_unit(units_from_db)
+
     # Obtener conexión para calcular velocidades
     conn = get_db_connection()
     
     for tipologia_name, units_in_tipo in tipologias_data_grouped.items():
-        total_proformas = sum(safe_get(u, 'proformas_count', 0) or 0 for u in units_in_tipo)
-        precios_m2 = [safe_get(u, 'precio_m2', 0) or 0 for u in units_in_tipo if safe_get(u, 'precio_m2', 0) and safe_get(u, 'precio_m2', 0) > 0]
-        avg_precio_m2 = sum(precios_m2) / len(precios_m2) if precios_m2 else 0
-        suggested_price = avg_precio_m2 * 1.04 if avg_precio_m2 else 0
-        sold_units_tipo = [
-            u for u in units_in_tipo
-            if (safe_get(u, 'estado_comercial', '') or '').lower() == 'vendido'
-        ]
-        precio_venta_m2_values = []
-        for u in sold_units_tipo:
-            area_unit = safe_get(u, 'area_techada', 0) or 0
-            precio_venta_unit = safe_get(u, 'precio_venta', 0) or 0
-            if area_unit and area_unit > 0 and precio_venta_unit and precio_venta_unit > 0:
-                precio_venta_m2_values.append(precio_venta_unit / area_unit)
-        avg_precio_venta_m2_pen = (
-            round((sum(precio_venta_m2_values) / len(precio_venta_m2_values)) * DEFAULT_EXCHANGE_RATE_PEN, 2)
-            if precio_venta_m2_values else 0
-        )
-        total_count = len(units_in_tipo)
-        available_count = sum(1 for u in units_in_tipo if safe_get(u, 'estado_comercial', '').lower() != 'vendido')
-        has_alert = any(safe_get(u, 'codigo', '') in unidades_con_alerta for u in units_in_tipo)
-        
-        # Calcular velocidad de venta
-        velocidad_promedio = calculate_velocity(units_in_tipo, project_name, conn)
-        dorm_key = tipologia_dorm_map.get(tipologia_name)
-        competencia = competencia_metrics.get(dorm_key) if dorm_key else None
-        precio_mercado = round(competencia['precio_promedio'], 0) if competencia else None
-        velocidad_mercado = round(competencia['velocidad_promedio'], 3) if competencia else None
-        
-        approval_table_data.append({
-            'tipologia': tipologia_name,
-            'unidades_disponibles_str': f"{available_count}/{total_count}",
-            'total_proformas': total_proformas,
-            'avg_precio_m2': avg_precio_m2,
-            'velocidad_promedio': velocidad_promedio,
-            'precio_venta_promedio_m2_pen': avg_precio_venta_m2_pen,
-            'precio_promedio_mercado': precio_mercado,
-            'velocidad_venta_mercado': velocidad_mercado,
-            'dormitorios': dorm_key,
-            'precio_sugerido': suggested_price,
-            'has_alert': has_alert,
-        })
+        approval_table_data.append(build_approval_row(
+            tipologia_name, units_in_tipo, project_name, conn, tipologia_dorm_map, competencia_metrics, alertas,
+            tipo_cambio_por_unidad
+        ))
     
     conn.close()
 
     # Obtener max_columns: usar parámetro si está disponible, sino usar cache
-    max_columns_param = request.args.get('max_columns')
     if max_columns_param:
         max_columns = int(max_columns_param)
     else:
@@ -881,47 +2079,17 @@ def pricing(project_name):
     
     grid_data = {}
     for unit in units_from_db:
-        # --- LÓGICA DE ESTADO CORREGIDA Y REORDENADA ---
-        estado_lower = (safe_get(unit, 'estado_comercial', '') or '').lower()
-        display_status = ''
-        
-        # 1. Primero, los estados comerciales fijos tienen la máxima prioridad.
-        if estado_lower == 'vendido':
-            display_status = 'vendido'
-        elif estado_lower in ['separado', 'proceso de separacion']:
-            display_status = 'separado'
-        
-        # 2. Solo si no es vendido ni separado, comprobamos si tiene alerta.
-        elif safe_get(unit, 'codigo', '') in unidades_con_alerta:
-            display_status = 'alerta-subir'
-            
-        # 3. Si no cumple ninguna de las anteriores, está disponible.
-        else:
-            display_status = 'disponible'
-        # --- FIN DE LÓGICA CORREGIDA ---
+        display_status = get_display_status(unit, unidades_con_alerta)
 
         piso = safe_get(unit, 'piso', '')
         if piso not in grid_data: grid_data[piso] = []
         
-        # Lógica de filtrado mejorada
-        if not tipologia_filtro:
-            # Si no hay filtro, no difuminar
-            css_class = ''
+        # Con filtros activos se difuminan las unidades que quedan fuera de la máscara
+        if filtrando and not mask[filter_index.posicion[safe_get(unit, 'codigo', '')]]:
+            css_class = 'difuminado'
         else:
-            # Si hay filtros específicos, difuminar las que no están seleccionadas
-            css_class = 'difuminado' if safe_get(unit, 'nombre_tipologia', '') not in tipologia_filtro else ''
-        processed_unit = {
-            'codigo': safe_get(unit, 'codigo', ''), 
-            'estado_comercial': safe_get(unit, 'estado_comercial', ''),
-            'precio_venta': safe_get(unit, 'precio_venta', 0) or 0, 
-            'precio_lista': safe_get(unit, 'precio_lista', 0) or 0,
-            'precio_m2': safe_get(unit, 'precio_m2', 0) or 0, 
-            'nombre_tipologia': safe_get(unit, 'nombre_tipologia', ''), 
-            'display_status': display_status, # CAMBIADO: de 'alerta_status' a 'display_status'
-            'proformas_count': safe_get(unit, 'proformas_count', 0) or 0, 
-            'css_class': css_class,
-            'area_techada': safe_get(unit, 'area_techada', 0) or 0
-        }
+            css_class = ''
+        processed_unit = build_grid_unit(unit, display_status, tipo_cambio_por_unidad, css_class)
         grid_data[piso].append(processed_unit)
 
     try:
@@ -939,6 +2107,7 @@ def pricing(project_name):
                 'codigo': '', 
                 'estado_comercial': '',
                 'precio_venta': 0, 
+                'precio_venta_pen': 0,
                 'precio_lista': 0,
                 'precio_m2': 0, 
                 'nombre_tipologia': '', 
@@ -949,59 +2118,720 @@ def pricing(project_name):
             })
         sorted_grid_data[floor] = units_in_floor
 
+    return {
+        'data_version': data_version, 'as_of': get_as_of(),
+        # Una consulta histórica o un paquete sin conexión no admiten aprobar precios
+        'aprobacion_habilitada': not get_as_of() and not get_current_tenant().solo_lectura,
+        'grid': sorted_grid_data, 'all_tipologias': all_tipologias,
+        'all_projects': all_projects, 'current_project': project_name,
+        'tipologia_filtro': tipologia_filtro, 'vista_actual': vista_actual,
+        'filtros_activos': dict(filtros), 'filter_facets': filter_facets, 'filter_titles': UNIT_FILTER_TITLES,
+        'max_columns': max_columns,
+        'approval_table_data': approval_table_data,
+        'legend_data': legend_data, 'sidebar_stats': sidebar_stats, 'legend_stats': legend_stats
+    }
+
+
+def get_pricing_context(project_name, tipologia_filtro=None, vista_actual='precio', max_columns_param=None,
+                        filtros=()):
+    """
+    build_pricing_context coalescido: si llegan varias peticiones con el mismo proyecto, versión
+    de datos y parámetros de vista mientras se calcula, todas reciben el mismo contexto.
+    El contexto compartido es de solo lectura para quien lo recibe.
+    """
+    key = (
+        'pricing', get_current_tenant().id, project_name, get_data_version(),
+        tuple(tipologia_filtro or ()), vista_actual, max_columns_param, tuple(filtros or ())
+    )
+    return _inflight.do(
+        key, build_pricing_context, project_name, tipologia_filtro, vista_actual, max_columns_param, filtros
+    )
+
+
+def grid_page(context, desde=0):
+    """
+    Página de pisos de la parrilla que empieza en el piso `desde` (en orden de la parrilla):
+    {'floors': [(piso, unidades), ...], 'next_floor_offset': inicio de la siguiente página o None}.
+    """
+    floors = list(context.get('grid', {}).items())
+    if GRID_PAGE_FLOORS <= 0:
+        return {'floors': floors[desde:], 'next_floor_offset': None}
+    hasta = desde + GRID_PAGE_FLOORS
+    return {'floors': floors[desde:hasta], 'next_floor_offset': hasta if hasta < len(floors) else None}
+
+
+@tenant_cached
+def _grid_fragments_cached(project_name, tipologias, filtros, vista_actual, max_columns_param, *versions):
+    """
+    Renderiza de una vez todas las páginas de pisos posteriores a la primera ({desde: html}),
+    para que cada rango pedido al hacer scroll no vuelva a calcular la parrilla completa.
+    """
+    context = get_pricing_context(project_name, list(tipologias), vista_actual, max_columns_param, filtros)
+    total_floors = len(context.get('grid', {}))
+    if GRID_PAGE_FLOORS <= 0:
+        return {}
+    return {
+        desde: render_template('_grid_floors.html', **context, **grid_page(context, desde))
+        for desde in range(GRID_PAGE_FLOORS, total_floors, GRID_PAGE_FLOORS)
+    }
+
+
+# --- 7. RUTA PRINCIPAL PARA LA PARRILLA DE PRECIOS ---
+@app.route('/pricing/<project_name>')
+def pricing(project_name):
+    tipologia_filtro = request.args.getlist('tipologia')
+    # Limpiar la lista de tipologías (remover valores vacíos)
+    tipologia_filtro = [t for t in tipologia_filtro if t.strip()]
+    vista_actual = request.args.get('vista', 'precio')
+
+    context = get_pricing_context(
+        project_name, tipologia_filtro, vista_actual, request.args.get('max_columns'), get_unit_filters(request.args)
+    )
+    # El contexto es compartido (single-flight): se copia antes de agregar la primera página de pisos
+    context = dict(context, **grid_page(context))
+    g.data_version = context.get('data_version')
+    if not context['grid']:
+        return render_template('pricing_grid.html', **context)
+
     # --- INICIO DE LA CORRECCIÓN ---
     if request.headers.get('HX-Request') == 'true':
         hx_target = request.headers.get('HX-Target', '')
         
         # Si el target es solo el grid, devolver el grid con actualizaciones OOB del sidebar y botón
         if hx_target == 'grid-container':
-            return render_template('_grid_with_oob_updates.html',
-                                   grid=sorted_grid_data, vista_actual=vista_actual, 
-                                   max_columns=max_columns, tipologia_filtro=tipologia_filtro,
-                                   all_tipologias=all_tipologias, current_project=project_name,
-                                   legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
+            return render_template('_grid_with_oob_updates.html', **context)
         # Si el target es el sidebar, devolver solo el sidebar
         elif hx_target == 'sidebar-stats':
-            return render_template('_sidebar_stats.html',
-                                   legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
+            return render_template('_sidebar_stats.html', **context)
         # Si el target es el texto del botón de tipologías
         elif hx_target == 'tipologia-button-text':
-            return render_template('_tipologia_button_text.html',
-                                   tipologia_filtro=tipologia_filtro)
-        # Si el target incluye pricing-content-wrapper y sidebar-stats (filtro de tipologías)
-        elif 'pricing-content-wrapper' in hx_target and 'sidebar-stats' in hx_target:
-            return render_template('_grid_and_sidebar.html',
-                                   grid=sorted_grid_data, all_tipologias=all_tipologias,
-                                   current_project=project_name, tipologia_filtro=tipologia_filtro,
-                                   vista_actual=vista_actual, max_columns=max_columns,
-                                   approval_table_data=approval_table_data,
-                                   legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
-        # Si el target incluye múltiples elementos (grid-container, sidebar-stats)
-        elif 'grid-container' in hx_target and 'sidebar-stats' in hx_target:
-            return render_template('_grid_and_sidebar.html',
-                                   grid=sorted_grid_data, all_tipologias=all_tipologias,
-                                   current_project=project_name, tipologia_filtro=tipologia_filtro,
-                                   vista_actual=vista_actual, max_columns=max_columns,
-                                   approval_table_data=approval_table_data,
-                                   legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
+            return render_template('_tipologia_button_text.html', **context)
+        # En cualquier otro caso (filtro de tipologías, grid + sidebar o contenido completo)
+        # se devuelven los filtros, el grid y el sidebar
         else:
-            # Si no, devolver todo el contenido de filtros y grid
-            return render_template('_grid_and_sidebar.html',
-                                   grid=sorted_grid_data, all_tipologias=all_tipologias,
-                                   current_project=project_name, tipologia_filtro=tipologia_filtro,
-                                   vista_actual=vista_actual, max_columns=max_columns,
-                                   approval_table_data=approval_table_data,
-                                   legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
+            return render_template('_grid_and_sidebar.html', **context)
     else:
-        return render_template('pricing_grid.html', 
-                               grid=sorted_grid_data, all_tipologias=all_tipologias,
-                               all_projects=all_projects, current_project=project_name,
-                               tipologia_filtro=tipologia_filtro, vista_actual=vista_actual,
-                               max_columns=max_columns,
-                               approval_table_data=approval_table_data,
-                               legend_data=legend_data, sidebar_stats=sidebar_stats, legend_stats=legend_stats)
+        return render_template('pricing_grid.html', **context)
     # --- FIN DE LA CORRECCIÓN ---
 
-# --- 8. INICIO DE LA APLICACIÓN ---
+
+@app.route('/pricing/<project_name>/pisos')
+def pricing_floors(project_name):
+    """Siguiente rango de pisos de la parrilla; lo pide el marcador del final con hx-trigger="revealed"."""
+    tipologia_filtro = tuple(t for t in request.args.getlist('tipologia') if t.strip())
+    fragments = _grid_fragments_cached(
+        project_name, tipologia_filtro, get_unit_filters(request.args),
+        request.args.get('vista', 'precio'), request.args.get('max_columns'),
+        get_data_version(), alert_rules_version(), competencia_file_version(), get_reference_date()
+    )
+    response = Response(fragments.get(request.args.get('desde', 0, type=int), ''), mimetype='text/html')
+    if request.args.get('v') and request.args.get('v') == get_project_version(project_name):
+        response.cache_control.private = True
+        response.cache_control.max_age = GRID_FRAGMENT_MAX_AGE
+    return response
+
+
+# --- ACTUALIZACIÓN DE PRECIOS ---
+class PriceVersionConflict(Exception):
+    """El proyecto cambió desde la versión que vio el cliente; args[0] es la versión actual."""
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _read_price_changes(nivel):
+    """
+    Cambios de la petición como [(clave, precio)]: JSON {"proyecto", "version", "cambios": [...]}
+    o un formulario con un solo cambio. La clave es el código de unidad o la tipología; el precio,
+    precio_lista de la unidad o precio_promedio de las disponibles de la tipología.
+    """
+    clave_campo, precio_campo = PRICE_UPDATE_FIELDS[nivel]
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError(["Se espera un objeto JSON con 'proyecto', 'version' y 'cambios'."])
+        cambios = data.get('cambios') or []
+    else:
+        data = request.form
+        cambios = [{clave_campo: data.get(clave_campo), precio_campo: data.get(precio_campo)}]
+    if not isinstance(cambios, list) or not cambios or len(cambios) > PRICE_UPDATE_MAX_CHANGES:
+        raise ValueError([f"Se esperan entre 1 y {PRICE_UPDATE_MAX_CHANGES} cambios."])
+
+    parsed, errores, vistos = [], [], set()
+    for n, cambio in enumerate(cambios, start=1):
+        if not isinstance(cambio, dict):
+            errores.append(f"Cambio {n}: se espera un objeto con '{clave_campo}' y '{precio_campo}'.")
+            continue
+        clave = str(cambio.get(clave_campo) or '').strip()
+        try:
+            precio = float(cambio.get(precio_campo))
+        except (TypeError, ValueError):
+            precio = float('nan')
+        if not clave:
+            errores.append(f"Falta '{clave_campo}'.")
+        elif clave in vistos:
+            errores.append(f"{clave}: cambio repetido.")
+        elif not math.isfinite(precio) or precio <= 0:
+            errores.append(f"{clave}: '{precio_campo}' debe ser un número positivo.")
+        else:
+            parsed.append((clave, precio))
+        vistos.add(clave)
+    if errores:
+        raise ValueError(errores)
+    return str(data.get('proyecto') or '').strip(), str(data.get('version') or '').strip(), parsed
+
+
+def _price_updates_for(nivel, units, cambios):
+    """
+    Nuevos precios de lista [(unidad, precio_nuevo)] para los cambios pedidos. Por tipología, los
+    precios de sus unidades disponibles se escalan para que su promedio sea el precio pedido.
+    """
+    disponibles = {
+        codigo: u for codigo, u in units.items()
+        if (u['estado_comercial'] or '').lower() not in ESTADOS_NO_DISPONIBLES
+    }
+    updates, errores = [], []
+    if nivel == 'unidad':
+        for codigo, precio in cambios:
+            if codigo not in units:
+                errores.append(f"{codigo}: unidad desconocida en el proyecto.")
+            elif codigo not in disponibles:
+                errores.append(f"{codigo}: la unidad no está disponible ({units[codigo]['estado_comercial']}).")
+            else:
+                updates.append((units[codigo], round(precio, 2)))
+        return updates, errores
+
+    por_tipologia = defaultdict(list)
+    for u in disponibles.values():
+        if (u['precio_lista'] or 0) > 0:
+            por_tipologia[u['nombre_tipologia']].append(u)
+    for tipologia, precio_promedio in cambios:
+        tip_units = por_tipologia.get(tipologia)
+        if not tip_units:
+            errores.append(f"{tipologia}: la tipología no tiene unidades disponibles con precio.")
+            continue
+        factor = precio_promedio / (sum(u['precio_lista'] for u in tip_units) / len(tip_units))
+        updates.extend((u, round(u['precio_lista'] * factor, 2)) for u in tip_units)
+    return updates, errores
+
+
+def apply_price_updates(project_name, nivel, cambios, version):
+    """
+    Aplica los cambios de precio de lista de un proyecto en una sola transacción. La versión que
+    envió el cliente se compara con la actual dentro de la transacción (bloqueo de escritura
+    tomado), así que un lote basado en datos desactualizados se rechaza completo con
+    PriceVersionConflict. Los errores de validación se reportan juntos con ValueError.
+
+    El lote se escribe con el bloqueo de escritura de init_db.py tomado (ver db_lock.py): si una
+    carga está reemplazando la base se espera hasta PRICE_UPDATE_LOCK_SECONDS (DBLockTimeout).
+    """
+    db_path = get_db_path()
+    with db_write_lock(db_path, timeout=PRICE_UPDATE_LOCK_SECONDS):
+        return _apply_price_updates_locked(db_path, project_name, nivel, cambios, version)
+
+
+def _apply_price_updates_locked(db_path, project_name, nivel, cambios, version):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        old_data_version = os.stat(db_path).st_mtime_ns
+        current_version = read_project_version(conn, project_name)
+        units = {
+            u['codigo']: u
+            for u in conn.execute("SELECT * FROM unidades WHERE nombre_proyecto = ?", (project_name,)).fetchall()
+        }
+        if not units:
+            raise ValueError([f"Proyecto desconocido: {project_name}"])
+        if version != current_version:
+            raise PriceVersionConflict(current_version)
+        updates, errores = _price_updates_for(nivel, units, cambios)
+        if errores:
+            raise ValueError(errores)
+
+        nuevos = []
+        for unit, precio in updates:
+            valores = dict(unit)
+            valores['precio_lista'] = precio
+            if (unit['area_techada'] or 0) > 0:
+                valores['precio_m2'] = round(precio / unit['area_techada'], 2)
+            nuevos.append(valores)
+        # Las escrituras se acotan al proyecto: una aprobación nunca toca unidades de otro proyecto
+        conn.executemany(
+            "UPDATE unidades SET precio_lista = ?, precio_m2 = ? WHERE codigo = ? AND nombre_proyecto = ?",
+            [(v['precio_lista'], v['precio_m2'], v['codigo'], project_name) for v in nuevos]
+        )
+        # El hash de contenido sigue a la fila, para que la próxima carga compare contra este estado
+        if _table_exists(conn, 'unidad_hashes'):
+            conn.executemany(
+                "UPDATE unidad_hashes SET hash = ? WHERE codigo = ? AND codigo IN ("
+                "SELECT codigo FROM unidades WHERE nombre_proyecto = ?)",
+                [(unit_hash(tuple(v[c] for c in UNIDADES_COLUMNAS)), v['codigo'], project_name) for v in nuevos]
+            )
+        if _table_exists(conn, 'cambios_precio'):
+            fecha = datetime.now().isoformat(timespec='seconds')
+            conn.executemany(
+                "INSERT INTO cambios_precio (fecha, nombre_proyecto, codigo, nombre_tipologia, nivel, precio_anterior, "
+                "precio_nuevo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (fecha, project_name, unit['codigo'], unit['nombre_tipologia'], nivel, unit['precio_lista'], precio)
+                    for unit, precio in updates
+                ]
+            )
+        new_version = read_project_version(conn, project_name)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    # La versión de datos es el mtime de la base: se asegura que avance aunque la escritura caiga
+    # en el mismo tick del reloj del sistema de archivos que la anterior
+    new_data_version = max(time.time_ns(), old_data_version + 1)
+    os.utime(db_path, ns=(new_data_version, new_data_version))
+    refresh_caches_after_price_update(project_name, old_data_version, new_data_version, new_version)
+    return {
+        'proyecto': project_name,
+        'version': new_version,
+        'actualizadas': len(updates),
+        'cambios': [
+            {'codigo': unit['codigo'], 'tipologia': unit['nombre_tipologia'],
+             'precio_anterior': unit['precio_lista'], 'precio_nuevo': precio}
+            for unit, precio in updates
+        ],
+    }
+
+
+def refresh_caches_after_price_update(project_name, old_data_version, new_data_version, project_version):
+    """
+    Lleva las entradas cacheadas de la versión anterior a la nueva en lugar de invalidar todo:
+    las que no dependen de precios de lista se reutilizan tal cual, la versión del proyecto se
+    actualiza en el diccionario de versiones y solo se descartan las cachés del proyecto que sí
+    dependen de precios (la evaluación de alertas se recalcula solo para las tipologías tocadas).
+    Afecta a la caché de este proceso; los demás workers ven la nueva versión y recalculan.
+    """
+    def transform(key, value):
+        if old_data_version not in key[1:]:
+            return key, value
+        new_key = tuple(new_data_version if arg == old_data_version else arg for arg in key)
+        if key[0] == '_project_versions_cached':
+            return new_key, {**value, project_name: project_version}
+        if key[0] in PRICE_DEPENDENT_CACHES and key[1] == project_name:
+            return None
+        return new_key, value
+
+    get_tenant_cache().transform_entries(transform)
+
+
+@app.route('/update-price/<nivel>', methods=['POST'])
+def update_price(nivel):
+    """
+    Actualiza precios de lista aprobados, por unidad o por tipología, en un solo lote
+    transaccional con verificación optimista de la versión del proyecto.
+    """
+    if nivel not in PRICE_UPDATE_FIELDS:
+        return "Nivel de actualización no soportado.", 404
+    if get_current_tenant().solo_lectura:
+        return "Los paquetes sin conexión son de solo lectura.", 403
+    try:
+        project_name, version, cambios = _read_price_changes(nivel)
+        result = apply_price_updates(project_name, nivel, cambios, version)
+    except PriceVersionConflict as e:
+        error, status = {'error': 'El proyecto cambió; recarga y vuelve a aprobar.', 'version': e.args[0]}, 409
+    except ValueError as e:
+        error, status = {'errores': e.args[0]}, 422
+    except DBLockTimeout:
+        error, status = {'error': 'Se está cargando una nueva versión de los datos; reintenta en unos segundos.'}, 503
+    else:
+        error = None
+        g.data_version = result['version']
+
+    # Formulario de la tabla de aprobación (HTMX): se devuelve el mismo formulario con el resultado
+    if request.headers.get('HX-Request') and nivel == 'tipologia':
+        return render_price_approval_form(error, None if error else result)
+    if error:
+        return jsonify(error), status
+    return jsonify(result)
+
+
+def render_price_approval_form(error, result):
+    """
+    Formulario de aprobación de una tipología tras enviarlo: con el error, o con el nuevo precio
+    promedio y la nueva versión del proyecto (fuera de banda, en #approval-version). Los errores
+    también responden 200 para que HTMX reemplace el formulario y los muestre.
+    """
+    tipologia = request.form.get('tipologia', '')
+    if error:
+        mensaje = error.get('error') or ' '.join(error.get('errores', ()))
+        row = {'tipologia': tipologia, 'precio_lista_promedio': request.form.get('precio_promedio', '')}
+        return render_template(
+            '_price_approval_form.html', row=row, current_project=request.form.get('proyecto', ''),
+            mensaje=mensaje, error=True
+        )
+    precios = [c['precio_nuevo'] for c in result['cambios']]
+    row = {'tipologia': tipologia, 'precio_lista_promedio': round(sum(precios) / len(precios), 2)}
+    return render_template(
+        '_price_approval_form.html', row=row, current_project=result['proyecto'],
+        mensaje=f"Aprobado: {result['actualizadas']} unidades actualizadas.", nueva_version=result['version']
+    )
+
+
+# --- 8. NOTIFICACIONES DE NUEVAS VERSIONES DE DATOS (SSE) ---
+def _sse_message(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+@app.after_request
+def add_data_version_header(response):
+    """
+    X-Data-Version: versión de los datos del proyecto con que se calculó la respuesta. Permite
+    detectar lecturas obsoletas tras una recarga (ver soak_test.py).
+    """
+    data_version = g.pop('data_version', None)
+    if data_version:
+        response.headers['X-Data-Version'] = data_version
+    return response
+
+
+@app.route('/eventos/<project_name>')
+def data_version_events(project_name):
+    """
+    Canal server-sent events que anuncia cada nueva versión de datos del proyecto.
+    El cliente envía la versión que ya tiene (Last-Event-ID o ?version=) y solo recibe
+    un evento 'data-version' cuando los datos de su proyecto realmente cambian.
+    """
+    known_version = request.headers.get('Last-Event-ID') or request.args.get('version', '')
+
+    def generate():
+        last_version = known_version
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        deadline = time.monotonic() + SSE_STREAM_SECONDS
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            version = get_project_version(project_name)
+            if version and version != last_version:
+                yield _sse_message('data-version', {'project': project_name, 'version': version}, version)
+                last_version = version
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                # Comentario SSE para mantener viva la conexión a través de proxies
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+            time.sleep(SSE_POLL_SECONDS)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+# --- 9. EXPORTACIONES ---
+def _export_filename(project_name, tabla, formato):
+    safe_project = re.sub(r'[^A-Za-z0-9_-]+', '_', project_name).strip('_') or 'proyecto'
+    return f"{safe_project}_{tabla}.{formato}"
+
+
+@app.route('/pricing/<project_name>/export/<tabla>.<formato>')
+def export_pricing_table(project_name, tabla, formato):
+    """Descarga la parrilla, la leyenda o la tabla de aprobación como CSV o XLSX, en streaming."""
+    if tabla not in EXPORT_TABLES or formato not in EXPORT_FORMATS:
+        return "Exportación no soportada.", 404
+    if formato == 'xlsx' and not xlsx_available():
+        return "La exportación a XLSX requiere openpyxl.", 501
+
+    tipologia_filtro = [t for t in request.args.getlist('tipologia') if t.strip()]
+    context = build_export_context(project_name, tipologia_filtro, get_unit_filters(request.args))
+    headers = {'Content-Disposition': f'attachment; filename="{_export_filename(project_name, tabla, formato)}"'}
+
+    if formato == 'xlsx':
+        body = iter_xlsx({tabla: iter_table_rows(context, tabla)})
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = iter_csv(iter_table_rows(context, tabla))
+        mimetype = 'text/csv'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+def write_project_export(project_name, directorio, formato, tenant_id=None):
+    """
+    Escribe las exportaciones de un proyecto en `directorio` (se ejecuta en el pool de exportación).
+    Si falla, deja un archivo .error con el mensaje para que el estado del trabajo lo reporte.
+    """
+    set_current_tenant(tenant_id)
+    try:
+        context = build_export_context(project_name)
+        if formato == 'xlsx':
+            tables = {tabla: iter_table_rows(context, tabla) for tabla in EXPORT_TABLES}
+            write_export_file(os.path.join(directorio, _export_filename(project_name, 'parrilla', 'xlsx')), tables, 'xlsx')
+        else:
+            for tabla in EXPORT_TABLES:
+                path = os.path.join(directorio, _export_filename(project_name, tabla, 'csv'))
+                write_export_file(path, {tabla: iter_table_rows(context, tabla)}, 'csv')
+    except Exception as e:
+        with open(os.path.join(directorio, _export_filename(project_name, 'export', 'error')), 'w', encoding='utf-8') as f:
+            f.write(str(e))
+        raise
+
+
+def get_export_executor():
+    """Pool de procesos para exportaciones, creado al primer uso."""
+    global _export_executor
+    if _export_executor is None:
+        _export_executor = ProcessPoolExecutor(
+            max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _export_executor
+
+
+def _export_job_dir(job_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    job_dir = EXPORT_DIR / get_current_tenant().id / job_id
+    return job_dir if (job_dir / 'manifest.json').exists() else None
+
+
+def _export_job_status(job_dir):
+    manifest = json.loads((job_dir / 'manifest.json').read_text(encoding='utf-8'))
+    archivos = sorted(p.name for p in job_dir.iterdir() if p.suffix in ('.csv', '.xlsx'))
+    errores = sorted(p.name for p in job_dir.iterdir() if p.suffix == '.error')
+    esperados = len(manifest['proyectos']) * (1 if manifest['formato'] == 'xlsx' else len(EXPORT_TABLES))
+    if errores:
+        estado = 'error'
+    elif len(archivos) >= esperados:
+        estado = 'listo'
+    else:
+        estado = 'en_proceso'
+    return {**manifest, 'estado': estado, 'archivos': archivos, 'errores': errores}
+
+
+@app.route('/export/proyectos', methods=['POST'])
+def start_projects_export():
+    """Lanza en segundo plano la exportación de todos los proyectos y retorna el id del trabajo."""
+    formato = request.args.get('formato', 'csv')
+    if formato not in EXPORT_FORMATS:
+        return "Formato no soportado.", 404
+    if formato == 'xlsx' and not xlsx_available():
+        return "La exportación a XLSX requiere openpyxl.", 501
+
+    conn = get_db_connection()
+    proyectos = [row['nombre_proyecto'] for row in conn.execute(
+        "SELECT DISTINCT nombre_proyecto FROM unidades ORDER BY nombre_proyecto"
+    ).fetchall()]
+    conn.close()
+
+    job_id = uuid.uuid4().hex
+    job_dir = EXPORT_DIR / get_current_tenant().id / job_id
+    job_dir.mkdir(parents=True)
+    (job_dir / 'manifest.json').write_text(json.dumps({
+        'job_id': job_id, 'formato': formato, 'proyectos': proyectos,
+        'creado': datetime.now().isoformat(timespec='seconds')
+    }), encoding='utf-8')
+
+    executor = get_export_executor()
+    for project_name in proyectos:
+        executor.submit(write_project_export, project_name, str(job_dir), formato, get_current_tenant().id)
+
+    return jsonify({'job_id': job_id, 'estado_url': url_for('projects_export_status', job_id=job_id)}), 202
+
+
+@app.route('/export/proyectos/<job_id>')
+def projects_export_status(job_id):
+    job_dir = _export_job_dir(job_id)
+    if job_dir is None:
+        return "Trabajo de exportación no encontrado.", 404
+    status = _export_job_status(job_dir)
+    if status['estado'] == 'listo':
+        status['descarga_url'] = url_for('download_projects_export', job_id=job_id)
+    return jsonify(status)
+
+
+class _ZipStream:
+    """Destino de escritura para zipfile que acumula bytes para entregarlos por bloques."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+@app.route('/export/proyectos/<job_id>/descarga')
+def download_projects_export(job_id):
+    """Transmite como ZIP los archivos de un trabajo de exportación terminado."""
+    job_dir = _export_job_dir(job_id)
+    if job_dir is None:
+        return "Trabajo de exportación no encontrado.", 404
+    status = _export_job_status(job_dir)
+    if status['estado'] != 'listo':
+        return jsonify(status), 409
+
+    def generate():
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for nombre in status['archivos']:
+                with open(job_dir / nombre, 'rb') as source, archive.open(nombre, 'w') as target:
+                    while True:
+                        block = source.read(64 * 1024)
+                        if not block:
+                            break
+                        target.write(block)
+                        yield stream.drain()
+        yield stream.drain()
+
+    headers = {'Content-Disposition': f'attachment; filename="exportacion_{job_id}.zip"'}
+    return Response(generate(), mimetype='application/zip', headers=headers)
+
+# --- PAQUETES SIN CONEXIÓN ---
+def build_project_bundle(project_name, output_path):
+    """
+    Genera el paquete portable de un proyecto (ver bundles.py): base compacta del proyecto,
+    archivos de mercado y de reglas, los agregados que la parrilla y el dashboard necesitan y los
+    fragmentos ya renderizados de la parrilla, con las mismas claves con que los buscará la
+    instancia que lo monte. Los índices (tipos de cambio, filtros, comparables) no se incluyen:
+    se reconstruyen a pedido desde la base y los archivos del paquete.
+    """
+    from bundles import copy_project_database, write_bundle
+
+    data_version = get_data_version()
+    rules_version = alert_rules_version()
+    market_version = competencia_file_version()
+    today = get_reference_date()
+
+    entries = []
+    fragments = []
+
+    def keep(fn, *args, destino=entries):
+        destino.append(((fn.__name__,) + args, fn(*args)))
+
+    project_versions = _project_versions_cached(data_version)
+    entries.append((('_project_versions_cached', data_version), {project_name: project_versions.get(project_name, '')}))
+    keep(_tipologia_dorm_map_cached, project_name, data_version)
+    keep(_sales_forecast_cached, project_name, data_version)
+    keep(_conversion_funnel_cached, project_name, data_version)
+    keep(_novedades_cached, project_name, data_version, 1)
+    keep(_alert_evaluation_cached, project_name, data_version, rules_version, market_version, today)
+    if market_version:
+        keep(_competencia_metrics_cached, market_version)
+    for vista in GRID_VIEWS:
+        # Mismos parámetros que envía el marcador de scroll de la primera página (_grid_floors.html)
+        max_columns = str(get_pricing_context(project_name, None, vista)['max_columns'])
+        keep(_grid_fragments_cached, project_name, (), (), vista, max_columns,
+             data_version, rules_version, market_version, today, destino=fragments)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_copy = os.path.join(tmp_dir, DB_NAME)
+        copy_project_database(get_db_path(), db_copy, project_name)
+        files = {DB_NAME: db_copy}
+        versions = {DB_NAME: data_version}
+        if market_version:
+            files[COMPETENCIA_CSV_NAME] = competencia_csv_path()
+            versions[COMPETENCIA_CSV_NAME] = market_version
+        if rules_version:
+            files[ALERT_RULES_FILE.name] = alert_rules_path()
+            versions[ALERT_RULES_FILE.name] = rules_version
+        manifest = {
+            'proyecto': project_name,
+            'version': get_project_version(project_name),
+            'creado': datetime.now().isoformat(timespec='seconds'),
+            'versiones': versions,
+        }
+        return write_bundle(output_path, files, entries, fragments, manifest)
+
+
+@app.route('/bundle/<project_name>')
+def download_project_bundle(project_name):
+    """
+    Paquete portable del proyecto para la versión actual de sus datos: se genera una vez por
+    versión y al generarlo se borran los de versiones anteriores del proyecto.
+    """
+    version = get_project_version(project_name)
+    if not version:
+        return "Proyecto no encontrado.", 404
+    safe_project = re.sub(r'[^A-Za-z0-9_-]+', '_', project_name).strip('_') or 'proyecto'
+    bundle_dir = EXPORT_DIR / get_current_tenant().id / 'bundles'
+    filename = f"{safe_project}-{version}.bundle"
+    if not (bundle_dir / filename).exists():
+        from bundles import prune_bundles
+
+        _inflight.do(
+            ('bundle', get_current_tenant().id, project_name, version),
+            build_project_bundle, project_name, bundle_dir / filename
+        )
+        prune_bundles(bundle_dir, safe_project, filename)
+    return send_from_directory(bundle_dir, filename, as_attachment=True, download_name=f"{safe_project}.bundle")
+
+
+# --- 10. PERFILADO BAJO DEMANDA ---
+def _profiling_authorized(allow_query=False):
+    """Valida el token de administración (cabecera X-Profile-Token; ?token= solo en las páginas de consulta)."""
+    token = request.headers.get('X-Profile-Token')
+    if token is None and allow_query:
+        token = request.args.get('token')
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+@app.before_request
+def start_request_profile():
+    if request.endpoint not in PROFILE_ENDPOINTS:
+        return
+    sampled = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if not (sampled or _profiling_authorized()):
+        return
+    from profiling import RequestProfile
+
+    # Si ya hay una captura en curso en este worker, la petición se atiende sin perfilar
+    g.request_profile = RequestProfile.try_start(PROFILE_DIR, f"{request.method} {request.full_path.rstrip('?')}")
+
+
+@app.after_request
+def stop_request_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.stop(response.status_code)['id']
+    return response
+
+
+@app.teardown_request
+def discard_request_profile(error=None):
+    # Si la vista lanzó una excepción after_request no se ejecuta; se guarda igual la captura
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.stop(500)
+
+
+@app.route('/admin/perfiles')
+def profile_index():
+    """Lista las capturas de perfil más recientes."""
+    if not _profiling_authorized(allow_query=True):
+        return "No encontrado.", 404
+    from profiling import list_captures
+
+    return render_template(
+        'profiles.html', captures=list_captures(PROFILE_DIR), token=request.args.get('token'),
+        sample_rate=PROFILE_SAMPLE_RATE
+    )
+
+
+@app.route('/admin/perfiles/<capture_id>.<formato>')
+def profile_download(capture_id, formato):
+    """Descarga el resumen (.txt) o las estadísticas de cProfile (.prof) de una captura."""
+    if not _profiling_authorized(allow_query=True) or formato not in ('txt', 'prof'):
+        return "No encontrado.", 404
+    return send_from_directory(PROFILE_DIR, f"{capture_id}.{formato}", as_attachment=(formato == 'prof'))
+
+
+# --- 11. INICIO DE LA APLICACIÓN ---
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Benchmark de arranque de los workers de la app.
+
+Importa app.py en procesos nuevos (como haría cada worker de gunicorn al arrancar) y mide
+el tiempo de importación, el RSS del proceso tras la importación y si se cargaron módulos
+pesados (pandas, NumPy). Termina con código 1 si se excede el presupuesto, para poder
+usarlo en CI o en build.sh; tests/test_startup.py verifica el presupuesto por defecto.
+
+Uso:
+    python benchmark_startup.py --runs 5 --max-import-ms 300 --max-rss-mb 60
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+HEAVY_MODULES = ("pandas", "numpy")
+DEFAULT_MAX_IMPORT_MS = 300.0
+DEFAULT_MAX_RSS_MB = 60.0
+
+# Se ejecuta en un intérprete nuevo para no heredar módulos ya importados
+_CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+rss_kb = 0
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'import_ms': import_ms,
+    'rss_mb': rss_kb / 1024,
+    'heavy_modules': [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_startup(runs=5):
+    """
+    Importa app.py `runs` veces en procesos nuevos y retorna las mediciones:
+    {'import_ms': mediana, 'rss_mb': máximo, 'heavy_modules': [...], 'runs': [...]}.
+    """
+    results = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", _CHILD_CODE],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    return {
+        'import_ms': statistics.median(r['import_ms'] for r in results),
+        'rss_mb': max(r['rss_mb'] for r in results),
+        'heavy_modules': sorted({m for r in results for m in r['heavy_modules']}),
+        'runs': results,
+    }
+
+
+def check_budget(measurement, max_import_ms=DEFAULT_MAX_IMPORT_MS, max_rss_mb=DEFAULT_MAX_RSS_MB):
+    """Retorna la lista de violaciones del presupuesto de arranque (vacía si se cumple)."""
+    errors = []
+    if measurement['import_ms'] > max_import_ms:
+        errors.append(f"importación de app.py: {measurement['import_ms']:.0f} ms > {max_import_ms:.0f} ms")
+    if measurement['rss_mb'] > max_rss_mb:
+        errors.append(f"RSS del worker: {measurement['rss_mb']:.1f} MB > {max_rss_mb:.1f} MB")
+    if measurement['heavy_modules']:
+        errors.append(f"módulos pesados importados al arrancar: {', '.join(measurement['heavy_modules'])}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el arranque de los workers de la app.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=DEFAULT_MAX_IMPORT_MS)
+    parser.add_argument("--max-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB)
+    args = parser.parse_args()
+
+    measurement = measure_startup(args.runs)
+    print(f"Importación de app.py (mediana de {args.runs}): {measurement['import_ms']:.1f} ms")
+    print(f"RSS del worker tras importar (máximo): {measurement['rss_mb']:.1f} MB")
+    print(f"Módulos pesados cargados: {', '.join(measurement['heavy_modules']) or 'ninguno'}")
+
+    errors = check_budget(measurement, args.max_import_ms, args.max_rss_mb)
+    for error in errors:
+        print(f"FUERA DE PRESUPUESTO: {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,9 @@
 set -o errexit
 
 pip install -r requirements.txt
-python init_db.py
\ No newline at end of file
+# Una base por inquilino de tenants.json
+for tenant in $(python -c "from tenants import load_tenants; print(' '.join(load_tenants()[0]))"); do
+  python init_db.py --tenant "$tenant"
+done
+# Precomprimir estáticos (gzip/brotli); agregar --vendor-chartjs para servir Chart.js localmente
+python compress_static.py
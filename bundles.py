@@ -0,0 +1,224 @@
+"""
+Paquetes portables de un proyecto para ver la parrilla sin conexión (salas de venta).
+
+Un paquete (.bundle) es un único archivo ZIP comprimido con:
+  - database.db: copia compacta de la base con solo las filas del proyecto,
+  - Tb_utf8.csv y alert_rules.json: métricas de mercado y reglas de alerta usadas,
+  - cache.json: agregados ya calculados (diccionarios y listas) con sus claves de caché,
+  - fragmentos/*.html: fragmentos de la parrilla ya renderizados,
+  - manifest.json: proyecto, fecha y versiones (mtime) de cada archivo.
+
+Una instancia local lo monta con BUNDLE_FILE=<ruta> sin ejecutar init_db.py: el paquete se
+descomprime una sola vez, los archivos recuperan el mtime original (así las claves de la
+caché coinciden) y la base se abre inmutable y con memory-mapping.
+
+Las entradas de caché son datos, no objetos serializados: cargarlas no ejecuta código. Las
+tuplas, conjuntos, fechas y diccionarios con claves no textuales van etiquetados en el JSON
+para recuperarlos con su tipo; los índices (objetos con arreglos de NumPy) no viajan en el
+paquete y se reconstruyen a pedido desde la base y los archivos incluidos.
+
+Uso (genera el paquete desde la base del inquilino):
+    python bundles.py STILL --tenant llosa -o STILL.bundle
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import date, datetime
+from pathlib import Path
+
+BUNDLE_FORMAT = 2
+BUNDLE_MANIFEST = 'manifest.json'
+BUNDLE_CACHE_ENTRIES = 'cache.json'
+BUNDLE_FRAGMENTS_DIR = 'fragmentos'
+
+# Filtro por tabla al copiar la base de un proyecto; las tablas no listadas se copian completas
+PROJECT_TABLE_FILTERS = {
+    'unidades': "nombre_proyecto = :proyecto",
+    'unidad_hashes': "codigo IN (SELECT codigo FROM main.unidades)",
+    'proformas': "codigo_unidad IN (SELECT codigo FROM main.unidades)",
+    'tipologia_dormitorios': "nombre_proyecto = :proyecto",
+    'proyecto_fechas_inicio': "nombre_proyecto = :proyecto",
+    'novedades': "nombre_proyecto = :proyecto",
+    'snapshot_bases': "nombre_proyecto = :proyecto",
+    'snapshot_deltas': "nombre_proyecto = :proyecto",
+    'cambios_precio': "nombre_proyecto = :proyecto",
+}
+
+
+def copy_project_database(src_db, dst_db, project_name):
+    """Copia en dst_db el esquema completo de src_db y solo las filas de un proyecto, compactada."""
+    conn = sqlite3.connect(Path(dst_db).resolve().as_uri(), uri=True)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (Path(src_db).resolve().as_uri() + '?mode=ro',))
+        objetos = conn.execute(
+            "SELECT type, name, sql FROM src.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        # 'unidades' primero: los filtros de las tablas dependientes la consultan
+        tablas = sorted((o for o in objetos if o[0] == 'table'), key=lambda o: o[1] != 'unidades')
+        for _, name, sql in tablas:
+            conn.execute(sql)
+            where = PROJECT_TABLE_FILTERS.get(name)
+            conn.execute(
+                f"INSERT INTO main.{name} SELECT * FROM src.{name}" + (f" WHERE {where}" if where else ""),
+                {'proyecto': project_name}
+            )
+        for _, _, sql in (o for o in objetos if o[0] == 'index'):
+            conn.execute(sql)
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def to_json(value):
+    """
+    Valor de caché como JSON. Las tuplas, conjuntos, fechas y diccionarios con claves no
+    textuales se etiquetan ({'__tuple__': [...]}, ...) para que from_json los recupere con su tipo.
+    """
+    if isinstance(value, dict):
+        if all(isinstance(k, str) and not k.startswith('__') for k in value):
+            return {k: to_json(v) for k, v in value.items()}
+        return {'__dict__': [[to_json(k), to_json(v)] for k, v in value.items()]}
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    if isinstance(value, tuple):
+        return {'__tuple__': [to_json(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {'__frozenset__' if isinstance(value, frozenset) else '__set__': [to_json(v) for v in value]}
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if type(value).__module__ == 'numpy' and hasattr(value, 'item'):
+        return value.item()  # escalares de NumPy
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise TypeError(f"Valor de caché no serializable en el paquete: {type(value).__name__}")
+
+
+_JSON_TAGS = {
+    '__dict__': lambda pares: {k: v for k, v in pares},
+    '__tuple__': tuple,
+    '__set__': set,
+    '__frozenset__': frozenset,
+    '__datetime__': datetime.fromisoformat,
+    '__date__': date.fromisoformat,
+}
+
+
+def from_json(obj):
+    """object_hook de json.loads: deshace las etiquetas de to_json."""
+    if len(obj) == 1:
+        (tag, value), = obj.items()
+        if tag in _JSON_TAGS:
+            return _JSON_TAGS[tag](value)
+    return obj
+
+
+def write_bundle(path, files, cache_entries, fragments, manifest):
+    """
+    Escribe el paquete de forma atómica. `files` es {nombre en el paquete: ruta}; `manifest`
+    debe incluir 'versiones' ({nombre: mtime_ns}) para restaurar los mtime al montarlo.
+    `cache_entries` son [(clave, valor)] con valores de datos (ver to_json) y `fragments`,
+    [(clave, {desde: html})] con los fragmentos de la parrilla, que se guardan como .html.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for name, src in files.items():
+            zf.write(src, name)
+        indice_fragmentos = []
+        for i, (key, por_desde) in enumerate(fragments):
+            nombres = {}
+            for desde, html in por_desde.items():
+                nombres[desde] = f"{BUNDLE_FRAGMENTS_DIR}/{i}/{desde}.html"
+                zf.writestr(nombres[desde], html)
+            indice_fragmentos.append((key, nombres))
+        cache = {'entradas': list(cache_entries), 'fragmentos': indice_fragmentos}
+        zf.writestr(BUNDLE_CACHE_ENTRIES, json.dumps(to_json(cache), ensure_ascii=False))
+        zf.writestr(BUNDLE_MANIFEST, json.dumps({'formato': BUNDLE_FORMAT, **manifest}, ensure_ascii=False))
+    os.replace(tmp_path, path)
+    return path
+
+
+def prune_bundles(directorio, nombre, conservar):
+    """Borra de directorio los paquetes '<nombre>-<versión>.bundle' anteriores, salvo `conservar`."""
+    for path in Path(directorio).glob(f"{glob.escape(nombre)}-*.bundle"):
+        version = path.name[len(nombre) + 1:-len('.bundle')]
+        if path.name != conservar and '-' not in version:
+            path.unlink(missing_ok=True)
+
+
+def extract_bundle(bundle_path, cache_dir):
+    """
+    Descomprime el paquete en cache_dir (una sola vez por archivo: se reutiliza si ya está) y
+    retorna (directorio, manifest). Cada archivo recupera el mtime registrado en el manifest.
+    """
+    bundle_path = Path(bundle_path).resolve()
+    stat = bundle_path.stat()
+    digest = hashlib.sha1(f"{bundle_path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:16]
+    directorio = Path(cache_dir) / f"{bundle_path.stem}-{digest}"
+    manifest_path = directorio / BUNDLE_MANIFEST
+    if not manifest_path.exists():
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f"{bundle_path.stem}-", dir=cache_dir))
+        with zipfile.ZipFile(bundle_path) as zf:
+            manifest = json.loads(zf.read(BUNDLE_MANIFEST))
+            if manifest.get('formato') != BUNDLE_FORMAT:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise ValueError(f"Formato de paquete no soportado: {manifest.get('formato')}")
+            zf.extractall(tmp_dir)
+        for name, mtime_ns in manifest.get('versiones', {}).items():
+            if (tmp_dir / name).exists():
+                os.utime(tmp_dir / name, ns=(mtime_ns, mtime_ns))
+        try:
+            os.replace(tmp_dir, directorio)
+        except OSError:
+            # Otro worker lo descomprimió al mismo tiempo
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return directorio, json.loads(manifest_path.read_text(encoding='utf-8'))
+
+
+def load_cache_entries(directorio):
+    """
+    Entradas de caché precalculadas del paquete: [(clave, valor)], con los fragmentos de la
+    parrilla leídos de sus .html. Solo lee datos (JSON y texto); ValueError si están dañados.
+    """
+    directorio = Path(directorio)
+    cache_path = directorio / BUNDLE_CACHE_ENTRIES
+    if not cache_path.exists():
+        return []
+    cache = json.loads(cache_path.read_text(encoding='utf-8'), object_hook=from_json)
+    entries = [tuple(entry) for entry in cache.get('entradas', ())]
+    for key, nombres in cache.get('fragmentos', ()):
+        por_desde = {desde: (directorio / nombre).read_text(encoding='utf-8') for desde, nombre in nombres.items()}
+        entries.append((key, por_desde))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el paquete portable de un proyecto.")
+    parser.add_argument("proyecto", help="Nombre del proyecto (nombre_proyecto).")
+    parser.add_argument("--tenant", help="Inquilino de tenants.json (por defecto, el inquilino por defecto).")
+    parser.add_argument("-o", "--output", help="Ruta del paquete (por defecto, <proyecto>.bundle).")
+    args = parser.parse_args()
+
+    import app as webapp
+
+    output = args.output or f"{args.proyecto.replace(' ', '_')}.bundle"
+    with webapp.app.test_request_context():
+        webapp.set_current_tenant(args.tenant)
+        path = webapp.build_project_bundle(args.proyecto, output)
+    print(f"Paquete '{path}' generado ({path.stat().st_size / 1024:.0f} KB).")
+
+
+if __name__ == "__main__":
+    main()
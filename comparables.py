@@ -0,0 +1,104 @@
+"""
+Índice de comparables de mercado sobre las transacciones de la competencia (Tb_utf8.csv).
+
+Las transacciones se agrupan en buckets por cantidad de dormitorios y, dentro de cada
+bucket, se buscan los k vecinos más cercanos sobre área, precio por m² y fecha de venta
+(estandarizados). Las consultas se resuelven en bloque con NumPy para todo un proyecto.
+"""
+import numpy as np
+
+# Peso relativo de cada atributo en la distancia (área, precio por m², fecha de venta)
+FEATURE_WEIGHTS = np.array([1.0, 1.0, 0.5])
+QUERY_CHUNK_SIZE = 256
+
+
+class ComparablesIndex:
+    """
+    Índice de vecinos cercanos por buckets de dormitorios.
+
+    Se construye una sola vez por archivo de competencia con arreglos columnares:
+    dormitorios, area, precio_m2, fecha (días ordinales) y velocidad (unidades/mes).
+    """
+
+    def __init__(self, dormitorios, area, precio_m2, fecha, velocidad):
+        self.dormitorios = np.asarray(dormitorios, dtype=np.int64)
+        self.area = np.asarray(area, dtype=float)
+        self.precio_m2 = np.asarray(precio_m2, dtype=float)
+        self.fecha = np.asarray(fecha, dtype=float)
+        self.velocidad = np.asarray(velocidad, dtype=float)
+
+        # Sin columna de área en el archivo de mercado el atributo no participa en la distancia
+        self.weights = FEATURE_WEIGHTS.copy()
+        if np.isnan(self.area).all():
+            self.weights[0] = 0.0
+
+        features = np.column_stack([self.area, self.precio_m2, self.fecha])
+        self.mean = np.nanmean(features, axis=0) if len(features) else np.zeros(3)
+        std = np.nanstd(features, axis=0) if len(features) else np.ones(3)
+        self.std = np.where(std > 0, std, 1.0)
+        self.features = np.nan_to_num(self._scale(features))
+
+        order = np.argsort(self.dormitorios, kind='stable')
+        dorm_sorted = self.dormitorios[order]
+        keys, starts = np.unique(dorm_sorted, return_index=True)
+        ends = np.append(starts[1:], len(dorm_sorted))
+        self.buckets = {int(k): order[s:e] for k, s, e in zip(keys, starts, ends)}
+
+    def __len__(self):
+        return len(self.dormitorios)
+
+    def _scale(self, features):
+        return (features - self.mean) / self.std * self.weights
+
+    def query(self, dormitorios, area, precio_m2, fecha, k=10):
+        """
+        Busca los k comparables más cercanos para un bloque de consultas.
+
+        Retorna (indices, distancias), ambos de forma (n_consultas, k). Las posiciones
+        sin comparable (bucket vacío o con menos de k transacciones) quedan en -1 / inf.
+        """
+        dormitorios = np.asarray(dormitorios, dtype=np.int64)
+        queries = np.column_stack([
+            np.asarray(area, dtype=float),
+            np.asarray(precio_m2, dtype=float),
+            np.asarray(fecha, dtype=float),
+        ])
+        # Un atributo desconocido en la consulta toma la media del mercado (distancia 0)
+        queries = np.nan_to_num(self._scale(queries))
+
+        n = len(dormitorios)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        distances = np.full((n, k), np.inf)
+
+        for dorm in np.unique(dormitorios):
+            bucket = self.buckets.get(int(dorm))
+            if bucket is None:
+                continue
+            rows = np.flatnonzero(dormitorios == dorm)
+            kk = min(k, len(bucket))
+            candidates = self.features[bucket]
+            for start in range(0, len(rows), QUERY_CHUNK_SIZE):
+                chunk = rows[start:start + QUERY_CHUNK_SIZE]
+                diff = queries[chunk, None, :] - candidates[None, :, :]
+                dist = np.sqrt(np.einsum('qnf,qnf->qn', diff, diff))
+                nearest = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+                nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+                ordering = np.argsort(nearest_dist, axis=1)
+                indices[chunk, :kk] = bucket[np.take_along_axis(nearest, ordering, axis=1)]
+                distances[chunk, :kk] = np.take_along_axis(nearest_dist, ordering, axis=1)
+
+        return indices, distances
+
+    def weighted_metrics(self, indices, distances):
+        """
+        Precio por m² y velocidad ponderados por el inverso de la distancia.
+        Retorna (precio_m2, velocidad, muestras) por consulta; NaN si no hay comparables.
+        """
+        valid = indices >= 0
+        safe_idx = np.where(valid, indices, 0)
+        weights = np.where(valid, 1.0 / (distances + 1e-6), 0.0)
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precio = (weights * self.precio_m2[safe_idx]).sum(axis=1) / total
+            velocidad = (weights * self.velocidad[safe_idx]).sum(axis=1) / total
+        return precio, velocidad, valid.sum(axis=1)
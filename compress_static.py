@@ -0,0 +1,86 @@
+"""
+Precompresión de los archivos estáticos en tiempo de build.
+
+Genera junto a cada archivo de texto de static/ (CSS, JS, SVG, ...) una versión .gz y,
+si el paquete brotli está instalado, una .br. La app sirve la variante precomprimida
+cuando el navegador la acepta. Con --vendor-chartjs además descarga Chart.js y su plugin
+de datalabels a static/vendor/ para no depender del CDN.
+
+Uso:
+    python compress_static.py [--vendor-chartjs]
+"""
+import argparse
+import gzip
+import urllib.request
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional; gzip siempre se genera
+    brotli = None
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".map"}
+# Por debajo de este tamaño la compresión no compensa
+MIN_SIZE_BYTES = 512
+
+VENDOR_DIR = STATIC_DIR / "vendor"
+VENDOR_ASSETS = {
+    "chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js",
+    "chartjs-plugin-datalabels.min.js": "https://cdn.jsdelivr.net/npm/chartjs-plugin-datalabels@2.2.0",
+}
+
+
+def vendor_chartjs():
+    """Descarga Chart.js y chartjs-plugin-datalabels a static/vendor/."""
+    VENDOR_DIR.mkdir(parents=True, exist_ok=True)
+    for filename, url in VENDOR_ASSETS.items():
+        with urllib.request.urlopen(url, timeout=30) as response:
+            (VENDOR_DIR / filename).write_bytes(response.read())
+        print(f"Descargado {url} -> static/vendor/{filename}")
+
+
+def compress_file(path):
+    """Escribe path.gz (y path.br si hay brotli) cuando son más pequeños que el original."""
+    data = path.read_bytes()
+    written = []
+    variants = [(".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda d: brotli.compress(d, quality=11)))
+
+    for suffix, compress in variants:
+        target = path.with_name(path.name + suffix)
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            target.write_bytes(compressed)
+            written.append(target)
+        elif target.exists():
+            target.unlink()
+    return written
+
+
+def compress_static():
+    """Precomprime todos los archivos de texto de static/. Retorna los archivos generados."""
+    written = []
+    for path in sorted(STATIC_DIR.rglob("*")):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES:
+            continue
+        if path.stat().st_size < MIN_SIZE_BYTES:
+            continue
+        written.extend(compress_file(path))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomprime los archivos estáticos.")
+    parser.add_argument("--vendor-chartjs", action="store_true", help="Descarga Chart.js a static/vendor/.")
+    args = parser.parse_args()
+
+    if args.vendor_chartjs:
+        vendor_chartjs()
+    written = compress_static()
+    print(f"{len(written)} archivos precomprimidos generados{'' if brotli else ' (sin brotli: solo gzip)'}.")
+
+
+if __name__ == "__main__":
+    main()
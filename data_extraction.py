@@ -1,10 +1,14 @@
 import psycopg2
 import os
 import csv
+import argparse
 from dotenv import load_dotenv
 from loguru import logger
 from pathlib import Path
 
+from init_db import PROFORMA_FECHA_COLUMNA
+from tenants import get_tenant
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -22,18 +26,28 @@ if not all([REDSHIFT_HOST, REDSHIFT_PORT, REDSHIFT_DB, REDSHIFT_USER, REDSHIFT_P
     logger.error("Faltan una o más credenciales de Redshift en el archivo .env.")
     raise ValueError("Credenciales de Redshift incompletas.")
 
-# --- Configuración de Rutas y Esquema ---
+# --- Configuración de Rutas ---
+# El esquema de Redshift, los proyectos válidos y el directorio de salida vienen del inquilino (tenants.json)
 PROJECT_ROOT: Path = Path(__file__).resolve().parent
-TARGET_SCHEMA: str = "llosaedificaciones"
 
 # Tablas específicas a extraer
 TABLES_TO_EXTRACT = ["unidades", "proforma_unidad"]
 
-def download_table_as_csv(conn, schema: str, table: str):
+# Columnas de 'unidades' que usa init_db.py (modo de extracción reducida)
+UNIDADES_COLUMNAS = [
+    "codigo", "nombre", "codigo_proyecto", "nombre_proyecto", "tipo_unidad", "piso",
+    "nombre_tipologia", "total_habitaciones", "area_techada", "estado_comercial",
+    "precio_lista", "precio_venta", "precio_m2", "fecha_venta", "fecha_separacion",
+]
+# Columnas de 'proforma_unidad' que carga init_db.py en la tabla de hechos
+PROFORMA_COLUMNAS = ["codigo_unidad", PROFORMA_FECHA_COLUMNA]
+FETCH_CHUNK_SIZE = 10_000
+
+def download_table_as_csv(conn, schema: str, table: str, output_dir: Path = PROJECT_ROOT):
     """
     Descarga una tabla específica desde Redshift y la guarda como un archivo CSV.
     """
-    output_path = PROJECT_ROOT / f"{table}.csv"
+    output_path = output_dir / f"{table}.csv"
     full_table_name = f'"{schema}"."{table}"'
     logger.info(f"Descargando tabla '{full_table_name}' a '{output_path}'...")
 
@@ -63,10 +77,104 @@ def download_table_as_csv(conn, schema: str, table: str):
             output_path.unlink()
         raise
 
-def main():
+# Filtros de init_db.py expresados en SQL sobre el alias 'u' de la tabla unidades
+UNIDADES_VALIDAS_WHERE = """
+    UPPER(u.codigo_proyecto) IN %s
+    AND LOWER(COALESCE(u.tipo_unidad, '')) NOT LIKE '%%estacionamiento%%'
+    AND TRIM(CAST(u.piso AS VARCHAR)) ~ '^[+]?[0-9]+$'
+"""
+
+
+def build_reduced_unidades_query(schema: str, proyectos_validos):
+    """
+    Consulta de 'unidades' con los filtros de init_db.py aplicados en Redshift: solo proyectos
+    válidos, sin estacionamientos ni pisos negativos o no numéricos, solo las columnas usadas
+    y con proformas_count agregado con GROUP BY sobre 'proforma_unidad'.
+    """
+    columnas = ", ".join(f'u."{col}"' for col in UNIDADES_COLUMNAS)
+    sql_query = f"""
+        SELECT {columnas}, COALESCE(p.proformas_count, 0) AS proformas_count
+        FROM "{schema}"."unidades" u
+        LEFT JOIN (
+            SELECT TRIM(codigo_unidad) AS codigo_unidad, COUNT(*) AS proformas_count
+            FROM "{schema}"."proforma_unidad"
+            WHERE TRIM(codigo_unidad) <> ''
+            GROUP BY TRIM(codigo_unidad)
+        ) p ON p.codigo_unidad = u.codigo
+        WHERE {UNIDADES_VALIDAS_WHERE};
+    """
+    return sql_query, (tuple(p.upper() for p in proyectos_validos),)
+
+
+def build_reduced_proformas_query(schema: str, proyectos_validos):
+    """
+    Consulta de 'proforma_unidad' limitada a las proformas de unidades válidas y a las
+    columnas que carga init_db.py (unidad y fecha).
+    """
+    columnas = ", ".join(f'p."{col}"' for col in PROFORMA_COLUMNAS)
+    sql_query = f"""
+        SELECT {columnas}
+        FROM "{schema}"."proforma_unidad" p
+        JOIN "{schema}"."unidades" u ON TRIM(p.codigo_unidad) = u.codigo
+        WHERE {UNIDADES_VALIDAS_WHERE};
+    """
+    return sql_query, (tuple(p.upper() for p in proyectos_validos),)
+
+
+def download_query_as_csv(conn, sql_query: str, params, output_path: Path, cursor_name: str):
+    """
+    Ejecuta una consulta y guarda el resultado como CSV. Las filas se leen por bloques con
+    un cursor del lado del servidor para no cargar todo el resultado en memoria.
+    """
+    logger.info(f"Descargando '{cursor_name}' a '{output_path}'...")
+    try:
+        total = 0
+        with conn.cursor(name=cursor_name) as cursor:
+            cursor.itersize = FETCH_CHUNK_SIZE
+            cursor.execute(sql_query, params)
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+            headers = [desc[0] for desc in cursor.description]
+
+            with open(output_path, "w", encoding="utf-8", newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                while rows:
+                    writer.writerows(rows)
+                    total += len(rows)
+                    rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+
+        logger.success(f"{total} filas de '{cursor_name}' guardadas exitosamente en '{output_path}'.")
+    except psycopg2.Error as e:
+        logger.error(f"Error al descargar '{cursor_name}': {e}")
+        if output_path.exists():
+            output_path.unlink()
+        raise
+
+
+def download_reduced_tables(conn, schema: str, proyectos_validos, output_dir: Path = PROJECT_ROOT):
+    """
+    Descarga la tabla de unidades ya reducida (filtros, columnas y conteo de proformas
+    resueltos en Redshift) y las proformas de esas unidades para la tabla de hechos.
+    """
+    download_query_as_csv(
+        conn, *build_reduced_unidades_query(schema, proyectos_validos), output_dir / "unidades.csv", "unidades_reducidas"
+    )
+    download_query_as_csv(
+        conn, *build_reduced_proformas_query(schema, proyectos_validos), output_dir / "proforma_unidad.csv",
+        "proformas_reducidas"
+    )
+
+
+def main(reducido: bool = False, tenant_id: str = None):
     """
     Función principal para extraer las tablas específicas.
+    Con reducido=True solo se transfieren las unidades válidas ya agregadas y sus proformas.
+    Los CSV se guardan en el directorio de datos del inquilino.
     """
+    tenant = get_tenant(tenant_id)
+    output_dir = Path(tenant.directorio)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Inquilino '{tenant.id}': esquema '{tenant.schema}', salida en '{output_dir}'.")
     conn = None
     try:
         logger.info("Conectando a la base de datos de Redshift...")
@@ -79,12 +187,15 @@ def main():
         )
         logger.info("Conexión a Redshift establecida.")
 
-        for table_name in TABLES_TO_EXTRACT:
-            try:
-                download_table_as_csv(conn, TARGET_SCHEMA, table_name)
-            except Exception as e:
-                logger.error(f"Error al procesar la tabla '{table_name}': {e}")
-                continue
+        if reducido:
+            download_reduced_tables(conn, tenant.schema, tenant.proyectos_validos, output_dir)
+        else:
+            for table_name in TABLES_TO_EXTRACT:
+                try:
+                    download_table_as_csv(conn, tenant.schema, table_name, output_dir)
+                except Exception as e:
+                    logger.error(f"Error al procesar la tabla '{table_name}': {e}")
+                    continue
 
         logger.info("Proceso de extracción completado.")
 
@@ -99,4 +210,12 @@ def main():
             logger.info("Conexión a Redshift cerrada.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extrae las tablas de Redshift a CSV.")
+    parser.add_argument(
+        "--reducido",
+        action="store_true",
+        help="Aplica filtros, columnas y conteo de proformas en Redshift antes de descargar.",
+    )
+    parser.add_argument("--tenant", help="Inquilino de tenants.json (por defecto, el inquilino por defecto).")
+    args = parser.parse_args()
+    main(reducido=args.reducido, tenant_id=args.tenant)
\ No newline at end of file
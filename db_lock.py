@@ -0,0 +1,65 @@
+"""
+Bloqueo de escritura compartido sobre la base de un inquilino.
+
+init_db.py reemplaza la base completa (archivo temporal + os.replace) y la app escribe sobre ella
+los cambios de precio aprobados. Sin coordinación, un lote confirmado entre que init_db.py lee la
+base anterior y el reemplazo queda en el archivo viejo y se pierde. Ambos toman este bloqueo,
+un archivo '<base>.lock' junto a la base con flock (msvcrt en Windows), así que el lote se
+confirma antes de que la carga lea la base anterior o después del reemplazo, sobre la nueva.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DB_LOCK_POLL_SECONDS = 0.05
+
+
+class DBLockTimeout(Exception):
+    """No se obtuvo el bloqueo de la base dentro del tiempo de espera."""
+
+
+def _try_lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def db_write_lock(db_name, timeout=None):
+    """
+    Bloqueo exclusivo de escritura sobre db_name entre procesos. Sin timeout espera lo que haga
+    falta; con timeout (segundos) lanza DBLockTimeout si no lo obtiene a tiempo.
+    """
+    fd = os.open(f"{db_name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                _try_lock(fd)
+                break
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DBLockTimeout(f"La base '{db_name}' está bloqueada por otra escritura.")
+                time.sleep(DB_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,124 @@
+"""
+Exportación de la parrilla de precios, la leyenda y la tabla de aprobación a CSV o XLSX.
+
+Las filas se generan de forma perezosa a partir del contexto de build_export_context, cuya
+parrilla y tabla de aprobación se leen de la base a medida que se consumen, de modo que las
+respuestas se transmiten por bloques sin armar ni la parrilla ni el archivo en memoria.
+"""
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+
+EXPORT_TABLES = ('grid', 'leyenda', 'aprobacion')
+EXPORT_FORMATS = ('csv', 'xlsx')
+CSV_FLUSH_ROWS = 500
+STREAM_CHUNK_SIZE = 64 * 1024
+
+LEGEND_LABELS = {
+    'red': 'Actualizar',
+    'green': 'Mantener',
+    'yellow': 'Separadas',
+    'gray': 'Vendidas',
+}
+
+
+def xlsx_available():
+    """XLSX es opcional: requiere openpyxl, que solo se importa al exportar."""
+    return importlib.util.find_spec('openpyxl') is not None
+
+
+def iter_table_rows(context, tabla):
+    """Genera las filas (encabezado primero) de una de las tablas exportables del contexto."""
+    if tabla == 'grid':
+        yield ['piso', 'codigo', 'tipologia', 'estado_comercial', 'estado_parrilla',
+               'precio_lista', 'precio_venta', 'precio_venta_pen', 'precio_m2', 'area_techada', 'proformas']
+        for piso, unit in context.get('grid_units', ()):
+            yield [piso, unit['codigo'], unit['nombre_tipologia'], unit['estado_comercial'],
+                   unit['display_status'], unit['precio_lista'], unit['precio_venta'],
+                   unit['precio_venta_pen'], unit['precio_m2'], unit['area_techada'], unit['proformas_count']]
+
+    elif tabla == 'leyenda':
+        yield ['estado', 'unidades', 'precio', 'area', 'proformas']
+        legend_stats = context.get('legend_stats', {})
+        for color, label in LEGEND_LABELS.items():
+            stats = legend_stats.get(color)
+            if stats:
+                yield [label, stats['unidades'], stats['precio'], stats['area'], stats['proformas']]
+        sidebar_stats = context.get('sidebar_stats')
+        if sidebar_stats:
+            yield ['Total', sidebar_stats['total_unidades'], sidebar_stats['suma_precio'],
+                   sidebar_stats['suma_area_total'], sidebar_stats['suma_proformas']]
+
+    elif tabla == 'aprobacion':
+        yield ['tipologia', 'unidades_disponibles', 'proformas', 'precio_m2_promedio',
+               'velocidad_promedio', 'precio_venta_m2_pen', 'precio_m2_mercado_pen',
+               'velocidad_mercado', 'dormitorios', 'precio_sugerido', 'alerta', 'triggers']
+        for row in context.get('approval_table_data', []):
+            yield [row['tipologia'], row['unidades_disponibles_str'], row['total_proformas'],
+                   row['avg_precio_m2'], row['velocidad_promedio'], row['precio_venta_promedio_m2_pen'],
+                   row['precio_promedio_mercado'], row['velocidad_venta_mercado'], row['dormitorios'],
+                   row['precio_sugerido'] if row['has_alert'] else None, 'si' if row['has_alert'] else 'no',
+                   ', '.join(row.get('triggers', ()))]
+
+    else:
+        raise ValueError(f"Tabla de exportación desconocida: {tabla}")
+
+
+def iter_csv(rows):
+    """Serializa filas a CSV por bloques (con BOM para que Excel respete los acentos)."""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if n % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _write_xlsx(tables, fileobj):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet_name, rows in tables.items():
+        sheet = workbook.create_sheet(title=sheet_name[:31])
+        for row in rows:
+            sheet.append(row)
+    workbook.save(fileobj)
+
+
+def iter_xlsx(tables):
+    """
+    Genera un XLSX (una hoja por tabla) por bloques. openpyxl en modo write_only escribe
+    las filas a disco a medida que llegan; el archivo temporal se transmite y se elimina.
+    """
+    with tempfile.TemporaryFile() as tmp:
+        _write_xlsx(tables, tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def write_export_file(path, tables, formato):
+    """
+    Escribe una exportación a disco de forma atómica (archivo temporal + rename).
+    En CSV se espera una sola tabla; en XLSX cada tabla va en su propia hoja.
+    """
+    tmp_path = f"{path}.tmp"
+    if formato == 'xlsx':
+        with open(tmp_path, 'wb') as f:
+            _write_xlsx(tables, f)
+    else:
+        (rows,) = tables.values()
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in iter_csv(rows):
+                f.write(chunk)
+    os.replace(tmp_path, path)
@@ -0,0 +1,119 @@
+"""
+Pronóstico Monte Carlo del sell-out por tipología.
+
+Las trayectorias de venta se simulan remuestreando (bootstrap) el historial
+mensual de ventas de cada tipología. Toda la simulación es vectorizada con
+NumPy: una matriz (trayectorias x meses) por tipología.
+"""
+import zlib
+
+import numpy as np
+
+DEFAULT_N_PATHS = 10_000
+DEFAULT_HORIZON_MONTHS = 60
+PERCENTILES = (10, 50, 90)
+
+
+def add_months(year, month, offset):
+    """Suma `offset` meses a (year, month) y retorna la etiqueta YYYY-MM."""
+    index = year * 12 + (month - 1) + offset
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _percentile_labels(months, base_year, base_month):
+    """Convierte meses de sell-out (1..horizonte, -1 = no agota) en etiquetas por percentil."""
+    reached = months[months > 0]
+    result = {}
+    for p in PERCENTILES:
+        # Si menos del p% de trayectorias agota stock, el percentil cae fuera del horizonte
+        if reached.size == 0 or reached.size < months.size * p / 100:
+            result[f"p{p}"] = None
+            continue
+        value = int(np.percentile(np.where(months > 0, months, np.iinfo(np.int32).max), p, method='lower'))
+        result[f"p{p}"] = add_months(base_year, base_month, value)
+    return result
+
+
+def simulate_sell_out(historial, stock, precios, base_month, n_paths=DEFAULT_N_PATHS,
+                      horizon=DEFAULT_HORIZON_MONTHS, seed=None):
+    """
+    Simula el sell-out de un proyecto por tipología.
+
+    historial: {tipologia: [ventas del mes 1, ventas del mes 2, ...]}
+    stock: {tipologia: unidades por vender}
+    precios: {tipologia: precio lista promedio de las unidades por vender}
+    base_month: (año, mes) del último mes observado; la simulación empieza el mes siguiente.
+
+    Retorna un diccionario serializable con los percentiles de fecha de agotamiento
+    por tipología y para el proyecto, la distribución mensual de sell-out del
+    proyecto y el ingreso esperado por mes.
+    """
+    base_year, base_mon = base_month
+    rng = np.random.default_rng(seed)
+    labels = [add_months(base_year, base_mon, i) for i in range(1, horizon + 1)]
+
+    ingreso_esperado = np.zeros(horizon)
+    unidades_esperadas = np.zeros(horizon)
+    # Mes de sell-out por trayectoria para el proyecto completo (0 = ya agotado)
+    project_months = np.zeros(n_paths, dtype=np.int32)
+    tipologias = []
+
+    for tipologia in sorted(stock):
+        units_left = int(stock[tipologia])
+        history = np.asarray(historial.get(tipologia) or [0], dtype=np.int32)
+        row = {
+            'tipologia': tipologia,
+            'stock': units_left,
+            'venta_mensual_promedio': round(float(history.mean()), 2),
+            'prob_sell_out': 1.0 if units_left <= 0 else 0.0,
+            'p10': None, 'p50': None, 'p90': None,
+        }
+        tipologias.append(row)
+        if units_left <= 0:
+            continue
+        if not history.any():
+            # Sin ventas históricas no hay base para simular: nunca agota en el horizonte
+            project_months[:] = -1
+            continue
+
+        samples = history[rng.integers(0, history.size, size=(n_paths, horizon))]
+        cumulative = np.minimum(np.cumsum(samples, axis=1), units_left)
+        sold_out = cumulative[:, -1] >= units_left
+        months = np.where(sold_out, np.argmax(cumulative >= units_left, axis=1) + 1, -1).astype(np.int32)
+
+        monthly_sold = np.diff(cumulative, axis=1, prepend=0)
+        mean_sold = monthly_sold.mean(axis=0)
+        unidades_esperadas += mean_sold
+        ingreso_esperado += mean_sold * float(precios.get(tipologia) or 0)
+
+        row['prob_sell_out'] = round(float(sold_out.mean()), 4)
+        row.update(_percentile_labels(months, base_year, base_mon))
+
+        # El proyecto agota cuando agota su última tipología
+        project_months = np.where(
+            (project_months == -1) | (months == -1), -1, np.maximum(project_months, months)
+        )
+
+    distribution = np.bincount(project_months[project_months > 0], minlength=horizon + 1)[1:horizon + 1]
+    if any(row['stock'] > 0 for row in tipologias):
+        proyecto = {
+            'prob_sell_out': round(float((project_months > 0).mean()), 4),
+            **_percentile_labels(project_months, base_year, base_mon),
+        }
+    else:
+        proyecto = {'prob_sell_out': 1.0, 'p10': None, 'p50': None, 'p90': None}
+
+    return {
+        'meses': labels,
+        'n_trayectorias': n_paths,
+        'tipologias': tipologias,
+        'proyecto': proyecto,
+        'distribucion_sell_out': [round(float(v), 4) for v in distribution / n_paths],
+        'unidades_esperadas': [round(float(v), 2) for v in unidades_esperadas],
+        'ingreso_esperado': [round(float(v), 2) for v in ingreso_esperado],
+    }
+
+
+def seed_for(project_name, data_version):
+    """Semilla determinista para que la misma versión de datos produzca el mismo pronóstico."""
+    return zlib.crc32(f"{project_name}:{data_version}".encode('utf-8'))
@@ -0,0 +1,59 @@
+"""
+Conversión de montos en dólares a soles con el tipo de cambio vigente en cada fecha.
+
+Las tasas se guardan ordenadas por fecha y cada monto toma la última tasa publicada
+en o antes de su fecha (búsqueda binaria vectorizada con np.searchsorted).
+"""
+import numpy as np
+
+
+def to_datetime64(fechas):
+    """Convierte fechas ISO (YYYY-MM-DD, con o sin hora) a datetime64[D]; lo inválido queda como NaT."""
+    values = [(f[:10] if isinstance(f, str) and f else 'NaT') for f in fechas]
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except ValueError:
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(np.datetime64(value, 'D'))
+            except ValueError:
+                parsed.append(np.datetime64('NaT'))
+        return np.array(parsed, dtype='datetime64[D]')
+
+
+class ExchangeRateTable:
+    """Tabla de tipo de cambio PEN/USD por fecha con un valor por defecto si no hay datos."""
+
+    def __init__(self, fechas, tasas, default_rate):
+        dates = to_datetime64(fechas)
+        rates = np.asarray(tasas, dtype=float)
+        valid = ~np.isnat(dates) & (rates > 0)
+        order = np.argsort(dates[valid], kind='stable')
+        self.dates = dates[valid][order]
+        self.rates = rates[valid][order]
+        self.default_rate = default_rate
+
+    def __len__(self):
+        return len(self.rates)
+
+    @property
+    def latest_rate(self):
+        """Tipo de cambio más reciente (o el valor por defecto si la tabla está vacía)."""
+        return float(self.rates[-1]) if len(self.rates) else self.default_rate
+
+    def rates_for(self, fechas):
+        """
+        Tipo de cambio para cada fecha. Fechas anteriores a la primera tasa usan la primera;
+        fechas vacías usan la tasa más reciente.
+        """
+        dates = to_datetime64(fechas)
+        if not len(self.rates):
+            return np.full(len(dates), self.default_rate)
+        positions = np.searchsorted(self.dates, dates, side='right') - 1
+        rates = self.rates[np.clip(positions, 0, len(self.rates) - 1)]
+        return np.where(np.isnat(dates), self.latest_rate, rates)
+
+    def to_pen(self, montos, fechas):
+        """Convierte un arreglo de montos en USD a PEN con la tasa de su fecha."""
+        return np.asarray(montos, dtype=float) * self.rates_for(fechas)
@@ -1,117 +1,549 @@
+import argparse
+import math
+import os
 import sqlite3
 import csv
-from collections import defaultdict
+from collections import defaultdict, Counter
+from contextlib import ExitStack, closing
+from datetime import datetime
+
+from db_lock import db_write_lock
+from novedades import NOVEDADES_CARGAS_MAX, UNIDADES_COLUMNAS, unit_hash, diff_units
+from tenants import get_tenant, tenant_path
 
 DB_NAME = "database.db"
 CSV_NAME = "unidades.csv"
 PROFORMA_CSV_NAME = "proforma_unidad.csv"
-PROYECTOS_VALIDOS = ["STILL", "COS", "PS", "ANG", "NUN"]
-
-conn = sqlite3.connect(DB_NAME)
-cursor = conn.cursor()
-print("Conectado a la base de datos SQLite.")
-
-cursor.execute("DROP TABLE IF EXISTS unidades")
-cursor.execute("DROP TABLE IF EXISTS proyecto_fechas_inicio")
-print("Tablas antiguas eliminadas.")
-
-cursor.execute("""
-    CREATE TABLE unidades (
-        codigo TEXT PRIMARY KEY, nombre TEXT, estado_comercial TEXT,
-        precio_venta REAL, precio_lista REAL, precio_m2 REAL, area_techada REAL,
-        piso TEXT, nombre_tipologia TEXT, proformas_count INTEGER,
-        nombre_proyecto TEXT, codigo_proyecto TEXT, fecha_venta DATE
-    )
-""")
-print("Tabla 'unidades' creada con todas las columnas.")
+TIPO_CAMBIO_CSV_NAME = "tipo_cambio.csv"
+# Columna de fecha de proforma_unidad (la misma que selecciona data_extraction.py --reducido)
+PROFORMA_FECHA_COLUMNA = "fecha_creacion"
+PROFORMA_CHUNK_SIZE = 50_000
+# Una nueva snapshot base se escribe cuando los deltas desde la anterior suman esta fracción del catálogo
+SNAPSHOT_BASE_RATIO = 0.5
 
-cursor.execute("""
-    CREATE TABLE proyecto_fechas_inicio (
-        nombre_proyecto TEXT PRIMARY KEY,
-        fecha_inicio_venta DATE
-    )
-""")
-print("Tabla 'proyecto_fechas_inicio' creada.")
-
-# Insertar fechas de inicio de venta
-fechas_inicio = [
-    ('COSMOS', '2023-08-01'),
-    ('PACIFIC SOUL', '2024-12-01'),
-    ('STILL', '2025-06-01'),
-    ('NUNA', '2023-08-01'),
-    ('Angamos Oeste', '2025-03-01')
-]
-cursor.executemany("INSERT INTO proyecto_fechas_inicio VALUES (?, ?)", fechas_inicio)
-print("Fechas de inicio de venta insertadas.")
-
-# Leer proforma_unidad.csv y contar proformas por codigo_unidad
-print(f"Leyendo proformas desde '{PROFORMA_CSV_NAME}'...")
-proformas_por_unidad = defaultdict(int)
-try:
-    with open(PROFORMA_CSV_NAME, 'r', encoding='utf-8') as proforma_file:
+
+def inferir_dormitorios(total_habitaciones, area_techada):
+    """
+    Número de dormitorios de una unidad: usa total_habitaciones si es válido (1 a 6)
+    y si no, una heurística basada en el área techada. Retorna 0 si no se puede inferir.
+    """
+    try:
+        value = int(float(total_habitaciones))
+        if 0 < value <= 6:
+            return value
+    except (ValueError, TypeError):
+        pass
+
+    if area_techada and area_techada > 0:
+        if area_techada <= 55:
+            return 1
+        if area_techada <= 95:
+            return 2
+        if area_techada <= 135:
+            return 3
+        if area_techada <= 170:
+            return 4
+        if area_techada <= 220:
+            return 5
+        return 6
+    return 0
+
+
+def csv_tiene_columna(csv_name, columna):
+    """Indica si el encabezado del CSV incluye la columna dada (False si el archivo no existe)."""
+    try:
+        with open(csv_name, 'r', encoding='utf-8') as f:
+            return columna in next(csv.reader(f), [])
+    except FileNotFoundError:
+        return False
+
+
+def cargar_proformas(cursor, csv_name):
+    """
+    Carga proforma_unidad.csv en la tabla de hechos 'proformas' leyendo e insertando por
+    bloques, para no materializar en memoria la tabla más grande. Retorna las filas cargadas.
+    """
+    total = 0
+    with open(csv_name, 'r', encoding='utf-8') as proforma_file:
         proforma_reader = csv.DictReader(proforma_file)
+        fecha_col = PROFORMA_FECHA_COLUMNA if PROFORMA_FECHA_COLUMNA in (proforma_reader.fieldnames or []) else None
+        if fecha_col is None:
+            print(f"ADVERTENCIA: '{csv_name}' no tiene la columna '{PROFORMA_FECHA_COLUMNA}'; "
+                  "las proformas se cargan sin mes.")
+
+        bloque = []
         for proforma_row in proforma_reader:
-            codigo_unidad = proforma_row.get('codigo_unidad', '').strip()
-            if codigo_unidad:
-                proformas_por_unidad[codigo_unidad] += 1
-    print(f"Se encontraron proformas para {len(proformas_por_unidad)} unidades.")
-except FileNotFoundError:
-    print(f"ADVERTENCIA: No se encontró el archivo '{PROFORMA_CSV_NAME}'. Se usará 0 proformas para todas las unidades.")
-    proformas_por_unidad = defaultdict(int)
-
-try:
-    with open(CSV_NAME, 'r', encoding='utf-8') as csvfile:
-        csv_reader = csv.DictReader(csvfile)
-        unidades_a_insertar = []
-        
-        for row in csv_reader:
-            project_code = row.get('codigo_proyecto', '').upper()
-            if project_code not in PROYECTOS_VALIDOS: continue
-            if "estacionamiento" in row.get('tipo_unidad', '').lower(): continue
-            try:
-                if int(row.get('piso', '-1')) < 0: continue
-            except (ValueError, TypeError):
+            codigo_unidad = (proforma_row.get('codigo_unidad') or '').strip()
+            if not codigo_unidad:
                 continue
+            fecha = (proforma_row.get(fecha_col) or '')[:10] if fecha_col else ''
+            bloque.append((codigo_unidad, fecha or None, fecha[:7] or None))
+            if len(bloque) >= PROFORMA_CHUNK_SIZE:
+                cursor.executemany("INSERT INTO proformas VALUES (?, ?, ?)", bloque)
+                total += len(bloque)
+                bloque = []
+        if bloque:
+            cursor.executemany("INSERT INTO proformas VALUES (?, ?, ?)", bloque)
+            total += len(bloque)
+    return total
 
-            # NUEVO: Obtener el conteo de proformas desde proforma_unidad.csv
-            codigo_unidad = row['codigo']
-            proformas_count = proformas_por_unidad.get(codigo_unidad, 0)
 
+def cargar_tipo_cambio(cursor, csv_name):
+    """
+    Carga tipo_cambio.csv (columnas fecha, tasa: soles por dólar) en la tabla 'tipo_cambio'.
+    Retorna las filas cargadas; las filas con fecha o tasa inválida se omiten.
+    """
+    tasas = []
+    with open(csv_name, 'r', encoding='utf-8') as fx_file:
+        for row in csv.DictReader(fx_file):
+            fecha = (row.get('fecha') or '').strip()[:10]
             try:
-                precio_venta_float = float(row.get('precio_venta') or '0')
-                precio_lista_float = float(row.get('precio_lista') or '0')
-                precio_m2_float = float(row.get('precio_m2') or '0')
-                area_techada_float = float(row.get('area_techada') or '0')
-            except (ValueError, TypeError):
-                precio_venta_float, precio_lista_float, precio_m2_float, area_techada_float = 0.0, 0.0, 0.0, 0.0
-
-            # Obtener fecha_venta del CSV
-            fecha_venta = row.get('fecha_venta', '') or None
-            
-            unidad = (
-                codigo_unidad, row['nombre'], row['estado_comercial'],
-                precio_venta_float, precio_lista_float, precio_m2_float, area_techada_float,
-                row['piso'], row['nombre_tipologia'],
-                proformas_count, row['nombre_proyecto'], row['codigo_proyecto'], fecha_venta
-            )
-            unidades_a_insertar.append(unidad)
+                tasa = float(row.get('tasa') or 0)
+            except ValueError:
+                continue
+            if fecha and tasa > 0:
+                tasas.append((fecha, tasa))
+    cursor.executemany("INSERT OR REPLACE INTO tipo_cambio VALUES (?, ?)", tasas)
+    return len(tasas)
+
+
+def leer_carga_anterior(db_name):
+    """
+    Lee de la base anterior las unidades con su hash ({codigo: (hash, unidad)}) para compararlas
+    con la carga nueva; el historial no pasa por Python (ver copiar_historial).
+    Retorna None si no hay base anterior o su esquema no es compatible.
+    """
+    if not os.path.exists(db_name):
+        return None
+    try:
+        with closing(sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)) as conn:
+            tablas = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            if 'unidades' not in tablas:
+                return None
+            # Bases anteriores a unidad_hashes: el hash se calcula aquí con los mismos valores
+            hashes = dict(conn.execute("SELECT codigo, hash FROM unidad_hashes")) if 'unidad_hashes' in tablas else {}
+            unidades = {}
+            for row in conn.execute(f"SELECT {', '.join(UNIDADES_COLUMNAS)} FROM unidades"):
+                hash_unidad = hashes.get(row[0])
+                if hash_unidad is None:
+                    hash_unidad = unit_hash(row)
+                unidades[row[0]] = (hash_unidad, dict(zip(UNIDADES_COLUMNAS, row)))
+            return {'unidades': unidades}
+    except sqlite3.Error as e:
+        print(f"ADVERTENCIA: No se pudo leer la carga anterior de '{db_name}' ({e}); no se conserva el historial.")
+        return None
+
 
-        # La sentencia INSERT ya es correcta, no necesita cambios
-        cursor.executemany("""
-            INSERT INTO unidades (codigo, nombre, estado_comercial, precio_venta, precio_lista, precio_m2, area_techada, piso, nombre_tipologia, proformas_count, nombre_proyecto, codigo_proyecto, fecha_venta)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, unidades_a_insertar)
+def copiar_historial(conn, db_name):
+    """
+    Copia de la base anterior lo que se conserva entre cargas: las últimas cargas con sus
+    novedades, las snapshots históricas y el registro de cambios de precio hechos desde la app.
+    La base anterior se adjunta y las filas se copian con INSERT ... SELECT dentro de SQLite, así
+    que el costo en memoria no crece con el largo del historial.
+    """
+    conn.commit()  # ATTACH y DETACH no se permiten dentro de una transacción
+    conn.execute("ATTACH DATABASE ? AS anterior", (db_name,))
+    try:
+        tablas = {row[0] for row in conn.execute("SELECT name FROM anterior.sqlite_master WHERE type = 'table'")}
+        if {'cargas', 'novedades'} <= tablas:
+            conn.execute(
+                "INSERT INTO cargas SELECT * FROM anterior.cargas ORDER BY id DESC LIMIT ?", (NOVEDADES_CARGAS_MAX - 1,)
+            )
+            conn.execute("INSERT INTO novedades SELECT * FROM anterior.novedades WHERE carga_id >= (SELECT MIN(id) FROM cargas)")
+        if 'cambios_precio' in tablas:
+            # Bases anteriores a la columna estado: sus cambios se toman como pendientes
+            nuevas = {row[1] for row in conn.execute("PRAGMA main.table_info(cambios_precio)")}
+            columnas = ', '.join(
+                row[1] for row in conn.execute("PRAGMA anterior.table_info(cambios_precio)") if row[1] in nuevas
+            )
+            conn.execute(f"INSERT INTO cambios_precio ({columnas}) SELECT {columnas} FROM anterior.cambios_precio")
+        if {'snapshots', 'snapshot_bases', 'snapshot_deltas'} <= tablas:
+            for tabla in ('snapshots', 'snapshot_bases', 'snapshot_deltas'):
+                conn.execute(f"INSERT INTO {tabla} SELECT * FROM anterior.{tabla}")
         conn.commit()
-        print(f"\nReporte de Carga: {len(unidades_a_insertar)} registros válidos insertados.")
-
-except FileNotFoundError:
-    print(f"ERROR: No se encontró el archivo '{CSV_NAME}'.")
-except KeyError as e:
-    print(f"ERROR: Falta una columna necesaria en tu CSV: {e}.")
-# Si el error de UNIQUE constraint vuelve a aparecer, es porque hay códigos duplicados en tu CSV.
-# En ese caso, la solución 'INSERT OR IGNORE' que vimos antes sería la correcta.
-except sqlite3.IntegrityError as e:
-    print(f"ERROR DE BASE DE DATOS: {e}. Esto probablemente significa que tienes 'códigos' duplicados en tu archivo unidades.csv.")
-finally:
-    conn.close()
-    print("Conexión a la base de datos cerrada.")
\ No newline at end of file
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"ADVERTENCIA: No se pudo copiar el historial de '{db_name}' ({e}); no se conserva el historial.")
+    finally:
+        conn.execute("DETACH DATABASE anterior")
+
+
+def reaplicar_cambios_precio(cursor, unidades):
+    """
+    Vuelve a aplicar sobre las unidades leídas del CSV los precios aprobados en la app que el
+    sistema origen todavía no refleja, para que una recarga no los revierta ni los informe como
+    novedad. Por unidad se toma la cadena de cambios pendientes: si el CSV trae el precio previo
+    al primero, se aplica el precio del último; si trae el del último, la cadena queda
+    'aplicado'; con cualquier otro precio el sistema origen la reemplazó ('reemplazado').
+    Retorna la lista de unidades (tuplas en el orden de UNIDADES_COLUMNAS) y la cantidad reaplicada.
+    """
+    pendientes = defaultdict(list)
+    for id_cambio, proyecto, codigo, precio_anterior, precio_nuevo in cursor.execute(
+        "SELECT id, nombre_proyecto, codigo, precio_anterior, precio_nuevo FROM cambios_precio "
+        "WHERE estado = 'pendiente' ORDER BY id"
+    ):
+        pendientes[(proyecto, codigo)].append((id_cambio, precio_anterior, precio_nuevo))
+    if not pendientes:
+        return unidades, 0
+
+    i_lista, i_m2, i_area, i_proyecto = (
+        UNIDADES_COLUMNAS.index(c) for c in ('precio_lista', 'precio_m2', 'area_techada', 'nombre_proyecto')
+    )
+    resultado, estados, reaplicadas = [], [], 0
+    for unidad in unidades:
+        cadena = pendientes.pop((unidad[i_proyecto], unidad[0]), None)
+        if cadena:
+            precio_csv, precio_base, precio_aprobado = unidad[i_lista], cadena[0][1], cadena[-1][2]
+            if math.isclose(precio_csv, precio_aprobado, abs_tol=0.005):
+                estados += [('aplicado', id_cambio) for id_cambio, _, _ in cadena]
+            elif math.isclose(precio_csv, precio_base or 0, abs_tol=0.005):
+                unidad = list(unidad)
+                unidad[i_lista] = precio_aprobado
+                # Igual que en la app (apply_price_updates): el precio por m² sigue al de lista
+                if unidad[i_area] > 0:
+                    unidad[i_m2] = round(precio_aprobado / unidad[i_area], 2)
+                unidad = tuple(unidad)
+                reaplicadas += 1
+            else:
+                estados += [('reemplazado', id_cambio) for id_cambio, _, _ in cadena]
+        resultado.append(unidad)
+    # Unidades que ya no vienen en el CSV: no hay precio que conservar
+    estados += [('reemplazado', id_cambio) for cadena in pendientes.values() for id_cambio, _, _ in cadena]
+    cursor.executemany("UPDATE cambios_precio SET estado = ? WHERE id = ?", estados)
+    return resultado, reaplicadas
+
+
+def registrar_novedades(cursor, anterior, actuales, carga_id, fecha):
+    """
+    Guarda el hash de contenido de cada unidad cargada y las novedades respecto de la carga
+    anterior (cambios de estado y de precio, altas y bajas); el historial de las últimas
+    NOVEDADES_CARGAS_MAX cargas ya lo copió copiar_historial. Retorna la cantidad de novedades
+    de esta carga, o None si no hay carga anterior con qué comparar.
+    """
+    cursor.executemany(
+        "INSERT INTO unidad_hashes VALUES (?, ?)", ((codigo, h) for codigo, (h, _) in actuales.items())
+    )
+    cambios = []
+    if anterior is not None:
+        cambios = diff_units(anterior['unidades'], actuales)
+
+    cursor.execute("INSERT INTO cargas VALUES (?, ?, ?, ?)", (carga_id, fecha, len(actuales), len(cambios)))
+    cursor.executemany(
+        "INSERT INTO novedades VALUES (?, ?, ?, ?, ?, ?, ?)", ((carga_id,) + cambio for cambio in cambios)
+    )
+    return len(cambios) if anterior is not None else None
+
+
+def registrar_snapshot(cursor, anterior, actuales, carga_id, fecha):
+    """
+    Conserva el estado de las unidades de esta carga para consultas históricas (as_of): solo
+    las unidades cuyo hash cambió se guardan como delta, y se escribe una snapshot base
+    completa cuando no hay ninguna o cuando los deltas desde la última base ya suman
+    SNAPSHOT_BASE_RATIO del catálogo. Retorna 'base', 'delta' o None si no hubo cambios.
+    """
+    unidades_anteriores = anterior['unidades'] if anterior is not None else {}
+    insert_base = f"INSERT INTO snapshot_bases VALUES ({', '.join('?' * (len(UNIDADES_COLUMNAS) + 1))})"
+    insert_delta = f"INSERT INTO snapshot_deltas VALUES ({', '.join('?' * (len(UNIDADES_COLUMNAS) + 2))})"
+
+    # Filas de delta acumuladas desde la última base (las snapshots anteriores ya están copiadas)
+    ultima_base = cursor.execute("SELECT MAX(carga_id) FROM snapshots WHERE tipo = 'base'").fetchone()[0]
+    filas_desde_base = 0
+    if ultima_base is not None:
+        filas_desde_base = cursor.execute(
+            "SELECT COALESCE(SUM(filas), 0) FROM snapshots WHERE carga_id > ?", (ultima_base,)
+        ).fetchone()[0]
+
+    cambiadas = [
+        (carga_id, 0) + tuple(unidad[c] for c in UNIDADES_COLUMNAS)
+        for codigo, (hash_unidad, unidad) in actuales.items()
+        if unidades_anteriores.get(codigo, (None,))[0] != hash_unidad
+    ]
+    cambiadas += [
+        (carga_id, 1) + tuple(unidad[c] for c in UNIDADES_COLUMNAS)
+        for codigo, (_, unidad) in unidades_anteriores.items()
+        if codigo not in actuales
+    ]
+
+    if ultima_base is None or filas_desde_base + len(cambiadas) >= SNAPSHOT_BASE_RATIO * len(actuales):
+        cursor.executemany(
+            insert_base,
+            ((carga_id,) + tuple(unidad[c] for c in UNIDADES_COLUMNAS) for _, unidad in actuales.values())
+        )
+        cursor.execute("INSERT INTO snapshots VALUES (?, ?, 'base', ?)", (carga_id, fecha, len(actuales)))
+        return 'base'
+    if cambiadas:
+        cursor.executemany(insert_delta, cambiadas)
+        cursor.execute("INSERT INTO snapshots VALUES (?, ?, 'delta', ?)", (carga_id, fecha, len(cambiadas)))
+        return 'delta'
+    return None
+
+
+def main(tenant_id=None):
+    tenant = get_tenant(tenant_id)
+    os.makedirs(tenant.directorio, exist_ok=True)
+    db_name = tenant_path(tenant, DB_NAME)
+    csv_name = tenant_path(tenant, CSV_NAME)
+    proforma_csv_name = tenant_path(tenant, PROFORMA_CSV_NAME)
+    tipo_cambio_csv_name = tenant_path(tenant, TIPO_CAMBIO_CSV_NAME)
+    proyectos_validos = {codigo.upper() for codigo in tenant.proyectos_validos}
+    print(f"Inquilino: {tenant.nombre} ({tenant.id}), directorio de datos '{tenant.directorio}'.")
+
+    # La base se construye en un archivo temporal y reemplaza a la anterior de forma atómica al
+    # final: la app sigue leyendo la versión previa completa mientras dura la carga.
+    tmp_db_name = f"{db_name}.tmp"
+    if os.path.exists(tmp_db_name):
+        os.remove(tmp_db_name)
+    conn = sqlite3.connect(tmp_db_name)
+    cursor = conn.cursor()
+    carga_completa = False
+    # El bloqueo de escritura se toma antes de leer la base anterior y se suelta después del
+    # reemplazo: un cambio de precio de la app se confirma antes (y se copia) o después (sobre la nueva)
+    bloqueo = ExitStack()
+    print("Conectado a la base de datos SQLite.")
+
+    cursor.execute("DROP TABLE IF EXISTS unidades")
+    cursor.execute("DROP TABLE IF EXISTS proyecto_fechas_inicio")
+    cursor.execute("DROP TABLE IF EXISTS tipologia_dormitorios")
+    cursor.execute("DROP TABLE IF EXISTS proformas")
+    cursor.execute("DROP TABLE IF EXISTS tipo_cambio")
+    cursor.execute("DROP TABLE IF EXISTS unidad_hashes")
+    cursor.execute("DROP TABLE IF EXISTS cargas")
+    cursor.execute("DROP TABLE IF EXISTS novedades")
+    cursor.execute("DROP TABLE IF EXISTS snapshots")
+    cursor.execute("DROP TABLE IF EXISTS snapshot_bases")
+    cursor.execute("DROP TABLE IF EXISTS snapshot_deltas")
+    cursor.execute("DROP TABLE IF EXISTS cambios_precio")
+    print("Tablas antiguas eliminadas.")
+
+    cursor.execute("""
+        CREATE TABLE unidades (
+            codigo TEXT PRIMARY KEY, nombre TEXT, estado_comercial TEXT,
+            precio_venta REAL, precio_lista REAL, precio_m2 REAL, area_techada REAL,
+            piso TEXT, nombre_tipologia TEXT, proformas_count INTEGER,
+            nombre_proyecto TEXT, codigo_proyecto TEXT, fecha_venta DATE,
+            dormitorios INTEGER, fecha_separacion DATE
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_unidades_proyecto ON unidades (nombre_proyecto)")
+    print("Tabla 'unidades' creada con todas las columnas.")
+
+    cursor.execute("""
+        CREATE TABLE proformas (
+            codigo_unidad TEXT NOT NULL, fecha_proforma DATE, mes TEXT
+        )
+    """)
+    print("Tabla 'proformas' creada.")
+
+    cursor.execute("""
+        CREATE TABLE tipo_cambio (
+            fecha DATE PRIMARY KEY, tasa REAL NOT NULL
+        )
+    """)
+    print("Tabla 'tipo_cambio' creada.")
+
+    cursor.execute("""
+        CREATE TABLE tipologia_dormitorios (
+            nombre_proyecto TEXT, nombre_tipologia TEXT, dormitorios INTEGER,
+            PRIMARY KEY (nombre_proyecto, nombre_tipologia)
+        )
+    """)
+    print("Tabla 'tipologia_dormitorios' creada.")
+
+    cursor.execute("""
+        CREATE TABLE proyecto_fechas_inicio (
+            nombre_proyecto TEXT PRIMARY KEY,
+            fecha_inicio_venta DATE
+        )
+    """)
+    print("Tabla 'proyecto_fechas_inicio' creada.")
+
+    # Hash de contenido por unidad y novedades entre cargas (ver novedades.py)
+    cursor.execute("CREATE TABLE unidad_hashes (codigo TEXT PRIMARY KEY, hash INTEGER NOT NULL) WITHOUT ROWID")
+    cursor.execute("""
+        CREATE TABLE cargas (
+            id INTEGER PRIMARY KEY, fecha TEXT, unidades INTEGER, cambios INTEGER
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE novedades (
+            carga_id INTEGER NOT NULL, nombre_proyecto TEXT, codigo TEXT, nombre_tipologia TEXT,
+            campo TEXT, valor_anterior, valor_nuevo
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_novedades_proyecto_carga ON novedades (nombre_proyecto, carga_id)")
+    print("Tablas 'unidad_hashes', 'cargas' y 'novedades' creadas.")
+
+    # Snapshots históricas: bases completas y deltas por carga, con las columnas de 'unidades'
+    cursor.execute("CREATE TABLE snapshots (carga_id INTEGER PRIMARY KEY, fecha DATE, tipo TEXT, filas INTEGER)")
+    cursor.execute(f"""
+        CREATE TABLE snapshot_bases (
+            carga_id INTEGER NOT NULL, {', '.join(UNIDADES_COLUMNAS)},
+            PRIMARY KEY (carga_id, codigo)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TABLE snapshot_deltas (
+            carga_id INTEGER NOT NULL, baja INTEGER NOT NULL, {', '.join(UNIDADES_COLUMNAS)},
+            PRIMARY KEY (carga_id, codigo)
+        ) WITHOUT ROWID
+    """)
+    print("Tablas de snapshots históricas creadas.")
+
+    # Cambios de precio aprobados en la app (POST /update-price), para reingresarlos en el sistema
+    # origen. Quedan 'pendiente' hasta que unidades.csv trae el precio aprobado ('aplicado') u otro
+    # distinto ('reemplazado'); mientras tanto cada carga los vuelve a aplicar (ver reaplicar_cambios_precio)
+    cursor.execute("""
+        CREATE TABLE cambios_precio (
+            id INTEGER PRIMARY KEY, fecha TEXT, nombre_proyecto TEXT, codigo TEXT, nombre_tipologia TEXT,
+            nivel TEXT, precio_anterior REAL, precio_nuevo REAL, estado TEXT NOT NULL DEFAULT 'pendiente'
+        )
+    """)
+    print("Tabla 'cambios_precio' creada.")
+
+    # Insertar fechas de inicio de venta (definidas por inquilino en tenants.json)
+    cursor.executemany("INSERT INTO proyecto_fechas_inicio VALUES (?, ?)", list(tenant.fechas_inicio.items()))
+    print("Fechas de inicio de venta insertadas.")
+
+    # Tipo de cambio por fecha; sin archivo la app usa su tipo de cambio por defecto
+    try:
+        print(f"{cargar_tipo_cambio(cursor, tipo_cambio_csv_name)} tipos de cambio cargados desde '{tipo_cambio_csv_name}'.")
+    except FileNotFoundError:
+        print(f"ADVERTENCIA: No se encontró el archivo '{tipo_cambio_csv_name}'. Se usará el tipo de cambio por defecto.")
+
+    # Cargar proforma_unidad.csv en la tabla de hechos y contar proformas por unidad con SQL.
+    # Si la extracción reducida (data_extraction.py --reducido) ya trae proformas_count, se usa ese valor.
+    proformas_precalculadas = csv_tiene_columna(csv_name, 'proformas_count')
+    proformas_por_unidad = {}
+    print(f"Cargando proformas desde '{proforma_csv_name}'...")
+    try:
+        total_proformas = cargar_proformas(cursor, proforma_csv_name)
+        cursor.execute("CREATE INDEX idx_proformas_unidad_mes ON proformas (codigo_unidad, mes)")
+        proformas_por_unidad = dict(cursor.execute(
+            "SELECT codigo_unidad, COUNT(*) FROM proformas GROUP BY codigo_unidad"
+        ).fetchall())
+        print(f"{total_proformas} proformas cargadas para {len(proformas_por_unidad)} unidades.")
+    except FileNotFoundError:
+        cursor.execute("CREATE INDEX idx_proformas_unidad_mes ON proformas (codigo_unidad, mes)")
+        if proformas_precalculadas:
+            print(f"'{csv_name}' ya incluye proformas_count; no se encontró '{proforma_csv_name}' para la tabla de hechos.")
+        else:
+            print(f"ADVERTENCIA: No se encontró el archivo '{proforma_csv_name}'. Se usará 0 proformas para todas las unidades.")
+
+    try:
+        with open(csv_name, 'r', encoding='utf-8') as csvfile:
+            csv_reader = csv.DictReader(csvfile)
+            unidades_a_insertar = []
+            dormitorios_por_tipologia = defaultdict(list)
+
+            for row in csv_reader:
+                project_code = row.get('codigo_proyecto', '').upper()
+                if project_code not in proyectos_validos: continue
+                if "estacionamiento" in row.get('tipo_unidad', '').lower(): continue
+                try:
+                    if int(row.get('piso', '-1')) < 0: continue
+                except (ValueError, TypeError):
+                    continue
+
+                # NUEVO: Obtener el conteo de proformas desde proforma_unidad.csv
+                codigo_unidad = row['codigo']
+                if proformas_precalculadas:
+                    proformas_count = int(float(row.get('proformas_count') or 0))
+                else:
+                    proformas_count = proformas_por_unidad.get(codigo_unidad, 0)
+
+                try:
+                    precio_venta_float = float(row.get('precio_venta') or '0')
+                    precio_lista_float = float(row.get('precio_lista') or '0')
+                    precio_m2_float = float(row.get('precio_m2') or '0')
+                    area_techada_float = float(row.get('area_techada') or '0')
+                except (ValueError, TypeError):
+                    precio_venta_float, precio_lista_float, precio_m2_float, area_techada_float = 0.0, 0.0, 0.0, 0.0
+
+                # Obtener fecha_venta y fecha_separacion del CSV
+                fecha_venta = row.get('fecha_venta', '') or None
+                fecha_separacion = row.get('fecha_separacion', '') or None
+
+                # Dormitorios resueltos una sola vez en la carga
+                dormitorios = inferir_dormitorios(row.get('total_habitaciones'), area_techada_float)
+                if dormitorios > 0:
+                    dormitorios_por_tipologia[(row['nombre_proyecto'], row['nombre_tipologia'])].append(dormitorios)
+
+                unidad = (
+                    codigo_unidad, row['nombre'], row['estado_comercial'],
+                    precio_venta_float, precio_lista_float, precio_m2_float, area_techada_float,
+                    row['piso'], row['nombre_tipologia'],
+                    proformas_count, row['nombre_proyecto'], row['codigo_proyecto'], fecha_venta,
+                    dormitorios, fecha_separacion
+                )
+                unidades_a_insertar.append(unidad)
+
+            # Historial entre cargas (novedades, snapshots y cambios de precio) y precios aprobados
+            # en la app que el CSV todavía no trae, antes de insertar y comparar con la carga anterior
+            bloqueo.enter_context(db_write_lock(db_name))
+            anterior = leer_carga_anterior(db_name)
+            if anterior is not None:
+                copiar_historial(conn, db_name)
+            unidades_a_insertar, reaplicadas = reaplicar_cambios_precio(cursor, unidades_a_insertar)
+            if reaplicadas:
+                print(f"{reaplicadas} precios aprobados en la app reaplicados (pendientes en el sistema origen).")
+
+            # La sentencia INSERT ya es correcta, no necesita cambios
+            cursor.executemany("""
+                INSERT INTO unidades (codigo, nombre, estado_comercial, precio_venta, precio_lista, precio_m2, area_techada, piso, nombre_tipologia, proformas_count, nombre_proyecto, codigo_proyecto, fecha_venta, dormitorios, fecha_separacion)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, unidades_a_insertar)
+
+            # Moda de dormitorios por tipología
+            cursor.executemany(
+                "INSERT INTO tipologia_dormitorios VALUES (?, ?, ?)",
+                [
+                    (proyecto, tipologia, Counter(valores).most_common(1)[0][0])
+                    for (proyecto, tipologia), valores in dormitorios_por_tipologia.items()
+                ]
+            )
+
+            # Novedades y snapshots para consultas as_of
+            actuales = {u[0]: (unit_hash(u), dict(zip(UNIDADES_COLUMNAS, u))) for u in unidades_a_insertar}
+            carga_id = cursor.execute(
+                "SELECT COALESCE(MAX(id), 0) + 1 FROM (SELECT id FROM cargas UNION ALL SELECT carga_id FROM snapshots)"
+            ).fetchone()[0]
+            ahora = datetime.now()
+            total_novedades = registrar_novedades(
+                cursor, anterior, actuales, carga_id, ahora.isoformat(timespec='seconds')
+            )
+            if total_novedades is None:
+                print("Primera carga: no hay carga anterior con qué comparar.")
+            else:
+                print(f"{total_novedades} novedades respecto de la carga anterior.")
+            tipo_snapshot = registrar_snapshot(cursor, anterior, actuales, carga_id, ahora.date().isoformat())
+            print(f"Snapshot histórica: {tipo_snapshot or 'sin cambios'}.")
+            conn.commit()
+            carga_completa = True
+            print(f"\nReporte de Carga: {len(unidades_a_insertar)} registros válidos insertados.")
+
+    except FileNotFoundError:
+        print(f"ERROR: No se encontró el archivo '{csv_name}'.")
+    except KeyError as e:
+        print(f"ERROR: Falta una columna necesaria en tu CSV: {e}.")
+    # Si el error de UNIQUE constraint vuelve a aparecer, es porque hay códigos duplicados en tu CSV.
+    # En ese caso, la solución 'INSERT OR IGNORE' que vimos antes sería la correcta.
+    except sqlite3.IntegrityError as e:
+        print(f"ERROR DE BASE DE DATOS: {e}. Esto probablemente significa que tienes 'códigos' duplicados en tu archivo unidades.csv.")
+    finally:
+        conn.close()
+        print("Conexión a la base de datos cerrada.")
+        # Si la carga falló se conserva la base anterior (si no hay ninguna, queda el esquema vacío)
+        if carga_completa or not os.path.exists(db_name):
+            os.replace(tmp_db_name, db_name)
+            print(f"Base de datos '{db_name}' actualizada.")
+        else:
+            os.remove(tmp_db_name)
+            print(f"Se conserva la base de datos anterior '{db_name}'.")
+        bloqueo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construye database.db a partir de los CSV extraídos.")
+    parser.add_argument("--tenant", help="Inquilino de tenants.json (por defecto, el inquilino por defecto).")
+    args = parser.parse_args()
+    main(tenant_id=args.tenant)
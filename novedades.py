@@ -0,0 +1,76 @@
+"""
+Novedades entre cargas: qué unidades cambiaron de estado o de precio desde la carga anterior.
+
+init_db.py guarda un hash de contenido por unidad (tabla unidad_hashes). En la siguiente carga
+los hashes nuevos se cruzan con los anteriores por código (hash join con un dict, lineal en el
+tamaño del catálogo) y solo las unidades con hash distinto se comparan campo a campo. El
+resultado es una fila por campo cambiado en la tabla 'novedades'.
+"""
+import hashlib
+
+# Orden de las columnas de 'unidades' (el mismo con que se calcula el hash de contenido)
+UNIDADES_COLUMNAS = (
+    'codigo', 'nombre', 'estado_comercial', 'precio_venta', 'precio_lista', 'precio_m2', 'area_techada',
+    'piso', 'nombre_tipologia', 'proformas_count', 'nombre_proyecto', 'codigo_proyecto', 'fecha_venta',
+    'dormitorios', 'fecha_separacion'
+)
+# Campos cuyo cambio se informa; un cambio en otros campos modifica el hash pero no genera novedad
+CAMPOS_SEGUIDOS = ('estado_comercial', 'precio_lista', 'precio_venta')
+# Pseudo-campos para unidades que aparecen o desaparecen entre cargas
+CAMPO_ALTA = 'alta'
+CAMPO_BAJA = 'baja'
+# Cargas cuyas novedades se conservan (la actual incluida)
+NOVEDADES_CARGAS_MAX = 30
+
+
+def unit_hash(values):
+    """Hash de contenido de una unidad (tupla de valores en orden fijo) como entero de 64 bits con signo."""
+    digest = hashlib.blake2b(repr(tuple(values)).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def diff_units(anteriores, actuales):
+    """
+    Compara dos cargas. Cada una es {codigo: (hash, unidad)} donde unidad es un dict con al
+    menos nombre_proyecto, nombre_tipologia y CAMPOS_SEGUIDOS.
+    Retorna tuplas (nombre_proyecto, codigo, nombre_tipologia, campo, valor_anterior, valor_nuevo).
+    """
+    cambios = []
+    for codigo, (hash_actual, unidad) in actuales.items():
+        previa = anteriores.get(codigo)
+        if previa is None:
+            cambios.append((unidad['nombre_proyecto'], codigo, unidad['nombre_tipologia'],
+                            CAMPO_ALTA, None, unidad['estado_comercial']))
+            continue
+        hash_anterior, unidad_anterior = previa
+        if hash_anterior == hash_actual:
+            continue
+        for campo in CAMPOS_SEGUIDOS:
+            if unidad_anterior[campo] != unidad[campo]:
+                cambios.append((unidad['nombre_proyecto'], codigo, unidad['nombre_tipologia'],
+                                campo, unidad_anterior[campo], unidad[campo]))
+    for codigo, (_, unidad_anterior) in anteriores.items():
+        if codigo not in actuales:
+            cambios.append((unidad_anterior['nombre_proyecto'], codigo, unidad_anterior['nombre_tipologia'],
+                            CAMPO_BAJA, unidad_anterior['estado_comercial'], None))
+    return cambios
+
+
+def summarize_changes(cambios):
+    """
+    Resumen de una lista de novedades (dicts con campo, valor_anterior y valor_nuevo): transiciones
+    de estado ('disponible → separado': n), cambios de precio por campo, altas y bajas.
+    """
+    resumen = {'transiciones': {}, 'precios': {}, 'altas': 0, 'bajas': 0}
+    for cambio in cambios:
+        campo = cambio['campo']
+        if campo == 'estado_comercial':
+            clave = f"{cambio['valor_anterior']} → {cambio['valor_nuevo']}"
+            resumen['transiciones'][clave] = resumen['transiciones'].get(clave, 0) + 1
+        elif campo == CAMPO_ALTA:
+            resumen['altas'] += 1
+        elif campo == CAMPO_BAJA:
+            resumen['bajas'] += 1
+        else:
+            resumen['precios'][campo] = resumen['precios'].get(campo, 0) + 1
+    return resumen
@@ -0,0 +1,113 @@
+"""
+Captura de perfiles de peticiones individuales (cProfile + tracemalloc).
+
+Cada captura se guarda en un directorio (por defecto logs/profiles/) como tres archivos con
+el mismo nombre base: .prof (estadísticas de cProfile, para snakeviz o pstats), .txt (resumen
+legible con las funciones más costosas y las líneas que más memoria asignaron) y .json
+(metadatos para el índice de capturas).
+
+tracemalloc es global al proceso: si otras peticiones corren en paralelo en el mismo worker
+sus asignaciones también aparecen en la captura. Por eso solo se perfila una petición a la vez.
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_TOP_N = 30
+_capture_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Perfil de una petición: se inicia con start() y se guarda en disco con stop()."""
+
+    def __init__(self, directory, label, top_n=PROFILE_TOP_N):
+        self.directory = Path(directory)
+        self.label = label
+        self.top_n = top_n
+        self.capture_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        self._profiler = cProfile.Profile()
+        self._started_tracemalloc = False
+        self._start = None
+
+    @classmethod
+    def try_start(cls, directory, label, top_n=PROFILE_TOP_N):
+        """Inicia una captura, o retorna None si ya hay otra en curso en este proceso."""
+        if not _capture_lock.acquire(blocking=False):
+            return None
+        profile = cls(directory, label, top_n)
+        profile.start()
+        return profile
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self._profiler.enable()
+
+    def stop(self, status_code=None):
+        """Detiene la captura, escribe los archivos y retorna los metadatos guardados."""
+        try:
+            self._profiler.disable()
+            duration_ms = (time.perf_counter() - self._start) * 1000
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            return self._write(duration_ms, peak, snapshot, status_code)
+        finally:
+            _capture_lock.release()
+
+    def _write(self, duration_ms, peak_bytes, snapshot, status_code):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / self.capture_id
+
+        self._profiler.dump_stats(f"{base}.prof")
+
+        stats_text = io.StringIO()
+        pstats.Stats(self._profiler, stream=stats_text).sort_stats('cumulative').print_stats(self.top_n)
+        memory_lines = [
+            str(stat) for stat in snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )).statistics('lineno')[:self.top_n]
+        ]
+
+        metadata = {
+            'id': self.capture_id,
+            'label': self.label,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'duracion_ms': round(duration_ms, 1),
+            'memoria_pico_kb': round(peak_bytes / 1024, 1),
+            'status': status_code,
+        }
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(f"{self.label}\n")
+            f.write(f"Duración: {metadata['duracion_ms']} ms | Memoria pico: {metadata['memoria_pico_kb']} KB\n\n")
+            f.write(f"=== cProfile (top {self.top_n} por tiempo acumulado) ===\n")
+            f.write(stats_text.getvalue())
+            f.write(f"\n=== tracemalloc (top {self.top_n} líneas por memoria asignada) ===\n")
+            f.write("\n".join(memory_lines) + "\n")
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        return metadata
+
+
+def list_captures(directory, limit=50):
+    """Metadatos de las capturas más recientes del directorio, de la más nueva a la más antigua."""
+    captures = []
+    for path in sorted(Path(directory).glob('*.json'), reverse=True)[:limit]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return captures
@@ -0,0 +1,60 @@
+"""
+Coalescencia de cálculos idénticos concurrentes ("single-flight").
+
+Cuando varios hilos piden el mismo cálculo (misma clave) al mismo tiempo, solo el primero
+lo ejecuta; los demás esperan y reciben el mismo resultado (o la misma excepción).
+No es una caché: en cuanto el cálculo termina, la siguiente llamada vuelve a ejecutarlo.
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Grupo de llamadas coalescidas por clave dentro de un proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) una sola vez por clave entre llamadas concurrentes.
+        La clave debe ser hashable e incluir todo lo que determina el resultado.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        """Número de cálculos en curso (útil para métricas)."""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,125 @@
+"""
+Caché LRU con presupuesto de memoria.
+
+A diferencia de functools.lru_cache, que limita el número de entradas, SizedLRUCache limita
+los bytes estimados que ocupan los valores y desaloja los menos usados hasta volver a
+entrar en el presupuesto. Se usa una caché por inquilino para que un inquilino grande no
+desaloje los datos calientes de los demás.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(obj, _seen=None):
+    """
+    Tamaño aproximado en bytes de un objeto y lo que contiene (contenedores, arreglos NumPy,
+    DataFrames de pandas y atributos de objetos). Cada objeto se cuenta una sola vez.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    module = type(obj).__module__
+    if module.startswith('pandas') and callable(getattr(obj, 'memory_usage', None)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+    if module == 'numpy':
+        return max(int(getattr(obj, 'nbytes', 0)), sys.getsizeof(obj, 0))
+
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'Row':
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class SizedLRUCache:
+    """LRU seguro entre hilos cuyo límite es un presupuesto de bytes estimados."""
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """
+        Guarda un valor y desaloja los menos usados si se excede el presupuesto. Un valor más
+        grande que todo el presupuesto no se guarda. Retorna True si quedó en la caché.
+        """
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if size > self.budget_bytes:
+                return False
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def transform_entries(self, transform):
+        """
+        Reescribe las entradas en su lugar, conservando el orden LRU: transform(key, value)
+        retorna (nueva_key, nuevo_valor) o None para descartar la entrada.
+        """
+        with self._lock:
+            entries = OrderedDict()
+            self._bytes = 0
+            for key, (value, size) in self._entries.items():
+                result = transform(key, value)
+                if result is None:
+                    continue
+                new_key, new_value = result
+                if new_value is not value:
+                    size = estimate_size(new_value)
+                if new_key in entries:
+                    self._bytes -= entries.pop(new_key)[1]
+                entries[new_key] = (new_value, size)
+                self._bytes += size
+            self._entries = entries
+            while self._bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Uso de la caché: entradas, bytes, presupuesto, aciertos, fallos y desalojos."""
+        with self._lock:
+            return {
+                'entradas': len(self._entries),
+                'bytes': self._bytes,
+                'presupuesto_bytes': self.budget_bytes,
+                'aciertos': self.hits,
+                'fallos': self.misses,
+                'desalojos': self.evictions,
+            }
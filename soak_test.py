@@ -0,0 +1,326 @@
+"""
+Prueba de carga sostenida (soak test) de la app bajo gunicorn con recargas de datos.
+
+Levanta gunicorn con el número de workers/threads indicado sobre una copia de los datos en
+un directorio temporal, lanza clientes concurrentes con tráfico HTMX mixto (página completa,
+parrilla, sidebar, filtros, dashboard) y, a mitad de la prueba, vuelve a ejecutar init_db.py
+con precios modificados para forzar una nueva versión de datos. Al final reporta:
+
+- throughput y latencia (p50/p95/p99/máx), en total y durante las recargas;
+- errores HTTP y de conexión, y las líneas "database is locked" / "no such table" del log de gunicorn;
+- lecturas obsoletas: respuestas a peticiones iniciadas después de terminar una recarga que
+  aún llevan en X-Data-Version una versión anterior a ella.
+
+Termina con código 1 si hubo errores o lecturas obsoletas, para poder comparar modelos de
+workers y comprobar que las recargas son seguras.
+
+Uso:
+    python soak_test.py --workers 2 --threads 4 --clients 16 --duration 60 --reloads 2
+"""
+import argparse
+import csv
+import http.client
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, urlencode
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+# Archivos de entrada de init_db.py que se copian al directorio temporal si existen
+DATA_FILES = ("unidades.csv", "proforma_unidad.csv", "tipo_cambio.csv", "Tb_utf8.csv")
+DB_ERROR_PATTERNS = ("database is locked", "no such table")
+REQUEST_TIMEOUT = 30
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def workdir_env(workdir):
+    """
+    Entorno de init_db.py y gunicorn: tenants.json copiado al directorio de trabajo, así los
+    directorios de los inquilinos ("." incluido) se resuelven dentro de él (ver tenants.py).
+    """
+    return {**os.environ, "TENANTS_FILE": str(workdir / "tenants.json")}
+
+
+def prepare_workdir(workdir):
+    """Copia los CSV de entrada y tenants.json al directorio de trabajo y construye database.db allí."""
+    for name in DATA_FILES + ("tenants.json",):
+        if (PROJECT_ROOT / name).exists():
+            shutil.copy(PROJECT_ROOT / name, workdir / name)
+    run_reload(workdir, factor=None)
+
+
+def run_reload(workdir, factor=1.01):
+    """
+    Ejecuta init_db.py en el directorio de trabajo. Con `factor` multiplica antes los precios de
+    lista de unidades.csv, para que todos los proyectos cambien de versión de datos.
+    """
+    if factor is not None:
+        csv_path = workdir / "unidades.csv"
+        with open(csv_path, encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames
+            rows = list(reader)
+        for row in rows:
+            try:
+                row["precio_lista"] = f"{float(row['precio_lista']) * factor:.2f}"
+            except (KeyError, TypeError, ValueError):
+                continue
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+    subprocess.run(
+        [sys.executable, str(PROJECT_ROOT / "init_db.py")], cwd=workdir, env=workdir_env(workdir), check=True,
+        capture_output=True
+    )
+
+
+def load_targets(workdir, max_projects):
+    """Proyectos y tipologías disponibles en la base del directorio de trabajo."""
+    conn = sqlite3.connect(workdir / "database.db")
+    rows = conn.execute(
+        "SELECT DISTINCT nombre_proyecto, nombre_tipologia FROM unidades WHERE nombre_tipologia != ''"
+    ).fetchall()
+    conn.close()
+    targets = {}
+    for project, tipologia in rows:
+        targets.setdefault(project, []).append(tipologia)
+    projects = sorted(targets)[:max_projects]
+    return {project: sorted(targets[project]) for project in projects}
+
+
+def build_request(targets, rng):
+    """Elige una petición del tráfico mixto: (tipo, ruta, cabeceras)."""
+    project = rng.choice(list(targets))
+    base = f"/pricing/{quote(project)}"
+    kind = rng.choices(
+        ("pagina", "parrilla", "sidebar", "filtro", "dashboard"), weights=(2, 4, 2, 3, 1)
+    )[0]
+    htmx = {"HX-Request": "true"}
+    if kind == "pagina":
+        return kind, base, {}
+    if kind == "parrilla":
+        vista = rng.choice(("precio", "codigo", "precio_m2", "proformas", "area_total"))
+        return kind, f"{base}?{urlencode({'vista': vista})}", {**htmx, "HX-Target": "grid-container"}
+    if kind == "sidebar":
+        return kind, base, {**htmx, "HX-Target": "sidebar-stats"}
+    if kind == "filtro":
+        tipologias = rng.sample(targets[project], k=min(len(targets[project]), rng.randint(1, 2)))
+        return kind, f"{base}?{urlencode({'tipologia': tipologias}, doseq=True)}", htmx
+    return kind, f"/dashboard/{quote(project)}", {}
+
+
+def client_loop(port, targets, stop_at, results, seed):
+    """Un cliente con conexión keep-alive que envía peticiones hasta `stop_at`."""
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+    while time.monotonic() < stop_at:
+        kind, path, headers = build_request(targets, rng)
+        start = time.monotonic()
+        record = {"kind": kind, "project": path.split("/")[2], "start": start}
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            record.update(status=response.status, version=response.getheader("X-Data-Version"))
+        except (OSError, http.client.HTTPException) as e:
+            record.update(status=None, error=type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=REQUEST_TIMEOUT)
+        record["end"] = time.monotonic()
+        results.append(record)
+    conn.close()
+
+
+def start_gunicorn(workdir, port, workers, threads, log_path):
+    command = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--threads", str(threads),
+        "--chdir", str(workdir), "--pythonpath", str(PROJECT_ROOT),
+        "--timeout", "120", "--error-logfile", "-",
+    ]
+    log_file = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        command, cwd=workdir, env=workdir_env(workdir), stdout=log_file, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó al arrancar; revisa {log_path}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process, log_file
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn no respondió a tiempo")
+
+
+def find_stale_reads(results, reloads):
+    """
+    Respuestas obsoletas: la petición empezó después de terminar una recarga, pero su
+    X-Data-Version es una versión que ya se había servido para ese proyecto antes de la recarga.
+    """
+    stale = []
+    for reload_start, reload_end in reloads:
+        old_versions = {
+            (r["project"], r.get("version")) for r in results
+            if r["end"] < reload_start and r.get("version")
+        }
+        stale.extend(
+            r for r in results
+            if r["start"] > reload_end and (r["project"], r.get("version")) in old_versions
+        )
+    return stale
+
+
+def summarize(results, reloads, duration, log_path):
+    """Arma el reporte de la prueba a partir de las peticiones registradas."""
+    latencies = [(r["end"] - r["start"]) * 1000 for r in results if r.get("status")]
+    during_reload = [
+        (r["end"] - r["start"]) * 1000 for r in results
+        if r.get("status") and any(start <= r["start"] <= end for start, end in reloads)
+    ]
+    log_text = Path(log_path).read_text(encoding="utf-8", errors="replace")
+    by_status = {}
+    for r in results:
+        key = r.get("status") or r.get("error")
+        by_status[key] = by_status.get(key, 0) + 1
+    by_kind = {}
+    for r in results:
+        by_kind[r["kind"]] = by_kind.get(r["kind"], 0) + 1
+
+    return {
+        "peticiones": len(results),
+        "throughput_rps": round(len(results) / duration, 1) if duration else 0.0,
+        "latencia_ms": {
+            "p50": round(statistics.median(latencies), 1) if latencies else 0.0,
+            "p95": round(_percentile(latencies, 95), 1),
+            "p99": round(_percentile(latencies, 99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+        "latencia_durante_recarga_ms": {
+            "peticiones": len(during_reload),
+            "p95": round(_percentile(during_reload, 95), 1),
+            "p99": round(_percentile(during_reload, 99), 1),
+        },
+        "por_tipo": by_kind,
+        "por_estado": by_status,
+        "errores_http": sum(1 for r in results if r.get("status") and r["status"] >= 500),
+        "errores_conexion": sum(1 for r in results if r.get("error")),
+        "errores_bd": {pattern: log_text.count(pattern) for pattern in DB_ERROR_PATTERNS},
+        "lecturas_obsoletas": len(find_stale_reads(results, reloads)),
+        "recargas_s": [round(end - start, 2) for start, end in reloads],
+    }
+
+
+def run_soak(workers=2, threads=4, clients=16, duration=60.0, reloads=2, max_projects=5, keep_workdir=False):
+    """Ejecuta la prueba completa y retorna el reporte (ver summarize)."""
+    workdir = Path(tempfile.mkdtemp(prefix="soak_"))
+    log_path = workdir / "gunicorn.log"
+    process = log_file = None
+    try:
+        prepare_workdir(workdir)
+        targets = load_targets(workdir, max_projects)
+        if not targets:
+            raise RuntimeError("La base generada no tiene proyectos con tipologías.")
+
+        port = _free_port()
+        process, log_file = start_gunicorn(workdir, port, workers, threads, log_path)
+
+        results = []
+        started = time.monotonic()
+        stop_at = started + duration
+        client_threads = [
+            threading.Thread(target=client_loop, args=(port, targets, stop_at, results, seed), daemon=True)
+            for seed in range(clients)
+        ]
+        for t in client_threads:
+            t.start()
+
+        reload_windows = []
+        for i in range(reloads):
+            time.sleep(max(0.0, started + duration * (i + 1) / (reloads + 1) - time.monotonic()))
+            reload_start = time.monotonic()
+            run_reload(workdir)
+            reload_windows.append((reload_start, time.monotonic()))
+
+        for t in client_threads:
+            t.join()
+        elapsed = time.monotonic() - started
+        log_file.flush()
+        report = summarize(results, reload_windows, elapsed, log_path)
+        report["configuracion"] = {
+            "workers": workers, "threads": threads, "clientes": clients,
+            "duracion_s": duration, "recargas": reloads, "proyectos": list(targets),
+        }
+        report["directorio"] = str(workdir)
+        return report
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if log_file is not None:
+            log_file.close()
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test de la app bajo gunicorn con recargas de datos.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=60.0, help="Duración en segundos.")
+    parser.add_argument("--reloads", type=int, default=2, help="Recargas de init_db.py durante la prueba.")
+    parser.add_argument("--max-projects", type=int, default=5)
+    parser.add_argument("--keep-workdir", action="store_true", help="Conserva el directorio temporal y el log.")
+    args = parser.parse_args()
+
+    report = run_soak(
+        args.workers, args.threads, args.clients, args.duration, args.reloads, args.max_projects, args.keep_workdir
+    )
+    config = report["configuracion"]
+    print(f"gunicorn: {config['workers']} workers x {config['threads']} threads, "
+          f"{config['clientes']} clientes, {config['duracion_s']:.0f} s, {config['recargas']} recargas")
+    print(f"Peticiones: {report['peticiones']} ({report['throughput_rps']} req/s)")
+    latencia = report["latencia_ms"]
+    print(f"Latencia: p50 {latencia['p50']} ms | p95 {latencia['p95']} ms | p99 {latencia['p99']} ms | máx {latencia['max']} ms")
+    durante = report["latencia_durante_recarga_ms"]
+    print(f"Durante recargas ({durante['peticiones']} peticiones): p95 {durante['p95']} ms | p99 {durante['p99']} ms")
+    print(f"Duración de las recargas: {', '.join(f'{s} s' for s in report['recargas_s']) or '-'}")
+    print(f"Por estado: {report['por_estado']}")
+    print(f"Errores HTTP 5xx: {report['errores_http']} | de conexión: {report['errores_conexion']}")
+    for pattern, count in report["errores_bd"].items():
+        print(f"'{pattern}' en el log de gunicorn: {count}")
+    print(f"Lecturas obsoletas: {report['lecturas_obsoletas']}")
+    if args.keep_workdir:
+        print(f"Directorio de trabajo: {report['directorio']}")
+
+    failed = report["errores_http"] or report["errores_conexion"] or report["lecturas_obsoletas"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
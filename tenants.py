@@ -0,0 +1,78 @@
+"""
+Configuración de inquilinos (empresas inmobiliarias) servidos desde un mismo despliegue.
+
+Cada inquilino se define en tenants.json con su esquema de Redshift, su directorio de datos
+(CSV extraídos y database.db propios), los códigos de proyecto válidos, las fechas de inicio de
+venta, los hosts por los que se le reconoce y el presupuesto de memoria de su caché.
+Las rutas relativas de "directorio" se resuelven aquí, una sola vez, desde el directorio de
+tenants.json (la raíz del repositorio): la app, data_extraction.py e init_db.py usan la misma
+ruta absoluta sin importar desde dónde se ejecuten.
+"""
+import json
+import os
+from collections import namedtuple
+from pathlib import Path
+
+TENANTS_FILE = Path(__file__).resolve().parent / os.getenv('TENANTS_FILE', 'tenants.json')
+DEFAULT_CACHE_MB = 256
+
+# solo_lectura: la base del inquilino se abre inmutable (paquetes montados, ver bundles.py)
+Tenant = namedtuple('Tenant', [
+    'id', 'nombre', 'schema', 'directorio', 'proyectos_validos', 'fechas_inicio', 'hosts', 'cache_bytes',
+    'solo_lectura'
+], defaults=(False,))
+
+
+def parse_tenants(raw, base_dir=TENANTS_FILE.parent):
+    """
+    Valida la configuración leída de tenants.json y retorna ({id: Tenant}, id por defecto).
+    Los directorios relativos se resuelven desde `base_dir`.
+    """
+    tenants = {}
+    for tenant_id, config in raw.get('tenants', {}).items():
+        if not config.get('schema'):
+            raise ValueError(f"El inquilino '{tenant_id}' no tiene 'schema'.")
+        directorio = os.path.normpath(os.path.join(base_dir, config.get('directorio', os.path.join('data', tenant_id))))
+        tenants[tenant_id] = Tenant(
+            id=tenant_id,
+            nombre=config.get('nombre', tenant_id),
+            schema=config['schema'],
+            directorio=directorio,
+            proyectos_validos=tuple(config.get('proyectos_validos', ())),
+            fechas_inicio=dict(config.get('fechas_inicio', {})),
+            hosts=tuple(h.lower() for h in config.get('hosts', ())),
+            cache_bytes=int(float(config.get('cache_mb', DEFAULT_CACHE_MB)) * 1024 * 1024),
+            solo_lectura=bool(config.get('solo_lectura', False)),
+        )
+    if not tenants:
+        raise ValueError("tenants.json no define ningún inquilino.")
+    default_id = raw.get('default') or next(iter(tenants))
+    if default_id not in tenants:
+        raise ValueError(f"El inquilino por defecto '{default_id}' no está definido.")
+    return tenants, default_id
+
+
+def load_tenants(path=TENANTS_FILE):
+    """Lee tenants.json y retorna ({id: Tenant}, id por defecto)."""
+    with open(path, encoding='utf-8') as f:
+        return parse_tenants(json.load(f), Path(path).resolve().parent)
+
+
+def get_tenant(tenant_id=None, path=TENANTS_FILE):
+    """Inquilino con el id dado (o el por defecto); KeyError si no existe. Para los scripts de carga."""
+    tenants, default_id = load_tenants(path)
+    return tenants[tenant_id or default_id]
+
+
+def tenant_for_host(tenants, default_id, host):
+    """Inquilino que atiende un host (sin puerto); el por defecto si ninguno lo declara."""
+    hostname = (host or '').split(':')[0].lower()
+    for tenant in tenants.values():
+        if hostname in tenant.hosts:
+            return tenant
+    return tenants[default_id]
+
+
+def tenant_path(tenant, filename):
+    """Ruta de un archivo de datos dentro del directorio del inquilino."""
+    return os.path.join(tenant.directorio, filename)
@@ -0,0 +1,70 @@
+"""Paridad entre los backends analíticos Python y DuckDB del dashboard (ver analytics_parity.py)."""
+import shutil
+from pathlib import Path
+
+import pytest
+
+duckdb = pytest.importorskip('duckdb')
+
+import analytics
+import analytics_parity
+import init_db
+from tenants import get_tenant
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+PROYECTOS = ('STILL', 'COSMOS', 'NUNA', 'PACIFIC SOUL', 'Angamos Oeste')
+MERCADO_CSV = """Precio por m2 - Venta Solarizado,Estado de Inmueble,Sector,Fecha de Venta,Fecha de Inicio de Venta,Cantidad de Dormitorios
+"S/ 10,648",Vendido,Lima Top,2024-01-03,2021-12-22,4
+"S/ 9,831",Vendido,Lima Top,2025-07-20,2024-10-25,4
+"S/ 8,412",Vendido,Lima Top,2024-05-31,2024-05-01,2
+"S/ 8,905",Vendido, Lima Top ,2025-02-28,2024-11-30,2
+"S/ 7,333",vendido,Lima Top,2024-09-15,2024-09-20,1
+"S/ 9,120",Vendido,Lima Top,2024-03-10,2023-01-10,3
+"S/ 7,965",Vendido,Lima Moderna,2024-03-05,2023-05-19,2
+"S/ 7,208",Disponible,Lima Top,2024-02-01,2023-12-11,1
+"S/ 11,500",Vendido,Lima Top,2023-06-01,2022-01-01,3
+"sin dato",Vendido,Lima Top,2024-04-04,2023-04-04,2
+"""
+
+
+@pytest.fixture
+def webapp(tmp_path, monkeypatch):
+    """App sobre una base construida con init_db.py a partir de unidades.csv del repositorio."""
+    shutil.copy(REPO_DIR / 'unidades.csv', tmp_path / 'unidades.csv')
+    (tmp_path / 'Tb_utf8.csv').write_text(MERCADO_CSV, encoding='utf-8')
+    # El inquilino por defecto, con su directorio de datos en tmp_path
+    tenant = get_tenant()._replace(directorio=str(tmp_path))
+    monkeypatch.setattr(init_db, 'get_tenant', lambda tenant_id=None: tenant)
+    init_db.main()
+
+    import app as webapp
+
+    monkeypatch.setattr(webapp, 'get_tenants', lambda: ({tenant.id: tenant}, tenant.id))
+    monkeypatch.setattr(webapp, 'ANALYTICS_BACKEND', 'python')
+    monkeypatch.setattr(webapp, '_duckdb_error', None)
+    with webapp.app.test_request_context():
+        webapp.set_current_tenant(None)
+        try:
+            analytics.connect(webapp.get_db_path()).close()
+        except duckdb.Error as e:
+            # La extensión sqlite de DuckDB se descarga la primera vez que se usa
+            pytest.skip(f"DuckDB no puede adjuntar la base SQLite: {e}")
+        yield webapp
+
+
+def test_competencia_metrics_parity(webapp):
+    python_metrics = analytics_parity.competencia_metrics(webapp, 'python')
+    duckdb_metrics = analytics_parity.competencia_metrics(webapp, 'duckdb')
+    assert webapp._duckdb_error is None
+    assert python_metrics
+    assert analytics_parity.compare(python_metrics, duckdb_metrics) == []
+
+
+def test_dashboard_parity(webapp):
+    diffs = {}
+    for project in PROYECTOS:
+        python_context = analytics_parity.dashboard_context(webapp, project, 'python')
+        duckdb_context = analytics_parity.dashboard_context(webapp, project, 'duckdb')
+        diffs[project] = analytics_parity.compare(python_context, duckdb_context)
+    assert webapp._duckdb_error is None
+    assert diffs == {project: [] for project in PROYECTOS}
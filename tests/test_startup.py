@@ -0,0 +1,7 @@
+"""Presupuesto de arranque de los workers (ver benchmark_startup.py)."""
+from benchmark_startup import check_budget, measure_startup
+
+
+def test_worker_startup_within_budget():
+    measurement = measure_startup(runs=3)
+    assert check_budget(measurement) == []
@@ -0,0 +1,151 @@
+"""
+Filtros de la parrilla por varios atributos (tipología, estado, dormitorios, piso, área y precio)
+resueltos con índices de bitmaps.
+
+El índice se construye una vez por proyecto y versión de datos: para cada atributo y cada valor
+(o banda, en los atributos por rango) guarda un arreglo booleano con una posición por unidad.
+Una combinación de filtros es un OR de los bitmaps elegidos dentro de cada atributo y un AND
+entre atributos; las estadísticas del sidebar y de la leyenda se reducen sobre la máscara
+resultante, sin volver a recorrer las unidades en Python.
+"""
+import numpy as np
+
+# Atributos filtrables, en el orden en que se muestran; 'tipologia' usa su propio desplegable
+UNIT_FILTER_ATTRIBUTES = ('tipologia', 'estado', 'dormitorios', 'piso', 'area', 'precio')
+UNIT_FILTER_TITLES = {
+    'estado': 'Estado', 'dormitorios': 'Dormitorios', 'piso': 'Piso', 'area': 'Área techada', 'precio': 'Precio',
+}
+# Límites inferiores de cada banda de los atributos por rango (la última banda queda abierta);
+# el piso 0 (sótanos y semisótanos) tiene su propia banda
+UNIT_FILTER_BANDS = {
+    'piso': (0, 1, 6, 11, 16, 21),
+    'area': (0, 50, 70, 90, 120),
+    'precio': (0, 100_000, 150_000, 200_000, 300_000),
+}
+# Estado de la parrilla (display_status) y su color en la leyenda
+ESTADOS = {
+    'disponible': ('Disponible', 'green'),
+    'alerta-subir': ('Actualizar', 'red'),
+    'separado': ('Separado', 'yellow'),
+    'vendido': ('Vendido', 'gray'),
+}
+
+
+def band_keys(values, limites):
+    """Banda de cada valor como el texto de su límite inferior; los valores menores caen en la primera."""
+    posiciones = np.searchsorted(np.asarray(limites, dtype=float), np.asarray(values, dtype=float), side='right') - 1
+    return [str(limites[p]) for p in np.clip(posiciones, 0, len(limites) - 1)]
+
+
+def band_label(attribute, key):
+    limites = UNIT_FILTER_BANDS[attribute]
+    i = limites.index(int(key))
+    fmt = (lambda v: f"{v / 1000:.0f}k") if attribute == 'precio' else str
+    unidad = ' m²' if attribute == 'area' else ''
+    if i == len(limites) - 1:
+        return f"{fmt(limites[i])}+{unidad}"
+    if attribute == 'piso':
+        hasta = limites[i + 1] - 1
+        return str(limites[i]) if hasta == limites[i] else f"{limites[i]}–{hasta}"
+    if i == 0 and limites[0] == 0:
+        return f"< {fmt(limites[1])}{unidad}"
+    return f"{fmt(limites[i])}–{fmt(limites[i + 1])}{unidad}"
+
+
+class UnitFilterIndex:
+    """
+    Bitmaps por atributo y valor sobre las unidades de un proyecto, más las columnas numéricas
+    que suman las estadísticas (precio, área y proformas).
+
+    `atributos` es {atributo: [valor por unidad]} con los valores ya llevados a texto (bandas
+    incluidas); `codigos` fija el orden de las unidades.
+    """
+
+    def __init__(self, codigos, atributos, precio, area, proformas):
+        self.posicion = {codigo: i for i, codigo in enumerate(codigos)}
+        self.size = len(codigos)
+        self.precio = np.asarray(precio, dtype=float)
+        self.area = np.asarray(area, dtype=float)
+        self.proformas = np.asarray(proformas, dtype=np.int64)
+        self.bitmaps = {}
+        for attribute, values in atributos.items():
+            values = np.asarray(values, dtype=object)
+            orden = sorted(set(values.tolist()), key=lambda v: _sort_key(attribute, v))
+            self.bitmaps[attribute] = {value: values == value for value in orden}
+
+    def _attribute_mask(self, attribute, valores):
+        mask = np.zeros(self.size, dtype=bool)
+        for valor in valores:
+            bitmap = self.bitmaps.get(attribute, {}).get(valor)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def mask(self, seleccion, excepto=None):
+        """Máscara de las unidades que cumplen todos los filtros ((atributo, valores), ...)."""
+        mask = np.ones(self.size, dtype=bool)
+        for attribute, valores in seleccion:
+            if valores and attribute != excepto:
+                mask &= self._attribute_mask(attribute, valores)
+        return mask
+
+    def facets(self, seleccion):
+        """
+        Opciones de cada atributo con la cantidad de unidades que quedarían al marcarla, dados
+        los filtros de los demás atributos: {atributo: [(valor, etiqueta, unidades), ...]}.
+        """
+        facetas = {}
+        for attribute, bitmaps in self.bitmaps.items():
+            base = self.mask(seleccion, excepto=attribute)
+            facetas[attribute] = [
+                (valor, option_label(attribute, valor), int(np.count_nonzero(base & bitmap)))
+                for valor, bitmap in bitmaps.items()
+            ]
+        return facetas
+
+    def stats(self, mask):
+        """(sidebar_stats, legend_data, legend_stats) de las unidades de la máscara."""
+        legend_data, legend_stats = {}, {}
+        for estado, (_, color) in ESTADOS.items():
+            bitmap = self.bitmaps.get('estado', {}).get(estado)
+            en_color = mask & bitmap if bitmap is not None else np.zeros(self.size, dtype=bool)
+            legend_data[color] = int(np.count_nonzero(en_color))
+            legend_stats[color] = {
+                'unidades': legend_data[color],
+                'precio': _suma(self.precio, en_color),
+                'area': _suma(self.area, en_color),
+                'proformas': int(self.proformas[en_color].sum()),
+            }
+        sidebar_stats = {
+            'total_unidades': int(np.count_nonzero(mask)),
+            'suma_precio': _suma(self.precio, mask),
+            'suma_area_total': _suma(self.area, mask),
+            'suma_proformas': int(self.proformas[mask].sum()),
+        }
+        return sidebar_stats, legend_data, legend_stats
+
+
+def _suma(columna, mask):
+    # Sin unidades la suma es el entero 0, igual que sum() sobre una lista vacía
+    return float(columna[mask].sum()) if mask.any() else 0
+
+
+def option_label(attribute, valor):
+    if attribute in UNIT_FILTER_BANDS and valor:
+        return band_label(attribute, valor)
+    if attribute == 'estado':
+        return ESTADOS.get(valor, (valor,))[0]
+    if attribute == 'dormitorios':
+        return f"{valor} dorm." if valor else 'Sin dato'
+    return valor or 'Sin dato'
+
+
+def _sort_key(attribute, valor):
+    # Estados en el orden de la leyenda; valores numéricos (bandas, dormitorios) en orden numérico
+    # y los textos después, en orden alfabético
+    if attribute == 'estado' and valor in ESTADOS:
+        return (0, float(list(ESTADOS).index(valor)), '')
+    try:
+        return (0, float(valor), '')
+    except (TypeError, ValueError):
+        return (1, 0.0, valor or '')